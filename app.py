@@ -1,25 +1,247 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, send_file, redirect, url_for, g, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from functools import wraps
+import hmac
+import itertools
 import json
 import os
+import sys
+import threading
 from dotenv import load_dotenv
 from services.yelp_service import YelpCoffeeShopService
 from services.nlp_summary_service import NLPSummaryService
+from services.profiler_service import SamplingProfilerService
+from services.memory_service import MemoryService
+from services.query_log_service import QueryLogService, annotate, stage
+from services.sharded_store import create_shop_store
+from services.spatial_index_service import SpatialIndexService
+from services.tile_cache_service import TileCacheService
+from services.cache_warmer_service import CacheWarmerService
+from services.refresh_service import ShopRefreshService
+from services.review_service import ReviewService
+from services.tag_index_service import TagIndexService
+from services.hours_index_service import HoursIndexService
+from services.batch_search_service import BatchSearchService
+from services.opening_hours import OPEN_NOW, parse_open_at
+from services.shop import Shop
+from services.geo_utils import decode_polyline
+from services.resilience import start_request, end_request, degraded_upstreams
 
 # Load environment variables
 load_dotenv()
 
+class AppJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes Shop records at the response edge"""
+    @staticmethod
+    def default(o):
+        if isinstance(o, Shop):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
 app = Flask(__name__)
+app.json = AppJSONProvider(app)
+
+# Services are built on first use (behind the get_* accessors) so importing the app stays cheap
+_services = {}
+_services_lock = threading.RLock()
+
+def lazy_service(factory):
+    """Turn a factory into an accessor that builds the service once and then reuses it"""
+    @wraps(factory)
+    def accessor():
+        service = _services.get(factory.__name__)
+        if service is None:
+            with _services_lock:
+                service = _services.get(factory.__name__)
+                if service is None:
+                    service = _services[factory.__name__] = factory()
+        return service
+    return accessor
+
+@lazy_service
+def get_nlp_service():
+    return NLPSummaryService()
+
+@lazy_service
+def get_yelp_service():
+    # Stored shops answer searches once the Yelp quota is spent
+    return YelpCoffeeShopService(nlp_service=get_nlp_service(), local_store=get_db_service())
+
+@lazy_service
+def get_cache_warmer():
+    return CacheWarmerService(get_yelp_service())
+
+@lazy_service
+def get_db_service():
+    # One SQLite file, or one per geohash region when SHARD_DIR is set
+    return create_shop_store(tagger=get_nlp_service().derive_tags)
+
+@lazy_service
+def get_spatial_index():
+    return SpatialIndexService(get_db_service())
+
+@lazy_service
+def get_tile_cache():
+    return TileCacheService(get_spatial_index())
+
+@lazy_service
+def get_review_service():
+    return ReviewService(get_db_service(), get_nlp_service())
+
+@lazy_service
+def get_tag_index():
+    return TagIndexService(get_db_service(), get_nlp_service())
+
+@lazy_service
+def get_hours_index():
+    return HoursIndexService(get_db_service())
+
+@lazy_service
+def get_batch_search():
+    return BatchSearchService(get_yelp_service())
+
+def invalidate_changed_shops(changed_shops):
+    """Drop summaries of changed shops and rebuild the spatial index and hot tiles"""
+    changed_ids = {shop['yelp_id'] for shop in changed_shops} | {shop['id'] for shop in changed_shops}
+    get_nlp_service().summary_cache.delete_where(lambda key: key[0] in changed_ids)
+    get_spatial_index().rebuild()
+    get_tile_cache().build_in_background()
+
+@lazy_service
+def get_refresh_service():
+    """Delta refresh of stored shops; changed shops invalidate the derived caches"""
+    refresh_service = ShopRefreshService(get_yelp_service(), get_db_service())
+    refresh_service.add_invalidation_listener(invalidate_changed_shops)
+    refresh_service.add_invalidation_listener(get_tag_index().reload)
+    refresh_service.add_invalidation_listener(get_hours_index().reload)
+    return refresh_service
+
+@lazy_service
+def get_profiler_service():
+    """Opt-in sampling profiler for production CPU investigations"""
+    return SamplingProfilerService()
+
+@lazy_service
+def get_memory_service():
+    return MemoryService()
+
+@lazy_service
+def get_query_log():
+    """Opt-in search query log (QUERY_LOG_ENABLED=1) for capacity planning and replay_queries.py"""
+    return QueryLogService()
+
+def query_logged(view):
+    """Record a search view's normalized parameters, cache lookups and stage timings in the query log"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = get_query_log().begin(request.path, request.args)
+        if token is None:
+            return view(*args, **kwargs)
+        status = 500
+        try:
+            response = app.make_response(view(*args, **kwargs))
+            status = response.status_code
+            if response.is_streamed:
+                # Stages of a streamed response run while its body is sent; the record ends with it
+                response.response = get_query_log().stream(token, status, response.response)
+                token = None
+            return response
+        finally:
+            get_query_log().finish(token, status)
+    return wrapper
+
+def service_caches():
+    """The geocode, Yelp, summary and statistics caches of the services built so far"""
+    caches = []
+    if 'get_yelp_service' in _services:
+        caches.extend((_services['get_yelp_service'].geocode_cache, _services['get_yelp_service'].search_cache))
+    if 'get_nlp_service' in _services:
+        caches.append(_services['get_nlp_service'].summary_cache)
+    if 'get_db_service' in _services:
+        caches.append(_services['get_db_service'].statistics_cache)
+    return caches
+
+def preload_services():
+    """Build every service now (before forking workers, or to warm a recycled process)"""
+    for accessor in (get_yelp_service, get_cache_warmer, get_spatial_index, get_tile_cache,
+                     get_review_service, get_tag_index, get_hours_index, get_batch_search,
+                     get_refresh_service, get_profiler_service):
+        accessor()
+
+def admin_required(view):
+    """Restrict a view to requests carrying the ADMIN_TOKEN in X-Admin-Token (disabled when unset)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        admin_token = os.getenv('ADMIN_TOKEN')
+        supplied = request.headers.get('X-Admin-Token')
+        if not admin_token or not supplied or not hmac.compare_digest(supplied, admin_token):
+            return jsonify({'error': 'Admin access required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', 5))
+
+@app.before_request
+def start_request_deadline():
+    """Give upstream calls made by this request a shared deadline"""
+    g.resilience_tokens = start_request(REQUEST_DEADLINE_SECONDS)
+
+@app.teardown_request
+def end_request_deadline(exc=None):
+    tokens = g.pop('resilience_tokens', None)
+    if tokens is not None:
+        end_request(tokens)
+
+def parse_tags_arg():
+    """Read required tags from ?tags=a,b (or repeated ?tags=) as a normalized list"""
+    tags = []
+    for value in request.args.getlist('tags'):
+        tags.extend(tag.strip().lower() for tag in value.split(',') if tag.strip())
+    return tags
+
+def parse_open_filter(values):
+    """Minute of the week from open_at='sun 06:00' (shop local time), OPEN_NOW for open_now=1,
+    or None when not filtering
+
+    Raises ValueError for an unrecognized open_at.
+    """
+    open_at = values.get('open_at')
+    if open_at:
+        return parse_open_at(str(open_at))
+    if str(values.get('open_now', '')).lower() in ('1', 'true', 'yes'):
+        return OPEN_NOW
+    return None
 
-# Initialize services
-yelp_service = YelpCoffeeShopService()
-nlp_service = NLPSummaryService()
+def apply_open_filter(shops, open_minute):
+    """Drop shops closed at open_minute, flagging the rest open (or null when their hours are unknown);
+    returns (shops, count of shops with unknown hours)"""
+    if open_minute is None:
+        return shops, None
+    return get_hours_index().filter_shops(shops, open_minute)
 
 @app.route('/')
 def index():
     """Main page with the coffee shop map"""
     return render_template('index.html')
 
+def filter_search_results(shops, min_rating, open_minute, required_tags):
+    """Apply the rating, open-at and tag filters; returns (shops, hours_unknown, tag_facets)"""
+    if min_rating > 0:
+        shops = [shop for shop in shops if shop.get('rating', 0) >= min_rating]
+    
+    # Open-at filter from the weekly hours index; shops with unknown hours stay, flagged open=None
+    shops, hours_unknown = apply_open_filter(shops, open_minute)
+    
+    # Intersect tag bitmaps; facets count the tags of the shops that remain
+    shops, tag_facets = get_tag_index().filter_shops(shops, required_tags)
+    return shops, hours_unknown, tag_facets
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
+
 @app.route('/api/coffee-shops')
+@query_logged
 def get_coffee_shops():
     """API endpoint to get coffee shops data dynamically"""
     location_query = request.args.get('zip_code', '')  # Now handles both zip codes and location names
@@ -27,29 +249,41 @@ def get_coffee_shops():
     lng = request.args.get('lng', type=float)
     radius_miles = request.args.get('radius', 5, type=int)
     min_rating = request.args.get('min_rating', 0.0, type=float)
+    required_tags = parse_tags_arg()
+    try:
+        open_minute = parse_open_filter(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    get_cache_warmer().record_query(location_query=location_query, lat=lat, lng=lng, radius_miles=radius_miles)
     
     # Get shops based on location
-    if lat and lng:
-        # Search by coordinates
-        shops = yelp_service.get_coffee_shops_by_location(lat, lng, radius_miles)
-        search_lat, search_lng = lat, lng
-    elif location_query:
-        # Try to interpret as zip code or location name
-        shops = yelp_service.get_coffee_shops_by_location_query(location_query, radius_miles)
-        # Get coordinates for the searched location
-        coords = yelp_service._location_to_coordinates(location_query)
-        search_lat, search_lng = coords if coords else (None, None)
-    else:
-        # Default to Honolulu area if no location specified
-        search_lat, search_lng = 21.3069, -157.8583
-        shops = yelp_service.get_coffee_shops_by_location(search_lat, search_lng, radius_miles)
+    with stage('search'):
+        if lat and lng:
+            # Search by coordinates
+            shops = get_yelp_service().get_coffee_shops_by_location(lat, lng, radius_miles)
+            search_lat, search_lng = lat, lng
+        elif location_query:
+            # Try to interpret as zip code or location name
+            shops = get_yelp_service().get_coffee_shops_by_location_query(location_query, radius_miles)
+            # Get coordinates for the searched location
+            coords = get_yelp_service()._location_to_coordinates(location_query)
+            search_lat, search_lng = coords if coords else (None, None)
+        else:
+            # Default to Honolulu area if no location specified
+            search_lat, search_lng = 21.3069, -157.8583
+            get_cache_warmer().record_query(lat=search_lat, lng=search_lng, radius_miles=radius_miles)
+            shops = get_yelp_service().get_coffee_shops_by_location(search_lat, search_lng, radius_miles)
     
-    # Apply rating filter
-    if min_rating > 0:
-        shops = [shop for shop in shops if shop.get('rating', 0) >= min_rating]
+    with stage('filter'):
+        shops, hours_unknown, tag_facets = filter_search_results(shops, min_rating, open_minute, required_tags)
+    
+    get_refresh_service().record_views(shop.get('id') for shop in shops)
     
     # Generate top shops with NLP summaries
-    top_shops_data = nlp_service.generate_top_shops_summary(shops, top_count=3)
+    with stage('summaries'):
+        top_shops_data = get_nlp_service().generate_top_shops_summary(shops, top_count=3)
+    annotate(center=[search_lat, search_lng], results=len(shops), degraded=degraded_upstreams())
     
     return jsonify({
         'location_query': location_query,
@@ -57,12 +291,118 @@ def get_coffee_shops():
         'lng': search_lng,
         'radius_miles': radius_miles,
         'min_rating': min_rating,
+        'tags': required_tags,
+        'tag_facets': tag_facets,
+        'hours_unknown': hours_unknown,
+        'degraded': degraded_upstreams(),  # Upstreams answered from local or cached data
         'coffee_shops': shops,  # All shops for map markers
         'top_shops': top_shops_data['top_shops'],  # Top 3 with summaries
         'all_shops_count': top_shops_data['all_shops_count'],
         'total_count': len(shops)
     })
 
+@app.route('/api/coffee-shops/stream')
+@query_logged
+def stream_coffee_shops():
+    """Server-Sent Events variant of /api/coffee-shops that sends results as each stage finishes
+
+    Events, in order: center (resolved coordinates), local (stored shops from the spatial index),
+    shops (the filtered upstream results, which replace the local ones), summary (one per top shop
+    as its summary is generated) and done (facets, counts and degraded upstreams).
+    """
+    location_query = request.args.get('zip_code', '')
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    radius_miles = request.args.get('radius', 5, type=int)
+    min_rating = request.args.get('min_rating', 0.0, type=float)
+    required_tags = parse_tags_arg()
+    try:
+        open_minute = parse_open_filter(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    get_cache_warmer().record_query(location_query=location_query, lat=lat, lng=lng, radius_miles=radius_miles)
+    
+    def events():
+        with stage('search'):
+            if lat and lng:
+                search_lat, search_lng = lat, lng
+            elif location_query:
+                coords = get_yelp_service()._location_to_coordinates(location_query)
+                search_lat, search_lng = coords if coords else (None, None)
+            else:
+                # Default to Honolulu area if no location specified
+                search_lat, search_lng = 21.3069, -157.8583
+        yield sse_event('center', {'location_query': location_query, 'lat': search_lat, 'lng': search_lng,
+                                   'radius_miles': radius_miles})
+        if search_lat is None:
+            annotate(center=[None, None], results=0, degraded=degraded_upstreams())
+            yield sse_event('done', {'error': 'Could not geocode location', 'degraded': degraded_upstreams(),
+                                     'total_count': 0})
+            return
+        
+        # Stored shops straight from the in-memory index, ranked like a search, for the first markers
+        with stage('local'):
+            local_shops = get_yelp_service().rank_stored_shops(
+                get_spatial_index().query_radius(search_lat, search_lng, radius_miles), search_lat, search_lng)
+            local_shops, _, _ = filter_search_results(local_shops, min_rating, open_minute, required_tags)
+        yield sse_event('local', {'coffee_shops': local_shops})
+        
+        with stage('search'):
+            shops = get_yelp_service().get_coffee_shops_by_location(search_lat, search_lng, radius_miles)
+        with stage('filter'):
+            shops, hours_unknown, tag_facets = filter_search_results(shops, min_rating, open_minute, required_tags)
+        get_refresh_service().record_views(shop.get('id') for shop in shops)
+        yield sse_event('shops', {'coffee_shops': shops})
+        
+        # Only generating a summary is timed, not sending it
+        summaries = get_nlp_service().iter_top_shop_summaries(shops, top_count=3)
+        for rank in itertools.count(1):
+            with stage('summaries'):
+                shop = next(summaries, None)
+            if shop is None:
+                break
+            yield sse_event('summary', {'rank': rank, 'shop': shop})
+        annotate(center=[search_lat, search_lng], results=len(shops), degraded=degraded_upstreams())
+        
+        yield sse_event('done', {
+            'min_rating': min_rating,
+            'tags': required_tags,
+            'tag_facets': tag_facets,
+            'hours_unknown': hours_unknown,
+            'degraded': degraded_upstreams(),
+            'all_shops_count': len(shops),
+            'total_count': len(shops)
+        })
+    
+    # Proxies must pass each event through as soon as it is written
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/coffee-shops/batch', methods=['POST'])
+def get_coffee_shops_batch():
+    """API endpoint to search many locations at once; overlapping areas share one Yelp search
+
+    Streams one NDJSON line per query as its search completes when the payload sets "stream"
+    or the client accepts application/x-ndjson; otherwise returns every result in query order.
+    """
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object with queries'}), 400
+    try:
+        queries = get_batch_search().parse_queries(payload.get('queries'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid batch: {e}'}), 400
+    
+    for query in queries:
+        get_cache_warmer().record_query(location_query=query['location'], lat=query.get('lat'),
+                                        lng=query.get('lng'), radius_miles=int(query['radius_miles']))
+    
+    if payload.get('stream') or 'application/x-ndjson' in request.headers.get('Accept', ''):
+        lines = (app.json.dumps(result) + '\n' for result in get_batch_search().iter_results(queries))
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+    return jsonify(get_batch_search().search(queries))
+
 @app.route('/api/coffee-shop/<shop_id>')
 def get_coffee_shop_detail(shop_id):
     """API endpoint to get detailed information about a specific coffee shop"""
@@ -77,56 +417,344 @@ def get_coffee_shop_detail(shop_id):
         ]
     })
 
+@app.route('/api/coffee-shop/<int:shop_id>/reviews', methods=['GET'])
+def get_shop_reviews(shop_id):
+    """API endpoint for a stored shop's recent reviews and precomputed theme summary"""
+    limit = request.args.get('limit', 10, type=int)
+    return jsonify({
+        'id': shop_id,
+        'review_summary': get_review_service().get_theme_summary(shop_id),
+        'themes': get_review_service().get_theme_counts(shop_id),
+        'reviews': get_review_service().get_recent_reviews(shop_id, limit)
+    })
+
+@app.route('/api/coffee-shop/<int:shop_id>/reviews', methods=['POST'])
+@admin_required
+def ingest_shop_reviews(shop_id):
+    """Admin endpoint to ingest reviews for a stored shop (JSON list, or pull from Yelp)"""
+    if get_db_service().get_shop_by_id(shop_id) is None:
+        return jsonify({'error': 'Coffee shop not found'}), 404
+    
+    if request.args.get('source') == 'yelp':
+        ingested = get_review_service().fetch_and_ingest_yelp_reviews(shop_id, get_yelp_service())
+    else:
+        reviews = request.get_json(silent=True)
+        if not isinstance(reviews, list):
+            return jsonify({'error': 'Expected a JSON list of reviews'}), 400
+        ingested = get_review_service().ingest_reviews(shop_id, reviews)
+    
+    return jsonify({'id': shop_id, 'ingested': ingested,
+                    'review_summary': get_review_service().get_theme_summary(shop_id)})
+
 @app.route('/api/search')
+@query_logged
 def search_coffee_shops():
     """API endpoint to search coffee shops by location"""
     query = request.args.get('q', '')
     if not query:
         return jsonify({'coffee_shops': [], 'total_count': 0})
+    try:
+        open_minute = parse_open_filter(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    get_cache_warmer().record_query(location_query=query)
     
     # Try to interpret query as zip code or location
     try:
-        # If it looks like a zip code, search by zip
-        if query.isdigit() and len(query) == 5:
-            shops = yelp_service.get_coffee_shops_by_zip(query)
-        else:
-            # Otherwise, try to geocode the query
-            from geopy.geocoders import Nominatim
-            geolocator = Nominatim(user_agent="coffee_shop_finder")
-            location = geolocator.geocode(f"{query}, USA")
-            
-            if location:
-                shops = yelp_service.get_coffee_shops_by_location(location.latitude, location.longitude)
+        with stage('search'):
+            # If it looks like a zip code, search by zip
+            if query.isdigit() and len(query) == 5:
+                shops = get_yelp_service().get_coffee_shops_by_zip(query)
             else:
-                shops = []
+                # Otherwise, try to geocode the query (cached, and hedged against a slow Nominatim)
+                coords = get_yelp_service()._location_to_coordinates(query)
+                
+                if coords:
+                    annotate(center=list(coords))
+                    shops = get_yelp_service().get_coffee_shops_by_location(*coords)
+                else:
+                    shops = []
     except Exception as e:
         print(f"Search error: {e}")
         shops = []
+    with stage('filter'):
+        shops, hours_unknown = apply_open_filter(shops, open_minute)
+    annotate(results=len(shops), degraded=degraded_upstreams())
     
     return jsonify({
         'query': query,
+        'hours_unknown': hours_unknown,
+        'degraded': degraded_upstreams(),
         'coffee_shops': shops,
         'total_count': len(shops)
     })
 
 @app.route('/api/nearby')
+@query_logged
 def get_nearby_shops():
     """API endpoint to get shops near a location"""
     lat = request.args.get('lat', type=float)
     lng = request.args.get('lng', type=float)
     radius = request.args.get('radius', 5, type=int)
+    required_tags = parse_tags_arg()
     
     if lat is None or lng is None:
         return jsonify({'error': 'Latitude and longitude required'}), 400
+    try:
+        open_minute = parse_open_filter(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    shops = yelp_service.get_coffee_shops_by_location(lat, lng, radius)
+    get_cache_warmer().record_query(lat=lat, lng=lng, radius_miles=radius)
+    with stage('search'):
+        shops = get_yelp_service().get_coffee_shops_by_location(lat, lng, radius)
+    with stage('filter'):
+        shops, hours_unknown = apply_open_filter(shops, open_minute)
+        shops, tag_facets = get_tag_index().filter_shops(shops, required_tags)
+    annotate(center=[lat, lng], results=len(shops), degraded=degraded_upstreams())
     return jsonify({
         'lat': lat,
         'lng': lng,
         'radius': radius,
+        'tags': required_tags,
+        'tag_facets': tag_facets,
+        'hours_unknown': hours_unknown,
+        'degraded': degraded_upstreams(),
         'coffee_shops': shops,
         'total_count': len(shops)
     })
 
+@app.route('/api/shops/bbox')
+def get_shops_in_bbox():
+    """API endpoint to get map features for a viewport from the local store"""
+    south = request.args.get('south', type=float)
+    west = request.args.get('west', type=float)
+    north = request.args.get('north', type=float)
+    east = request.args.get('east', type=float)
+    zoom = request.args.get('zoom', 10, type=int)
+    
+    if None in (south, west, north, east):
+        return jsonify({'error': 'south, west, north and east are required'}), 400
+    # Comparisons with NaN are false, so this also rejects non-finite values
+    if not (-90 <= south <= north <= 90 and -180 <= west <= east <= 180):
+        return jsonify({'error': 'Invalid bounding box'}), 400
+    
+    result = get_spatial_index().get_map_features(south, west, north, east, zoom)
+    return jsonify({
+        'bbox': [south, west, north, east],
+        'zoom': result['zoom'],  # Lower than requested when the viewport is too large for it
+        'clustered': result['clustered'],
+        'features': result['features'],
+        'total_count': len(result['features'])
+    })
+
+ROUTE_MAX_POINTS = 10000
+ROUTE_MAX_CORRIDOR_MILES = 10.0
+
+def parse_route_points(payload):
+    """Read route points from {'points': [[lat, lng], ...]} or {'polyline': '<encoded>'}"""
+    if payload.get('polyline'):
+        if not isinstance(payload['polyline'], str):
+            raise ValueError("polyline must be an encoded string")
+        points = decode_polyline(payload['polyline'])
+    else:
+        points = []
+        for point in payload.get('points') or []:
+            if isinstance(point, dict):
+                point = (point.get('lat'), point.get('lng'))
+            points.append((float(point[0]), float(point[1])))
+    for lat, lng in points:
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError(f"Invalid coordinate: {lat}, {lng}")
+    return points
+
+@app.route('/api/shops/route', methods=['POST'])
+def get_shops_along_route():
+    """API endpoint to get stored shops within a corridor along a route, in driving order"""
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object with points or polyline'}), 400
+    try:
+        points = parse_route_points(payload)
+        corridor_miles = float(payload.get('corridor_miles', 1.0))
+        min_rating = float(payload.get('min_rating', 0.0))
+        limit = int(payload['limit']) if payload.get('limit') is not None else None
+        open_minute = parse_open_filter(payload)
+    except (TypeError, ValueError, IndexError) as e:
+        return jsonify({'error': f'Invalid route: {e}'}), 400
+    
+    if not points:
+        return jsonify({'error': 'points or polyline is required'}), 400
+    if len(points) > ROUTE_MAX_POINTS:
+        return jsonify({'error': f'Routes are limited to {ROUTE_MAX_POINTS} points'}), 400
+    if not 0 < corridor_miles <= ROUTE_MAX_CORRIDOR_MILES:
+        return jsonify({'error': f'corridor_miles must be in (0, {ROUTE_MAX_CORRIDOR_MILES}]'}), 400
+    if limit is not None and limit < 0:
+        return jsonify({'error': 'limit must not be negative'}), 400
+    
+    result = get_spatial_index().query_route(points, corridor_miles)
+    shops = [shop for shop in result['shops'] if (shop.get('rating') or 0) >= min_rating]
+    shops, hours_unknown = apply_open_filter(shops, open_minute)
+    if limit is not None:
+        shops = shops[:limit]
+    return jsonify({
+        'corridor_miles': corridor_miles,
+        'route_miles': result['route_miles'],
+        'version': result['version_key'],
+        'hours_unknown': hours_unknown,
+        'coffee_shops': shops,
+        'total_count': len(shops)
+    })
+
+@app.route('/api/tiles')
+def get_tile_metadata():
+    """API endpoint describing the current versioned tile URL template"""
+    version_key = get_spatial_index().get_version_key()
+    return jsonify({
+        'version': version_key,
+        'url_template': f"/tiles/{version_key}/{{z}}/{{x}}/{{y}}.json",
+        'hot_zooms': get_tile_cache().hot_zooms,
+        'max_zoom': get_tile_cache().max_zoom
+    })
+
+@app.route('/tiles/<version_key>/<int:z>/<int:x>/<int:y>.json')
+def get_versioned_tile(version_key, z, x, y):
+    """Serve an immutable tile for a specific store version"""
+    if not get_tile_cache().is_valid_tile(z, x, y):
+        return jsonify({'error': 'Invalid tile coordinates'}), 404
+    
+    path = get_tile_cache().get_tile(z, x, y, version_key=version_key)
+    if path is None:
+        # The store changed since this URL was issued
+        return redirect(url_for('get_tile', z=z, x=x, y=y))
+    
+    response = send_file(path, mimetype='application/json', conditional=True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.json')
+def get_tile(z, x, y):
+    """Serve the current version of a tile (revalidated by ETag)"""
+    if not get_tile_cache().is_valid_tile(z, x, y):
+        return jsonify({'error': 'Invalid tile coordinates'}), 404
+    
+    response = send_file(get_tile_cache().get_tile(z, x, y), mimetype='application/json', conditional=True)
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
+
+@app.route('/admin/profile')
+@admin_required
+def get_profile():
+    """Admin endpoint returning collapsed stacks for a flamegraph over the last N seconds"""
+    seconds = request.args.get('seconds', 60, type=int)
+    
+    if request.args.get('format') == 'json' or not get_profiler_service().is_running:
+        stats = get_profiler_service().get_statistics()
+        if not get_profiler_service().is_running:
+            stats['error'] = 'Profiler is not running (set PROFILER_ENABLED=1)'
+            return jsonify(stats), 409
+        return jsonify(stats)
+    
+    return Response(get_profiler_service().collapsed_stacks(seconds), mimetype='text/plain')
+
+@app.route('/admin/quota')
+@admin_required
+def get_quota():
+    """Admin endpoint showing the shared Yelp budget and what each priority class may still use"""
+    return jsonify(get_yelp_service().quota.snapshot())
+
+@app.route('/admin/circuits')
+@admin_required
+def get_circuits():
+    """Admin endpoint showing the upstream circuit breakers"""
+    yelp = get_yelp_service()
+    return jsonify({'circuits': [yelp.yelp_breaker.get_statistics(), yelp.geocode_breaker.get_statistics()]})
+
+@app.route('/admin/filter-policy')
+@admin_required
+def get_filter_policy():
+    """Admin endpoint showing the active filter policy and its reload state"""
+    return jsonify(get_yelp_service().filter_policy.get_statistics())
+
+@app.route('/admin/filter-policy/dry-run', methods=['POST'])
+@admin_required
+def dry_run_filter_policy():
+    """Admin endpoint reporting what each rule removes over the cached Yelp searches
+
+    A JSON policy in the body (keys as in the policy file) is compared with the active one
+    without activating it.
+    """
+    candidate = None
+    if request.data:
+        candidate = request.get_json(silent=True)
+        if candidate is None:
+            return jsonify({'error': 'Body must be a JSON filter policy'}), 400
+    try:
+        return jsonify(get_yelp_service().dry_run_filter_policy(candidate))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/admin/query-log')
+@admin_required
+def get_query_log_status():
+    """Admin endpoint showing this worker's query log writer"""
+    return jsonify(get_query_log().get_statistics())
+
+@app.route('/admin/memory')
+@admin_required
+def get_memory():
+    """Admin endpoint showing entries and approximate bytes per cache plus this worker's RSS"""
+    return jsonify(get_memory_service().report(service_caches()))
+
+@app.route('/admin/memory/tracemalloc', methods=['GET', 'POST', 'DELETE'])
+@admin_required
+def memory_tracemalloc():
+    """Admin endpoint for allocation tracing in this worker
+
+    POST starts tracemalloc and takes a baseline snapshot (?frames=N keeps N frames per site),
+    GET returns the top allocation sites in services/ and app.py grown since the baseline
+    (?limit=25; ?group=traceback groups by call stack; ?rebase=1 makes this snapshot the new baseline)
+    and DELETE stops tracing.
+    """
+    memory_service = get_memory_service()
+    if request.method == 'POST':
+        return jsonify(memory_service.start_tracing(request.args.get('frames', 1, type=int)))
+    if request.method == 'DELETE':
+        return jsonify(memory_service.stop_tracing())
+    try:
+        return jsonify(memory_service.diff(request.args.get('limit', type=int),
+                                           'traceback' if request.args.get('group') == 'traceback' else 'lineno',
+                                           request.args.get('rebase', '') in ('1', 'true', 'yes')))
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+
+def env_enabled(name, default=''):
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+def start_background_services(singletons=True):
+    """Start the opt-in background threads; singletons (tile prebuild, warmer, refresh) run in one process only"""
+    if env_enabled('PROFILER_ENABLED'):
+        get_profiler_service().start()
+    if not singletons:
+        return
+    if env_enabled('TILE_PREBUILD', '1'):
+        # Build the database and index off the import path so cold starts don't wait for them;
+        # this process is then the only one that prebuilds and prunes tiles
+        threading.Thread(target=lambda: get_tile_cache().run_builder(), name='tile-prebuild',
+                         daemon=True).start()
+    if env_enabled('WARMER_ENABLED'):
+        get_cache_warmer().start()
+    if env_enabled('REFRESH_ENABLED'):
+        get_refresh_service().start()
+
+# serve.py loads the app before forking and starts these in its workers instead
+if not env_enabled('APP_PREFORK'):
+    start_background_services()
+
 if __name__ == '__main__':
+    # Seed the caches for the popular regions before serving (e.g. on deploy); with the
+    # debug reloader only the serving child process does this
+    if '--warm' in sys.argv and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        get_cache_warmer().warm_once()
     app.run(debug=True, host='0.0.0.0', port=8000) 
\ No newline at end of file
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Import-time report for Coffee Shop Finder
+Runs `python -X importtime` in fresh interpreters and reports cold import wall time and the
+slowest modules, so startup regressions (an eager heavy import, a service built at import) show up
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_once(module: str, first_request: bool):
+    """Import module in a fresh interpreter; returns (wall seconds, {module: (self_us, cumulative_us)})"""
+    code = f"import {module}"
+    if first_request:
+        code += f"\n{module}.app.test_client().get('/api/tiles')"
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, TILE_PREBUILD='0')
+
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=REPO_ROOT, env=env,
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return elapsed, modules
+
+def main():
+    parser = argparse.ArgumentParser(description="Report cold-start import time")
+    parser.add_argument('--module', default='app', help="Module to import")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters to time")
+    parser.add_argument('--top', type=int, default=15, help="Slowest modules to list")
+    parser.add_argument('--first-request', action='store_true',
+                        help="Also serve one request (builds the lazily created services)")
+    args = parser.parse_args()
+
+    timings = []
+    for _ in range(args.runs):
+        elapsed, modules = run_once(args.module, args.first_request)
+        timings.append(elapsed)
+
+    # Interpreter startup is included; compare runs of this script, not against -X importtime totals
+    print(f"{args.module}: median {statistics.median(timings) * 1000:.0f} ms, "
+          f"min {min(timings) * 1000:.0f} ms over {args.runs} cold starts")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    heavy = [name for name in ('pandas', 'geopy', 'requests', 'numpy') if name in modules]
+    if heavy:
+        print(f"\nEagerly imported heavy dependencies: {', '.join(heavy)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Ranking benchmark for Coffee Shop Finder
+Compares the old full sort-and-truncate with RankingService top-k selection (heapq and NumPy
+paths) on synthetic Yelp-shaped candidates
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.ranking_service import RankingService
+
+CENTER = (21.3069, -157.8583)
+
+def make_candidates(count: int, seed: int = 42):
+    """Yelp-shaped businesses scattered around Honolulu"""
+    rng = random.Random(seed)
+    return [{
+        'id': f"bench-{i}",
+        'rating': rng.choice([3.5, 4.0, 4.2, 4.5, 4.7, 5.0]),
+        'review_count': rng.randint(0, 3000),
+        'price': rng.choice(['$', '$$', '$$$', None]),
+        'coordinates': {'latitude': CENTER[0] + rng.uniform(-0.3, 0.3),
+                        'longitude': CENTER[1] + rng.uniform(-0.3, 0.3)}
+    } for i in range(count)]
+
+def best_of(runs: int, fn):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark candidate ranking")
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000', help="Candidate counts")
+    parser.add_argument('--k', type=int, default=20, help="Results to select")
+    parser.add_argument('--runs', type=int, default=3, help="Runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    ranking = RankingService()
+    print(f"{'candidates':>10} {'full sort':>10} {'score py':>10} {'score np':>10} "
+          f"{'heapq k':>9} {'argpart k':>10}  (ms, best of {args.runs})")
+
+    for size in (int(value) for value in args.sizes.split(',')):
+        candidates = make_candidates(size)
+
+        full_sort = best_of(args.runs, lambda: sorted(
+            candidates, key=lambda x: (x.get('rating', 0), x.get('review_count', 0)), reverse=True)[:args.k])
+
+        ranking.ranking_config['numpy_min_candidates'] = size + 1
+        score_py = best_of(args.runs, lambda: ranking.score(candidates, *CENTER))
+        py_scores = ranking.score(candidates, *CENTER)
+        heap_select = best_of(args.runs, lambda: ranking.top_k(candidates, args.k, scores=py_scores))
+
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            print(f"{size:>10} {full_sort:>10.1f} {score_py:>10.1f} {'n/a':>10} {heap_select:>9.2f} {'n/a':>10}")
+            continue
+
+        ranking.ranking_config['numpy_min_candidates'] = 0
+        score_np = best_of(args.runs, lambda: ranking.score(candidates, *CENTER))
+        np_scores = ranking.score(candidates, *CENTER)
+        argpartition_select = best_of(args.runs, lambda: ranking.top_k(candidates, args.k, scores=np_scores))
+
+        print(f"{size:>10} {full_sort:>10.1f} {score_py:>10.1f} {score_np:>10.1f} "
+              f"{heap_select:>9.2f} {argpartition_select:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Region crawler for Coffee Shop Finder
+Sweeps a region with overlapping Yelp searches and bulk-loads every coffee shop into SQLite
+"""
+
+import argparse
+from dotenv import load_dotenv
+from services.crawler_service import RegionCrawlerService, REGIONS
+from services.entity_resolution_service import EntityResolutionService
+from services.sharded_store import create_shop_store
+
+load_dotenv()
+
+def main():
+    """Crawl a region (or resume the last crawl) into the local database"""
+    parser = argparse.ArgumentParser(description="Crawl all coffee shops in a region into the local store")
+    parser.add_argument('--region', choices=sorted(REGIONS), help="Named region to crawl")
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'),
+                        help="Custom bounding box to crawl")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent search workers")
+    parser.add_argument('--rps', type=float, default=4.0, help="Maximum upstream requests per second")
+    parser.add_argument('--db', default="database/coffee_shops.db", help="SQLite database to load into")
+    parser.add_argument('--shard-dir', help="Directory of per-region shard databases (overrides --db; default $SHARD_DIR)")
+    parser.add_argument('--checkpoint', default="database/crawl_checkpoint.json", help="Checkpoint file")
+    parser.add_argument('--fresh', action='store_true', help="Ignore an existing checkpoint")
+    parser.add_argument('--stub', action='store_true', help="Crawl the offline Yelp stub instead of the real API")
+    args = parser.parse_args()
+
+    bbox = tuple(args.bbox) if args.bbox else REGIONS.get(args.region)
+
+    if args.stub:
+        from services.yelp_stub import StubYelpSearch
+        search_client = StubYelpSearch(bbox=bbox or REGIONS['hawaii'])
+    else:
+        from services.yelp_service import YelpCoffeeShopService
+        search_client = YelpCoffeeShopService()
+        if not search_client.api_key:
+            parser.error("YELP_API_KEY is not set (use --stub to crawl the offline stub)")
+
+    db_service = create_shop_store(args.db, shard_dir=args.shard_dir)
+    crawler = RegionCrawlerService(search_client, db_service, checkpoint_path=args.checkpoint,
+                                   max_workers=args.workers, requests_per_second=args.rps)
+    crawler.crawl(bbox, resume=not args.fresh)
+    # Link the newly loaded shops to known ones so duplicates across sources are tracked
+    print(f"Entity resolution: {EntityResolutionService(db_service).resolve()}")
+
+    stats = db_service.get_statistics()
+    print(f"Database now contains {stats['total_shops']} coffee shops")
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,15 @@ CREATE TABLE IF NOT EXISTS coffee_shops (
     phone TEXT,
     hours TEXT,
     website TEXT,
+    yelp_id TEXT,
+    review_count INTEGER DEFAULT 0,
+    price TEXT,
+    yelp_url TEXT,
+    image_url TEXT,
+    fetched_at TIMESTAMP,
+    content_hash TEXT,
+    view_count INTEGER DEFAULT 0,
+    open_intervals TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -26,6 +35,37 @@ CREATE INDEX IF NOT EXISTS idx_city ON coffee_shops(city);
 CREATE INDEX IF NOT EXISTS idx_state ON coffee_shops(state);
 CREATE INDEX IF NOT EXISTS idx_rating ON coffee_shops(rating);
 CREATE INDEX IF NOT EXISTS idx_location ON coffee_shops(lat, lng);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_yelp_id ON coffee_shops(yelp_id);
+CREATE INDEX IF NOT EXISTS idx_refresh_priority ON coffee_shops(view_count, fetched_at);
+
+-- Store-wide counters; content_version changes whenever any shop's content changes
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO store_meta (key, value) VALUES ('content_version', 0);
+
+-- Keep updated_at in step with content changes (bookkeeping columns don't count)
+CREATE TRIGGER IF NOT EXISTS trg_coffee_shops_updated_at
+AFTER UPDATE OF name, address, city, state, zip_code, lat, lng, signature_drink, rating,
+    description, phone, hours, website, review_count, price, yelp_url, image_url ON coffee_shops
+FOR EACH ROW
+BEGIN
+    UPDATE coffee_shops SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+    UPDATE store_meta SET value = value + 1 WHERE key = 'content_version';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_coffee_shops_insert_version
+AFTER INSERT ON coffee_shops
+BEGIN
+    UPDATE store_meta SET value = value + 1 WHERE key = 'content_version';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_coffee_shops_delete_version
+AFTER DELETE ON coffee_shops
+BEGIN
+    UPDATE store_meta SET value = value + 1 WHERE key = 'content_version';
+END;
 
 -- Reviews table for future expansion
 CREATE TABLE IF NOT EXISTS reviews (
@@ -34,10 +74,34 @@ CREATE TABLE IF NOT EXISTS reviews (
     user_name TEXT NOT NULL,
     rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
     comment TEXT,
+    yelp_review_id TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (coffee_shop_id) REFERENCES coffee_shops(id)
 );
 
+CREATE INDEX IF NOT EXISTS idx_reviews_shop_created ON reviews(coffee_shop_id, created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_reviews_yelp_id ON reviews(yelp_review_id);
+
+-- Number of reviews per shop mentioning each theme term, maintained on ingest
+CREATE TABLE IF NOT EXISTS review_term_counts (
+    coffee_shop_id INTEGER NOT NULL,
+    theme TEXT NOT NULL,
+    term TEXT NOT NULL,
+    review_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (coffee_shop_id, theme, term),
+    FOREIGN KEY (coffee_shop_id) REFERENCES coffee_shops(id)
+) WITHOUT ROWID;
+
+-- Per-shop theme aggregates: distinct terms seen and total mentions
+CREATE TABLE IF NOT EXISTS review_themes (
+    coffee_shop_id INTEGER NOT NULL,
+    theme TEXT NOT NULL,
+    terms_present INTEGER NOT NULL DEFAULT 0,
+    mentions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (coffee_shop_id, theme),
+    FOREIGN KEY (coffee_shop_id) REFERENCES coffee_shops(id)
+) WITHOUT ROWID;
+
 -- Photos table for future expansion
 CREATE TABLE IF NOT EXISTS photos (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
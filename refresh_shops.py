@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Delta refresh for Coffee Shop Finder
+Refetches stale Yelp-backed shops (most viewed first) and writes only rows whose content changed
+"""
+
+import argparse
+from dotenv import load_dotenv
+from services.crawler_service import REGIONS
+from services.sharded_store import create_shop_store
+from services.refresh_service import ShopRefreshService
+
+load_dotenv()
+
+def main():
+    """Run one refresh pass over the local database"""
+    parser = argparse.ArgumentParser(description="Refresh stale shops in the local store")
+    parser.add_argument('--limit', type=int, default=100, help="Maximum shops to check")
+    parser.add_argument('--max-age-hours', type=float, default=None, help="Refresh shops older than this")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent fetch workers")
+    parser.add_argument('--db', default="database/coffee_shops.db", help="SQLite database to refresh")
+    parser.add_argument('--shard-dir', help="Directory of per-region shard databases (overrides --db; default $SHARD_DIR)")
+    parser.add_argument('--stub', action='store_true', help="Refresh from the offline Yelp stub")
+    parser.add_argument('--stub-region', choices=sorted(REGIONS), default='hawaii',
+                        help="Region the stub data was crawled with")
+    args = parser.parse_args()
+
+    if args.stub:
+        from services.yelp_stub import StubYelpSearch
+        yelp_client = StubYelpSearch(bbox=REGIONS[args.stub_region])
+    else:
+        from services.yelp_service import YelpCoffeeShopService
+        yelp_client = YelpCoffeeShopService()
+        if not yelp_client.api_key:
+            parser.error("YELP_API_KEY is not set (use --stub to refresh from the offline stub)")
+
+    db_service = create_shop_store(args.db, shard_dir=args.shard_dir)
+    refresh_service = ShopRefreshService(yelp_client, db_service, max_workers=args.workers)
+    if args.max_age_hours is not None:
+        refresh_service.refresh_config['max_age_seconds'] = args.max_age_hours * 3600
+    refresh_service.refresh_stale(limit=args.limit)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Query log replay for Coffee Shop Finder
+Re-drives a captured query log against a local instance backed by the offline Yelp stub (or a running
+server) and reports throughput, cache hit ratios and latency percentiles
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from services.crawler_service import REGIONS
+from services.query_log_service import read_query_log
+
+load_dotenv()
+
+REPLAYED_ENDPOINTS = ('/api/coffee-shops', '/api/coffee-shops/stream', '/api/search', '/api/nearby')
+
+def parse_speed(value):
+    """Replay speed multiplier; 'max' (None) sends as fast as the workers allow"""
+    if value == 'max':
+        return None
+    try:
+        speed = float(value.rstrip('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("speed must be a multiplier such as 1, 10 or max") from None
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive")
+    return speed
+
+def percentiles(values):
+    """p50/p90/p95/p99/max of latencies in milliseconds (nearest rank)"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {f"p{p}": round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))], 1) for p in (50, 90, 95, 99)}
+    result['max'] = round(ordered[-1], 1)
+    return result
+
+def hit_ratios(counts):
+    """{layer: {'hits', 'misses', 'hit_ratio'}} from {layer: [hits, misses]}"""
+    return {layer: {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / (hits + misses), 3)}
+            for layer, (hits, misses) in sorted(counts.items()) if hits + misses}
+
+def captured_summary(records):
+    """Latency and cache hit ratios as recorded when the log was captured"""
+    cache = defaultdict(lambda: [0, 0])
+    for record in records:
+        for layer, counts in record.get('cache', {}).items():
+            cache[layer][0] += counts['hit']
+            cache[layer][1] += counts['miss']
+    span = records[-1]['ts'] - records[0]['ts'] if len(records) > 1 else 0.0
+    return {
+        'requests': len(records),
+        'span_seconds': round(span, 1),
+        'requests_per_second': round(len(records) / span, 1) if span else None,
+        'latency_ms': percentiles([record['ms'] for record in records if 'ms' in record]),
+        'cache': hit_ratios(cache)
+    }
+
+def logged_centers(records):
+    """Search centers recorded in the log"""
+    return [record['center'] for record in records if record.get('center') and None not in record['center']]
+
+def stub_bbox(records, padding_degrees=0.1):
+    """Bounding box around the logged search centers, so stub shops sit where the traffic searched"""
+    centers = logged_centers(records)
+    if not centers:
+        return REGIONS['hawaii']
+    lats, lngs = [lat for lat, _ in centers], [lng for _, lng in centers]
+    return (min(lats) - padding_degrees, min(lngs) - padding_degrees,
+            max(lats) + padding_degrees, max(lngs) + padding_degrees)
+
+def start_stub_instance(records, stub_region):
+    """Serve the app in this process with Yelp replaced by the offline stub; returns (base_url, cache_stats)
+
+    Geocoding answers with the centers recorded in the log, so no upstream is contacted. The instance
+    works on a copy of the shop store, so the replay never migrates or writes the real databases.
+    """
+    state_dir = tempfile.mkdtemp(prefix='replay-')
+    shop_db_path = os.path.join(state_dir, 'coffee_shops.db')
+    if os.getenv('SHARD_DIR'):
+        if os.path.isdir(os.environ['SHARD_DIR']):
+            shutil.copytree(os.environ['SHARD_DIR'], os.path.join(state_dir, 'shards'))
+        os.environ['SHARD_DIR'] = os.path.join(state_dir, 'shards')
+    elif os.path.exists(os.getenv('SHOP_DB_PATH', 'database/coffee_shops.db')):
+        shutil.copyfile(os.getenv('SHOP_DB_PATH', 'database/coffee_shops.db'), shop_db_path)
+    # Set before the app is imported: no background services, logging of the replay or shared state
+    os.environ.update({'APP_PREFORK': '1', 'QUERY_LOG_ENABLED': '0', 'CACHE_BACKEND': 'memory',
+                       'QUOTA_PATH': os.path.join(state_dir, 'quota.db'), 'SHOP_DB_PATH': shop_db_path,
+                       'ENTITY_LINKS_PATH': os.path.join(state_dir, 'shop_links.db'),
+                       'QUERY_COUNTS_PATH': os.path.join(state_dir, 'query_counts.db'),
+                       'TILE_CACHE_DIR': os.path.join(state_dir, 'tiles')})
+    os.environ.setdefault('YELP_API_KEY', 'stub')
+
+    import app as coffee_app
+    from werkzeug.serving import make_server
+    from services.yelp_stub import StubYelpSearch
+
+    yelp = coffee_app.get_yelp_service()
+    stub = StubYelpSearch(bbox=REGIONS[stub_region] if stub_region else stub_bbox(records))
+    yelp.fetch_search_page = stub.fetch_search_page
+    yelp.fetch_business = stub.fetch_business
+    yelp.fetch_reviews = stub.fetch_reviews
+
+    centers = {}
+    for record in records:
+        query = record['params'].get('zip_code') or record['params'].get('q')
+        if query and 'lat' not in record['params'] and record.get('center') and None not in record['center']:
+            centers[yelp.geocode_cache_key(query)] = tuple(record['center'])
+    # Queries logged without a center (ZIP searches on /api/search) are placed at their stored shops
+    yelp._geocode_location = lambda location_query: (centers.get(yelp.geocode_cache_key(location_query)) or
+                                                      yelp._local_coordinates(location_query))
+
+    coffee_app.preload_services()
+    # One access log line per replayed request would swamp the report
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, coffee_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='replay-server', daemon=True).start()
+
+    def cache_stats():
+        return {cache.name: cache.get_statistics() for cache in coffee_app.service_caches()}
+    return f"http://127.0.0.1:{server.server_port}", cache_stats
+
+def remote_cache_stats(base_url, admin_token):
+    """Cache counters of the worker that answers /admin/memory (None without an admin token)"""
+    if not admin_token:
+        return lambda: None
+
+    def cache_stats():
+        request = urllib.request.Request(f"{base_url}/admin/memory", headers={'X-Admin-Token': admin_token})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return {cache['name']: cache for cache in json.load(response)['caches']}
+        except (urllib.error.URLError, ValueError, KeyError) as e:
+            print(f"Cache statistics unavailable: {e}")
+            return None
+    return cache_stats
+
+def send(base_url, record, due_at):
+    """Replay one request; returns (endpoint, status, latency in ms, seconds it started behind schedule)"""
+    url = f"{base_url}{record['endpoint']}?{urllib.parse.urlencode(record['params'])}"
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, OSError):
+        status = 0
+    lag = max(0.0, started - due_at) if due_at is not None else 0.0
+    return record['endpoint'], status, (time.perf_counter() - started) * 1000, lag
+
+def replay(base_url, records, speed, concurrency):
+    """Send the records on their original schedule divided by speed (back to back when speed is None)"""
+    first_ts = records[0]['ts']
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='replay') as pool:
+        futures = []
+        for record in records:
+            due_at = None
+            if speed is not None:
+                due_at = started + (record['ts'] - first_ts) / speed
+                delay = due_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(send, base_url, record, due_at))
+        results = [future.result() for future in futures]
+    return results, time.perf_counter() - started
+
+def main():
+    """Replay a query log and print captured versus replayed load, latency and cache behaviour"""
+    parser = argparse.ArgumentParser(description="Replay a captured query log for capacity planning")
+    parser.add_argument('paths', nargs='+', help="Query log files or directories (default log dir: logs/queries)")
+    parser.add_argument('--speed', type=parse_speed, default=1.0, help="1, 10 (times the captured rate) or max")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent client connections")
+    parser.add_argument('--limit', type=int, help="Replay only the first N requests")
+    parser.add_argument('--url', help="Replay against a running server instead of a local stub-backed instance")
+    parser.add_argument('--admin-token', default=os.getenv('ADMIN_TOKEN'),
+                        help="Admin token for cache statistics with --url (default $ADMIN_TOKEN)")
+    parser.add_argument('--stub-region', choices=sorted(REGIONS),
+                        help="Region of the offline Yelp stub (default: around the logged search centers)")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    records = [record for record in read_query_log(args.paths) if record.get('endpoint') in REPLAYED_ENDPOINTS]
+    records.sort(key=lambda record: record['ts'])
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        parser.error("no replayable requests in the query log")
+
+    if args.url:
+        base_url, cache_stats = args.url.rstrip('/'), remote_cache_stats(args.url.rstrip('/'), args.admin_token)
+    else:
+        base_url, cache_stats = start_stub_instance(records, args.stub_region)
+
+    before = cache_stats()
+    results, elapsed = replay(base_url, records, args.speed, args.concurrency)
+    after = cache_stats()
+
+    latencies = defaultdict(list)
+    for endpoint, status, latency, _ in results:
+        latencies[endpoint].append(latency)
+    report = {
+        'speed': 'max' if args.speed is None else f"{args.speed:g}x",
+        'captured': captured_summary(records),
+        'replayed': {
+            'requests': len(results),
+            'elapsed_seconds': round(elapsed, 2),
+            'requests_per_second': round(len(results) / elapsed, 1) if elapsed else None,
+            # How far sends fell behind the captured schedule (all connections were busy)
+            'max_lag_seconds': round(max(lag for _, _, _, lag in results), 2),
+            'statuses': dict(Counter(status for _, status, _, _ in results)),
+            'latency_ms': percentiles([latency for _, _, latency, _ in results]),
+            'latency_ms_by_endpoint': {endpoint: percentiles(values) for endpoint, values in sorted(latencies.items())},
+            'cache': hit_ratios({name: [after[name]['hits'] - before.get(name, {}).get('hits', 0),
+                                        after[name]['misses'] - before.get(name, {}).get('misses', 0)]
+                                 for name in after}) if after and before is not None else None
+        }
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    captured, replayed = report['captured'], report['replayed']
+    print(f"Captured: {captured['requests']} requests over {captured['span_seconds']}s "
+          f"({captured['requests_per_second']} req/s), latency {captured['latency_ms']}")
+    print(f"Replayed at {report['speed']}: {replayed['requests']} requests in {replayed['elapsed_seconds']}s "
+          f"({replayed['requests_per_second']} req/s), max lag {replayed['max_lag_seconds']}s, "
+          f"statuses {replayed['statuses']}")
+    print(f"Latency: {replayed['latency_ms']}")
+    for endpoint, values in replayed['latency_ms_by_endpoint'].items():
+        print(f"  {endpoint}: {values}")
+    for label, cache in (('Captured', captured['cache']), ('Replayed', replayed['cache'])):
+        if cache:
+            print(f"{label} cache hit ratios: " +
+                  ', '.join(f"{layer} {stats['hit_ratio']:.1%} ({stats['hits']}/{stats['hits'] + stats['misses']})"
+                            for layer, stats in cache.items()))
+
+if __name__ == "__main__":
+    main()
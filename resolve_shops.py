@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Entity resolution for Coffee Shop Finder
+Links the CSV dataset, stored shops and Yelp records of the same shop to one entity id
+"""
+
+import argparse
+from services.data_service import CoffeeShopDataService
+from services.entity_resolution_service import EntityResolutionService
+from services.sharded_store import create_shop_store
+
+def main():
+    """Link new records (or relink everything) and report duplicates"""
+    parser = argparse.ArgumentParser(description="Link records of the same shop across data sources")
+    parser.add_argument('--db', default="database/coffee_shops.db", help="SQLite database of stored shops")
+    parser.add_argument('--shard-dir', help="Directory of per-region shard databases (overrides --db; default $SHARD_DIR)")
+    parser.add_argument('--csv', default="data/hawaii_coffee_shops.csv", help="CSV dataset to link ('' to skip)")
+    parser.add_argument('--links', default=None, help="Mapping database (default $ENTITY_LINKS_PATH)")
+    parser.add_argument('--threshold', type=float, default=None, help="Minimum match score to link two records")
+    parser.add_argument('--full', action='store_true', help="Drop existing links and resolve every record again")
+    parser.add_argument('--duplicates', action='store_true', help="List entities with several stored rows")
+    args = parser.parse_args()
+
+    db_service = create_shop_store(args.db, shard_dir=args.shard_dir)
+    data_service = CoffeeShopDataService(args.csv) if args.csv else None
+    resolver = EntityResolutionService(db_service, data_service, links_path=args.links,
+                                       match_threshold=args.threshold)
+    print(f"Resolution finished: {resolver.resolve(full=args.full)}")
+    print(f"Links: {resolver.get_statistics()}")
+
+    if args.duplicates:
+        for duplicate in resolver.get_duplicates():
+            print(f"  entity {duplicate['entity_id']}: stored shops {', '.join(duplicate['source_ids'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Production server for Coffee Shop Finder
+Loads the services once, then pre-forks worker processes that accept on one shared socket
+and share geocode, Yelp and summary caches through a SQLite cache file
+"""
+
+import argparse
+import os
+import signal
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def main():
+    """Bind the socket, fork the workers and restart any that exit"""
+    parser = argparse.ArgumentParser(description="Run Coffee Shop Finder with pre-forked workers")
+    parser.add_argument('--host', default='0.0.0.0', help="Interface to bind")
+    parser.add_argument('--port', type=int, default=8000, help="Port to bind")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help="Worker processes")
+    parser.add_argument('--warm', action='store_true', help="Seed the shared caches before forking")
+    args = parser.parse_args()
+
+    # Caches must live outside the workers to be shared; background threads start after the fork
+    os.environ.setdefault('CACHE_BACKEND', 'sqlite')
+    os.environ['APP_PREFORK'] = '1'
+
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    # Build the services once; the forked workers inherit them
+    app_module.preload_services()
+    if args.warm:
+        app_module.get_cache_warmer().warm_once()
+
+    server = make_server(args.host, args.port, app_module.app, threaded=True)
+    workers = {}
+
+    def spawn(worker_index):
+        pid = os.fork()
+        if pid == 0:
+            # Exit through the finally below so buffered query log records, views and search counts are written
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # Worker 0 also runs the process-wide jobs (tile prebuild, cache warmer, refresh)
+            app_module.start_background_services(singletons=worker_index == 0)
+            try:
+                server.serve_forever()
+            finally:
+                # os._exit skips atexit handlers, so write out this worker's buffered state here
+                app_module.get_query_log().close()
+                app_module.get_refresh_service().flush_views()
+                app_module.get_cache_warmer().flush_counts()
+                os._exit(0)
+        workers[pid] = worker_index
+
+    for worker_index in range(args.workers):
+        spawn(worker_index)
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers "
+          f"(cache backend: {os.environ['CACHE_BACKEND']})")
+
+    def shutdown(signum, frame):
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    while True:
+        pid, status = os.wait()
+        worker_index = workers.pop(pid, None)
+        if worker_index is not None:
+            print(f"Worker {pid} exited with status {status}; restarting")
+            spawn(worker_index)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import contextvars
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Dict, Iterator, List, Tuple
+
+from .geo_utils import haversine_miles
+from .resilience import start_request, degraded_upstreams
+
+class BatchSearchService:
+    def __init__(self, yelp_service, max_workers: int = None):
+        """Initialize many-location searches that share upstream Yelp searches"""
+        self.yelp_service = yelp_service
+        self.batch_config = {
+            'max_workers': max_workers or int(os.getenv('BATCH_MAX_WORKERS', 8)),
+            'max_queries': int(os.getenv('BATCH_MAX_QUERIES', 500)),
+            'max_radius_miles': 24.8,  # Yelp's maximum search radius (40 km)
+            # Whole-batch deadline for upstream calls (a single request gets REQUEST_DEADLINE_SECONDS)
+            'deadline_seconds': float(os.getenv('BATCH_DEADLINE_SECONDS', 60))
+        }
+
+    def parse_queries(self, raw_queries: List[Dict]) -> List[Dict]:
+        """Normalize [{'lat', 'lng', 'radius'} | {'location', 'radius'}]; raises ValueError on bad input"""
+        if not isinstance(raw_queries, list) or not raw_queries:
+            raise ValueError("queries must be a non-empty list")
+        if len(raw_queries) > self.batch_config['max_queries']:
+            raise ValueError(f"Batches are limited to {self.batch_config['max_queries']} queries")
+
+        queries = []
+        for index, raw in enumerate(raw_queries):
+            if not isinstance(raw, dict):
+                raise ValueError(f"Query {index} must be an object")
+            radius = float(raw.get('radius', 5))
+            if not 0 < radius <= self.batch_config['max_radius_miles']:
+                raise ValueError(f"Query {index}: radius must be in (0, {self.batch_config['max_radius_miles']}]")
+            location = raw.get('location')
+            if location is not None and not (isinstance(location, str) and location.strip()):
+                raise ValueError(f"Query {index}: location must be a non-empty string")
+            query = {'index': index, 'radius_miles': radius, 'location': location}
+            if raw.get('lat') is not None and raw.get('lng') is not None:
+                query['lat'], query['lng'] = float(raw['lat']), float(raw['lng'])
+                if not (-90 <= query['lat'] <= 90 and -180 <= query['lng'] <= 180):
+                    raise ValueError(f"Query {index}: invalid coordinate")
+            elif not query['location']:
+                raise ValueError(f"Query {index} needs lat and lng or a location")
+            queries.append(query)
+        return queries
+
+    def group_queries(self, queries: List[Dict]) -> List[Dict]:
+        """Group located queries so each group is answered by one search around its widest member
+
+        Queries are taken widest first; a query joins the first group whose search circle contains
+        its whole circle, otherwise it starts a group of its own. When the group's search is cut off
+        at one page of results, its other members are searched as groups of their own (see
+        iter_results), so sharing only saves upstream calls where it is lossless.
+        """
+        groups = []
+        for query in sorted(queries, key=lambda q: -q['radius_miles']):
+            for group in groups:
+                distance = haversine_miles(group['lat'], group['lng'], query['lat'], query['lng'])
+                if distance + query['radius_miles'] <= group['radius_miles']:
+                    group['members'].append(query)
+                    break
+            else:
+                groups.append({'lat': query['lat'], 'lng': query['lng'], 'radius_miles': query['radius_miles'],
+                               'members': [query]})
+        return groups
+
+    def _batch_context(self) -> contextvars.Context:
+        """Context carrying the batch deadline and degraded record into every worker thread"""
+        context = contextvars.copy_context()
+        context.run(start_request, self.batch_config['deadline_seconds'])
+        return context
+
+    def _locate(self, location: str):
+        return self.yelp_service._location_to_coordinates(location)
+
+    def _run_group(self, group: Dict) -> Tuple[List[Dict], List[Dict]]:
+        """Results of the members the group's search answers, and the members it could not"""
+        areas = [(query['lat'], query['lng'], query['radius_miles']) for query in group['members']]
+        shops_per_area = self.yelp_service.get_coffee_shops_for_areas(group['lat'], group['lng'],
+                                                                      group['radius_miles'], areas)
+        results, unanswered = [], []
+        for query, shops in zip(group['members'], shops_per_area):
+            if shops is None:
+                unanswered.append(query)
+            else:
+                results.append(self._result(query, shops=shops, group=group['id']))
+        return results, unanswered
+
+    def _result(self, query: Dict, shops: List = None, group: int = None, error: str = None) -> Dict:
+        result = {'index': query['index'], 'location': query['location'], 'lat': query.get('lat'),
+                  'lng': query.get('lng'), 'radius_miles': query['radius_miles']}
+        if error is not None:
+            result['error'] = error
+        else:
+            result.update({'group': group, 'coffee_shops': shops, 'total_count': len(shops)})
+        return result
+
+    def iter_results(self, queries: List[Dict]) -> Iterator[Dict]:
+        """Yield per-query results as their upstream search completes, then a summary line"""
+        context = self._batch_context()
+        with ThreadPoolExecutor(max_workers=self.batch_config['max_workers']) as pool:
+            # Geocode each distinct location once, concurrently
+            pending = {}
+            for location in {query['location'] for query in queries if 'lat' not in query}:
+                pending[pool.submit(context.copy().run, self._locate, location)] = location
+            coordinates = {}
+            for future in as_completed(pending):
+                try:
+                    coordinates[pending[future]] = future.result()
+                except Exception as e:
+                    print(f"Batch geocode error for {pending[future]}: {e}")
+                    coordinates[pending[future]] = None
+
+            located = []
+            for query in queries:
+                if 'lat' not in query:
+                    coords = coordinates.get(query['location'])
+                    if not coords:
+                        yield self._result(query, error='Could not geocode location')
+                        continue
+                    query['lat'], query['lng'] = coords
+                located.append(query)
+
+            groups = self.group_queries(located)
+            futures = {}
+            for group_id, group in enumerate(groups):
+                group['id'] = group_id
+                futures[pool.submit(context.copy().run, self._run_group, group)] = group
+            search_groups = len(groups)
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    group = futures.pop(future)
+                    try:
+                        results, unanswered = future.result()
+                    except Exception as e:
+                        print(f"Batch search error: {e}")
+                        for query in group['members']:
+                            yield self._result(query, error='Search failed')
+                        continue
+                    yield from results
+                    # The group's search was truncated: search the other members concurrently, each
+                    # on its own, so one failing falls back alone
+                    for query in unanswered:
+                        own = {'id': search_groups, 'lat': query['lat'], 'lng': query['lng'],
+                               'radius_miles': query['radius_miles'], 'members': [query]}
+                        search_groups += 1
+                        futures[pool.submit(context.copy().run, self._run_group, own)] = own
+
+        yield {'done': True, 'total_queries': len(queries), 'search_groups': search_groups,
+               'degraded': context.run(degraded_upstreams)}
+
+    def search(self, queries: List[Dict]) -> Dict:
+        """Run a whole batch and return results in query order"""
+        results = list(self.iter_results(queries))
+        summary = results.pop()
+        del summary['done']
+        results.sort(key=lambda result: result['index'])
+        return dict(summary, results=results)
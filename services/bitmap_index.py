@@ -0,0 +1,87 @@
+import threading
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional
+
+def popcount(bitmap: int) -> int:
+    """Number of set bits (int.bit_count on Python 3.10+)"""
+    return bitmap.bit_count() if hasattr(bitmap, 'bit_count') else bin(bitmap).count('1')
+
+def iter_bits(bitmap: int) -> Iterator[int]:
+    """Yield the positions of the set bits, lowest first"""
+    while bitmap:
+        low_bit = bitmap & -bitmap
+        yield low_bit.bit_length() - 1
+        bitmap ^= low_bit
+
+def bitmap_from_positions(positions: Iterable[int], size: int) -> int:
+    """Build a bitset from bit positions in one pass (cheaper than OR-ing one bit at a time)"""
+    buffer = bytearray((size + 7) // 8)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+class BitmapIndex:
+    def __init__(self):
+        """Map keys to bit positions and keep one Python int bitset per label"""
+        self.positions: Dict[Hashable, int] = {}
+        self.keys: List[Hashable] = []
+        self.bitmaps: Dict[str, int] = {}
+        self.labels_by_key: Dict[Hashable, frozenset] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def position(self, key: Hashable) -> Optional[int]:
+        return self.positions.get(key)
+
+    def add(self, key: Hashable, labels: Iterable[str]) -> int:
+        """Index (or re-index) a key with its labels and return its bit position"""
+        labels = frozenset(labels)
+        with self._lock:
+            position = self.positions.get(key)
+            if position is None:
+                position = len(self.keys)
+                self.positions[key] = position
+                self.keys.append(key)
+            else:
+                previous = self.labels_by_key.get(key, frozenset())
+                if previous == labels:
+                    return position
+                for label in previous - labels:
+                    self.bitmaps[label] &= ~(1 << position)
+
+            bit = 1 << position
+            for label in labels:
+                self.bitmaps[label] = self.bitmaps.get(label, 0) | bit
+            self.labels_by_key[key] = labels
+            return position
+
+    def mask_for_keys(self, keys: Iterable[Hashable]) -> int:
+        """Bitset of the given keys (unknown keys are ignored)"""
+        mask = 0
+        for key in keys:
+            position = self.positions.get(key)
+            if position is not None:
+                mask |= 1 << position
+        return mask
+
+    def all_of(self, labels: Iterable[str], within: Optional[int] = None) -> int:
+        """Intersect the bitmaps of every label, optionally restricted to a mask"""
+        result = within if within is not None else (1 << len(self.keys)) - 1
+        for label in labels:
+            result &= self.bitmaps.get(label, 0)
+            if not result:
+                break
+        return result
+
+    def facet_counts(self, mask: int) -> Dict[str, int]:
+        """Count how many keys in mask carry each label"""
+        counts = {}
+        for label, bitmap in self.bitmaps.items():
+            count = popcount(bitmap & mask)
+            if count:
+                counts[label] = count
+        return counts
+
+    def keys_for(self, mask: int) -> List[Hashable]:
+        return [self.keys[position] for position in iter_bits(mask)]
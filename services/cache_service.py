@@ -0,0 +1,116 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .memory_service import deep_sizeof, sample_values
+from .query_log_service import record_cache_lookup
+
+class TTLCache:
+    def __init__(self, name: str, max_entries: int = 1000, ttl_seconds: float = 3600):
+        """Initialize a thread-safe, size-bounded LRU cache whose entries expire after ttl_seconds"""
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                record_cache_lookup(self.name, False)
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            record_cache_lookup(self.name, True)
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float = None):
+        """Store a value, evicting the least recently used entries beyond max_entries"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Delete every entry whose key matches predicate; returns the number removed"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def ttl_remaining(self, key: Hashable) -> Optional[float]:
+        """Seconds until an entry expires, or None if it is not cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            remaining = entry[0] - time.monotonic()
+            return remaining if remaining > 0 else None
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Snapshot of the unexpired (key, value) pairs (not counted as lookups)"""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, entry[1]) for key, entry in self._entries.items() if entry[0] > now]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def memory_usage(self, sample_size: int = 200) -> Dict:
+        """Approximate bytes held by the entries (sized from a random sample when there are more)"""
+        with self._lock:
+            keys, entries = list(self._entries), list(self._entries.values())
+            index_bytes = sys.getsizeof(self._entries)
+        # Sized outside the lock so lookups are not held up
+        sampled = sample_values(range(len(entries)), sample_size)
+        seen = set()
+        sampled_bytes = sum(deep_sizeof(keys[i], seen) + deep_sizeof(entries[i], seen) for i in sampled)
+        entry_bytes = sampled_bytes * len(entries) / len(sampled) if sampled else 0
+        return {
+            'storage': 'memory',
+            'approximate_bytes': int(index_bytes + entry_bytes),
+            'sampled_entries': len(sampled)
+        }
+
+    def get_statistics(self) -> Dict:
+        """Get entry count and hit ratio"""
+        lookups = self.hits + self.misses
+        return {
+            'name': self.name,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+def create_cache(name: str, max_entries: int = 1000, ttl_seconds: float = 3600):
+    """Create a cache on the configured backend: CACHE_BACKEND=memory (per process) or sqlite (shared by workers)"""
+    backend = os.getenv('CACHE_BACKEND', 'memory').lower()
+    if backend == 'sqlite':
+        from .shared_cache import SQLiteCache
+        return SQLiteCache(name, max_entries, ttl_seconds, path=os.getenv('CACHE_PATH', 'cache/shared_cache.db'))
+    if backend != 'memory':
+        raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+    return TTLCache(name, max_entries, ttl_seconds)
@@ -0,0 +1,186 @@
+import atexit
+import csv
+import json
+import os
+import threading
+from collections import Counter
+from typing import List, Dict, Optional
+
+from .quota_service import QuotaExceeded
+from .query_count_store import QueryCountStore
+
+class CacheWarmerService:
+    def __init__(self, yelp_service, seed_csv_path: str = "data/hawaii_coffee_shops.csv",
+                 count_store: QueryCountStore = None):
+        """Initialize the cache warmer for the most frequently searched regions
+
+        Every process counts its searches in memory and adds them to the shared count store every
+        flush period, so the warmer (which runs in one process) ranks regions by all workers' traffic.
+        """
+        self.yelp_service = yelp_service
+        self.seed_csv_path = seed_csv_path
+
+        self.warmer_config = {
+            'top_n': int(os.getenv('WARMER_TOP_N', 20)),
+            'interval_seconds': float(os.getenv('WARMER_INTERVAL_SECONDS', 300)),
+            # Refresh entries that expire within this window, so they never go cold
+            'refresh_margin_seconds': float(os.getenv('WARMER_REFRESH_MARGIN_SECONDS', 900)),
+            'default_radius_miles': 5,
+            # Counts are halved every decay period so the ranking follows recent traffic
+            'decay_seconds': float(os.getenv('WARMER_DECAY_SECONDS', 86400)),
+            # Each process adds its counts to the shared store this often
+            'flush_seconds': float(os.getenv('WARMER_FLUSH_SECONDS', 10))
+        }
+        self.count_store = count_store or QueryCountStore(decay_seconds=self.warmer_config['decay_seconds'])
+
+        # Popular places, always kept warm: the app's default center and the main towns/ZIPs
+        self.seed_regions = [
+            {'kind': 'coords', 'lat': 21.3069, 'lng': -157.8583},
+            {'kind': 'location', 'query': 'Kailua-Kona'},
+            {'kind': 'location', 'query': 'Kahului'}
+        ] + [{'kind': 'location', 'query': zip_code} for zip_code in self._load_seed_zip_codes()]
+
+        # Counts not yet added to the shared store, by serialized region key
+        self.query_counts = Counter()
+        self.regions = {}  # region key -> region dict with the widest radius seen
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _load_seed_zip_codes(self) -> List[str]:
+        """Read the distinct ZIP codes from the bundled CSV"""
+        if not os.path.exists(self.seed_csv_path):
+            return []
+        with open(self.seed_csv_path, newline='') as f:
+            zip_codes = [row['zip_code'] for row in csv.DictReader(f) if row.get('zip_code')]
+        return sorted(set(zip_codes))
+
+    def _region_key(self, region: Dict) -> tuple:
+        if region['kind'] == 'coords':
+            # ~1 km buckets so nearby map clicks count as the same region
+            return ('coords', round(region['lat'], 2), round(region['lng'], 2))
+        return ('location', self.yelp_service.geocode_cache_key(region['query']))
+
+    def record_query(self, location_query: str = None, lat: float = None, lng: float = None,
+                     radius_miles: int = None):
+        """Count a search so the warmer can rank regions by popularity"""
+        if location_query:
+            region = {'kind': 'location', 'query': location_query}
+        elif lat is not None and lng is not None:
+            region = {'kind': 'coords', 'lat': lat, 'lng': lng}
+        else:
+            return
+
+        region['radius_miles'] = radius_miles or self.warmer_config['default_radius_miles']
+        key = json.dumps(self._region_key(region))
+        with self._lock:
+            self.query_counts[key] += 1
+            known = self.regions.get(key)
+            if known is None or known['radius_miles'] < region['radius_miles']:
+                self.regions[key] = region
+            # Threads do not survive fork, so each worker process starts its own flusher
+            if self._flusher_pid != os.getpid():
+                self._flusher_pid = os.getpid()
+                flusher_stop = threading.Event()
+                threading.Thread(target=self._flush_periodically, args=(flusher_stop,), name='query-count-flusher',
+                                 daemon=True).start()
+                atexit.register(self._stop_flusher, flusher_stop)
+
+    def flush_counts(self):
+        """Add this process's counts since the last flush to the shared store"""
+        with self._lock:
+            counts, regions = self.query_counts, self.regions
+            self.query_counts, self.regions = Counter(), {}
+        self.count_store.add(dict(counts), regions)
+
+    def _flush_periodically(self, stop_event: threading.Event):
+        while not stop_event.wait(self.warmer_config['flush_seconds']):
+            try:
+                self.flush_counts()
+            except Exception as e:
+                print(f"Error sharing search counts: {e}")
+
+    def _stop_flusher(self, stop_event: threading.Event):
+        """Add the counts recorded since the last flush (at exit)"""
+        stop_event.set()
+        try:
+            self.flush_counts()
+        except Exception as e:
+            print(f"Error sharing search counts: {e}")
+
+    def get_hot_regions(self) -> List[Dict]:
+        """Seed regions followed by the top-N most searched regions across all processes"""
+        self.flush_counts()
+        popular = self.count_store.top(self.warmer_config['top_n'])
+
+        regions = {}
+        for region in self.seed_regions + popular:
+            region = dict(region)
+            region.setdefault('radius_miles', self.warmer_config['default_radius_miles'])
+            key = self._region_key(region)
+            if key not in regions or regions[key]['radius_miles'] < region['radius_miles']:
+                regions[key] = region
+        return list(regions.values())
+
+    def remaining_budget(self) -> int:
+        """Yelp calls the warmer may still make from the shared quota (warm-up class)"""
+        return self.yelp_service.quota.available('warmup')
+
+    def _needs_refresh(self, cache, key) -> bool:
+        remaining = cache.ttl_remaining(key)
+        return remaining is None or remaining < self.warmer_config['refresh_margin_seconds']
+
+    def warm_region(self, region: Dict) -> Optional[str]:
+        """Refresh one region's geocode, Yelp search and summaries if they are about to expire"""
+        yelp = self.yelp_service
+        if region['kind'] == 'location':
+            geocode_key = yelp.geocode_cache_key(region['query'])
+            coords = yelp._location_to_coordinates(region['query'],
+                                                   refresh=self._needs_refresh(yelp.geocode_cache, geocode_key))
+            if not coords:
+                return 'geocode_failed'
+            lat, lng = coords
+        else:
+            lat, lng = region['lat'], region['lng']
+
+        search_key, cached = yelp.search_cache_entry(lat, lng, region['radius_miles'])
+        if yelp.cached_search_covers(cached, region['radius_miles']) and \
+                not self._needs_refresh(yelp.search_cache, search_key):
+            return 'fresh'
+
+        if not yelp.api_key:
+            return 'no_api_key'
+        try:
+            yelp.warm_location(lat, lng, region['radius_miles'])
+        except QuotaExceeded:
+            return 'over_budget'
+        return 'warmed'
+
+    def warm_once(self) -> Dict:
+        """Run one warming pass over the hot regions"""
+        results = Counter()
+        for region in self.get_hot_regions():
+            try:
+                results[self.warm_region(region)] += 1
+            except Exception as e:
+                print(f"Error warming region {region}: {e}")
+                results['error'] += 1
+        print(f"Cache warm pass: {dict(results)} (Yelp budget left: {self.remaining_budget()})")
+        return dict(results)
+
+    def start(self):
+        """Start warming in a background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='cache-warmer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.warm_once()
+            self._stop_event.wait(self.warmer_config['interval_seconds'])
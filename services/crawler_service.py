@@ -0,0 +1,229 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from math import ceil, cos, radians
+from typing import List, Dict, Optional, Tuple
+
+from .geo_utils import haversine_miles, MILES_PER_DEGREE_LAT
+from .quota_service import QuotaExceeded
+
+# Bounding boxes (south, west, north, east) for common crawl targets
+REGIONS = {
+    'hawaii': (18.9, -160.3, 22.3, -154.8),
+    'oahu': (21.25, -158.3, 21.72, -157.64),
+    'maui': (20.57, -156.7, 21.04, -155.97),
+    'big-island': (18.9, -156.1, 20.3, -154.8),
+    'kauai': (21.86, -159.8, 22.24, -159.28)
+}
+
+class RateLimiter:
+    def __init__(self, requests_per_second: float):
+        """Token bucket shared by all crawler workers"""
+        self.rate = requests_per_second
+        self.capacity = max(requests_per_second, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be made"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+
+class RegionCrawlerService:
+    def __init__(self, search_client, db_service, checkpoint_path: str = "database/crawl_checkpoint.json",
+                 max_workers: int = 4, requests_per_second: float = 4.0):
+        """Initialize a tile-sweep crawler; search_client provides fetch_search_page (Yelp or stub)"""
+        self.search_client = search_client
+        self.db_service = db_service
+        self.checkpoint_path = checkpoint_path
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(requests_per_second)
+
+        self.crawl_config = {
+            'initial_tile_miles': 10.0,
+            'min_tile_miles': 0.5,  # Below this a saturated tile is accepted as truncated
+            'max_radius_meters': 40000,  # Yelp's maximum search radius
+            'max_results': 240,  # Yelp only pages through the first 240 matches
+            'page_size': 50,
+            'max_retries': 3,
+            'checkpoint_every': 10  # Completed tiles between bulk loads + checkpoints
+        }
+
+    def _make_tile(self, south: float, west: float, north: float, east: float, depth: int = 0) -> Dict:
+        return {'bbox': [south, west, north, east], 'depth': depth, 'attempts': 0}
+
+    def initial_tiles(self, bbox: Tuple[float, float, float, float]) -> List[Dict]:
+        """Split a region into roughly square tiles of initial_tile_miles"""
+        south, west, north, east = bbox
+        tile_miles = self.crawl_config['initial_tile_miles']
+        lat_step = tile_miles / MILES_PER_DEGREE_LAT
+        lng_step = tile_miles / (MILES_PER_DEGREE_LAT * max(cos(radians((south + north) / 2)), 0.01))
+
+        rows = max(ceil((north - south) / lat_step), 1)
+        cols = max(ceil((east - west) / lng_step), 1)
+        lat_step = (north - south) / rows
+        lng_step = (east - west) / cols
+
+        return [self._make_tile(south + r * lat_step, west + c * lng_step,
+                                south + (r + 1) * lat_step, west + (c + 1) * lng_step)
+                for r in range(rows) for c in range(cols)]
+
+    def _subdivide(self, tile: Dict) -> List[Dict]:
+        south, west, north, east = tile['bbox']
+        mid_lat, mid_lng = (south + north) / 2, (west + east) / 2
+        depth = tile['depth'] + 1
+        return [self._make_tile(south, west, mid_lat, mid_lng, depth),
+                self._make_tile(south, mid_lng, mid_lat, east, depth),
+                self._make_tile(mid_lat, west, north, mid_lng, depth),
+                self._make_tile(mid_lat, mid_lng, north, east, depth)]
+
+    def _crawl_tile(self, tile: Dict) -> Dict:
+        """Search the circle covering a tile; subdivide it when Yelp's result cap is hit"""
+        south, west, north, east = tile['bbox']
+        center_lat, center_lng = (south + north) / 2, (west + east) / 2
+        # The circumscribed circle covers the whole tile, so neighbouring circles overlap
+        radius_miles = haversine_miles(center_lat, center_lng, north, east)
+        tile_miles = haversine_miles(south, west, south, east)
+        radius_meters = ceil(radius_miles * 1609)
+
+        if radius_meters > self.crawl_config['max_radius_meters']:
+            return {'children': self._subdivide(tile), 'businesses': [], 'requests': 0, 'truncated': False}
+
+        page_size = self.crawl_config['page_size']
+        max_results = self.crawl_config['max_results']
+
+        self.rate_limiter.acquire()
+        data = self.search_client.fetch_search_page(center_lat, center_lng, radius_meters, offset=0, limit=page_size,
+                                                    priority='crawl')
+        total = data.get('total', 0)
+        businesses = list(data.get('businesses', []))
+        requests_made = 1
+
+        saturated = total > max_results
+        if saturated and tile_miles / 2 >= self.crawl_config['min_tile_miles']:
+            return {'children': self._subdivide(tile), 'businesses': [], 'requests': requests_made, 'truncated': False}
+
+        offset = page_size
+        while offset < min(total, max_results):
+            self.rate_limiter.acquire()
+            data = self.search_client.fetch_search_page(center_lat, center_lng, radius_meters,
+                                                        offset=offset, limit=page_size, priority='crawl')
+            page = data.get('businesses', [])
+            requests_made += 1
+            if not page:
+                break
+            businesses.extend(page)
+            offset += page_size
+
+        return {'children': [], 'businesses': businesses, 'requests': requests_made, 'truncated': saturated}
+
+    def _load_checkpoint(self) -> Optional[Dict]:
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, 'r') as f:
+            return json.load(f)
+
+    def _save_checkpoint(self, checkpoint: Dict):
+        """Write the checkpoint atomically so an interrupted crawl can always resume"""
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def crawl(self, bbox: Tuple[float, float, float, float] = None, resume: bool = True) -> Dict:
+        """Crawl a region into the local store, resuming from the checkpoint when it matches"""
+        checkpoint = self._load_checkpoint() if resume else None
+        if checkpoint and (bbox is None or list(bbox) == checkpoint['bbox']):
+            print(f"Resuming crawl with {len(checkpoint['pending'])} pending tiles")
+        elif bbox is None:
+            raise ValueError("No bbox given and no checkpoint to resume")
+        else:
+            checkpoint = {'bbox': list(bbox), 'pending': self.initial_tiles(bbox), 'stats': {
+                'tiles_done': 0, 'tiles_subdivided': 0, 'tiles_truncated': 0,
+                'requests': 0, 'businesses_loaded': 0, 'failed_tiles': 0}, 'complete': False}
+
+        stats = checkpoint['stats']
+        pending = deque(checkpoint['pending'])
+        in_flight = {}
+        seen_ids = set()
+        buffer = []
+        completed_since_checkpoint = 0
+        quota_exhausted = False
+        started = time.perf_counter()
+
+        def flush():
+            if buffer:
+                stats['businesses_loaded'] += self.db_service.bulk_upsert_yelp_businesses(buffer)
+                buffer.clear()
+            checkpoint['pending'] = list(pending) + list(in_flight.values())
+            checkpoint['complete'] = not checkpoint['pending']
+            self._save_checkpoint(checkpoint)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            try:
+                while (pending and not quota_exhausted) or in_flight:
+                    while pending and not quota_exhausted and len(in_flight) < self.max_workers * 2:
+                        tile = pending.popleft()
+                        in_flight[pool.submit(self._crawl_tile, tile)] = tile
+
+                    done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        tile = in_flight.pop(future)
+                        try:
+                            result = future.result()
+                        except QuotaExceeded as e:
+                            # The crawl yields to interactive traffic; the tile stays pending for a resume
+                            if not quota_exhausted:
+                                print(f"Pausing crawl: {e}")
+                            quota_exhausted = True
+                            pending.append(tile)
+                            continue
+                        except Exception as e:
+                            tile['attempts'] += 1
+                            if tile['attempts'] < self.crawl_config['max_retries']:
+                                pending.append(tile)
+                            else:
+                                stats['failed_tiles'] += 1
+                                print(f"Giving up on tile {tile['bbox']}: {e}")
+                            continue
+
+                        stats['requests'] += result['requests']
+                        if result['children']:
+                            stats['tiles_subdivided'] += 1
+                            pending.extend(result['children'])
+                            continue
+
+                        stats['tiles_done'] += 1
+                        stats['tiles_truncated'] += int(result['truncated'])
+                        for business in result['businesses']:
+                            if business.get('id') and business['id'] not in seen_ids:
+                                seen_ids.add(business['id'])
+                                buffer.append(business)
+                        completed_since_checkpoint += 1
+
+                    if completed_since_checkpoint >= self.crawl_config['checkpoint_every']:
+                        flush()
+                        completed_since_checkpoint = 0
+            finally:
+                flush()
+
+        stats['elapsed_seconds'] = round(time.perf_counter() - started, 2)
+        stats['unique_businesses'] = len(seen_ids)
+        stats['quota_exhausted'] = quota_exhausted
+        print(f"Crawl finished: {stats}")
+        return stats
@@ -1,7 +1,6 @@
-import pandas as pd
 import os
 from typing import List, Dict, Optional
-from geopy.distance import geodesic
+from .shop import Shop
 
 class CoffeeShopDataService:
     def __init__(self, csv_path: str = "data/hawaii_coffee_shops.csv"):
@@ -12,6 +11,7 @@ class CoffeeShopDataService:
     
     def load_data(self):
         """Load coffee shop data from CSV file"""
+        import pandas as pd  # Deferred: pandas dominates import time and only this service needs it
         try:
             if os.path.exists(self.csv_path):
                 self.data = pd.read_csv(self.csv_path)
@@ -27,49 +27,54 @@ class CoffeeShopDataService:
             print(f"Error loading data: {e}")
             self.data = pd.DataFrame()
     
-    def get_all_shops(self) -> List[Dict]:
+    def _to_shops(self, frame) -> List[Shop]:
+        """Convert DataFrame rows to Shop records without per-row dicts"""
+        columns = tuple(frame.columns)
+        return [Shop.from_columns(columns, values) for values in frame.itertuples(index=False, name=None)]
+    
+    def get_all_shops(self) -> List[Shop]:
         """Get all coffee shops"""
         if self.data.empty:
             return []
-        return self.data.to_dict('records')
+        return self._to_shops(self.data)
     
-    def get_shops_by_zip(self, zip_code: str) -> List[Dict]:
+    def get_shops_by_zip(self, zip_code: str) -> List[Shop]:
         """Get coffee shops by zip code"""
         if self.data.empty:
             return []
         
         # Filter by zip code
         filtered_data = self.data[self.data['zip_code'] == zip_code]
-        return filtered_data.to_dict('records')
+        return self._to_shops(filtered_data)
     
-    def get_shops_by_city(self, city: str) -> List[Dict]:
+    def get_shops_by_city(self, city: str) -> List[Shop]:
         """Get coffee shops by city"""
         if self.data.empty:
             return []
         
         # Filter by city (case insensitive)
         filtered_data = self.data[self.data['city'].str.lower() == city.lower()]
-        return filtered_data.to_dict('records')
+        return self._to_shops(filtered_data)
     
-    def get_shops_by_rating(self, min_rating: float = 0.0) -> List[Dict]:
+    def get_shops_by_rating(self, min_rating: float = 0.0) -> List[Shop]:
         """Get coffee shops with minimum rating"""
         if self.data.empty:
             return []
         
         filtered_data = self.data[self.data['rating'] >= min_rating]
-        return filtered_data.to_dict('records')
+        return self._to_shops(filtered_data)
     
-    def get_shop_by_id(self, shop_id: int) -> Optional[Dict]:
+    def get_shop_by_id(self, shop_id: int) -> Optional[Shop]:
         """Get a specific coffee shop by ID"""
         if self.data.empty:
             return None
         
         shop_data = self.data[self.data['id'] == shop_id]
         if not shop_data.empty:
-            return shop_data.iloc[0].to_dict()
+            return self._to_shops(shop_data.iloc[:1])[0]
         return None
     
-    def search_shops(self, query: str) -> List[Dict]:
+    def search_shops(self, query: str) -> List[Shop]:
         """Search coffee shops by name or description"""
         if self.data.empty:
             return []
@@ -81,13 +86,16 @@ class CoffeeShopDataService:
             self.data['city'].str.contains(query, case=False, na=False)
         )
         filtered_data = self.data[mask]
-        return filtered_data.to_dict('records')
+        return self._to_shops(filtered_data)
     
-    def get_shops_near_location(self, lat: float, lng: float, radius_miles: float = 10.0) -> List[Dict]:
+    def get_shops_near_location(self, lat: float, lng: float, radius_miles: float = 10.0) -> List[Shop]:
         """Get coffee shops within a certain radius of a location"""
         if self.data.empty:
             return []
         
+        import pandas as pd
+        from geopy.distance import geodesic
+        
         nearby_shops = []
         target_location = (lat, lng)
         
@@ -97,15 +105,13 @@ class CoffeeShopDataService:
                 distance = geodesic(target_location, shop_location).miles
                 
                 if distance <= radius_miles:
-                    shop_dict = shop.to_dict()
-                    shop_dict['distance'] = round(distance, 2)
-                    nearby_shops.append(shop_dict)
+                    nearby_shops.append(Shop.from_record(shop).replace(distance=round(distance, 2)))
         
         # Sort by distance
         nearby_shops.sort(key=lambda x: x['distance'])
         return nearby_shops
     
-    def get_island_shops(self, island: str) -> List[Dict]:
+    def get_island_shops(self, island: str) -> List[Shop]:
         """Get coffee shops by island (Hawaii, Maui, Oahu, Kauai)"""
         island_mapping = {
             'hawaii': ['Kailua-Kona', 'Hilo', 'Waimea', 'Holualoa'],
@@ -119,7 +125,7 @@ class CoffeeShopDataService:
         
         cities = island_mapping[island.lower()]
         filtered_data = self.data[self.data['city'].isin(cities)]
-        return filtered_data.to_dict('records')
+        return self._to_shops(filtered_data)
     
     def get_statistics(self) -> Dict:
         """Get statistics about the coffee shop data"""
@@ -2,12 +2,47 @@ import sqlite3
 import os
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
+import hashlib
 import json
+from .cache_service import TTLCache
+from .nlp_summary_service import NLPSummaryService
+from .shop import Shop
+from .opening_hours import encode_intervals, format_week, parse_hours_text, parse_yelp_hours
+
+# Columns added after the first release; existing databases get them via ALTER TABLE
+SCHEMA_MIGRATIONS = {
+    'coffee_shops': [
+        ('yelp_id', 'TEXT'),
+        ('review_count', 'INTEGER DEFAULT 0'),
+        ('price', 'TEXT'),
+        ('yelp_url', 'TEXT'),
+        ('image_url', 'TEXT'),
+        ('fetched_at', 'TIMESTAMP'),
+        ('content_hash', 'TEXT'),
+        ('view_count', 'INTEGER DEFAULT 0'),
+        ('open_intervals', 'TEXT')
+    ],
+    'reviews': [
+        ('yelp_review_id', 'TEXT')
+    ]
+}
+
+# Columns populated from Yelp business payloads
+YELP_CONTENT_COLUMNS = ('name', 'address', 'city', 'state', 'zip_code', 'lat', 'lng', 'rating',
+                        'description', 'phone', 'review_count', 'price', 'yelp_url', 'image_url')
 
 class CoffeeShopDatabaseService:
-    def __init__(self, db_path: str = "database/coffee_shops.db"):
-        """Initialize the database service"""
+    def __init__(self, db_path: str = "database/coffee_shops.db", tagger=None, id_offset: int = 0):
+        """Initialize the database service
+
+        id_offset starts shop ids above it, so shops stored in different files (shards) never share an id.
+        """
         self.db_path = db_path
+        self.id_offset = id_offset
+        # Derives facet tags for a shop row at ingest time
+        self.tagger = tagger or NLPSummaryService().derive_tags
+        # Statistics are keyed by get_data_version(), so any shop change invalidates them
+        self.statistics_cache = TTLCache('statistics', max_entries=16, ttl_seconds=300)
         self.ensure_database_exists()
     
     def ensure_database_exists(self):
@@ -15,6 +50,8 @@ class CoffeeShopDatabaseService:
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
         with sqlite3.connect(self.db_path) as conn:
+            self._migrate_columns(conn)
+            
             # Read and execute schema
             schema_path = "database/schema.sql"
             if os.path.exists(schema_path):
@@ -24,13 +61,37 @@ class CoffeeShopDatabaseService:
                 print(f"Database initialized: {self.db_path}")
             else:
                 print(f"Schema file not found: {schema_path}")
+            
+            if self.id_offset:
+                conn.execute("""
+                    INSERT INTO sqlite_sequence (name, seq)
+                    SELECT 'coffee_shops', ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'coffee_shops')
+                """, (self.id_offset,))
+        
+        self._backfill_tags()
+        self._backfill_open_intervals()
+    
+    def _migrate_columns(self, conn):
+        """Add columns missing from tables created by an older schema"""
+        for table, columns in SCHEMA_MIGRATIONS.items():
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if not existing:
+                continue  # Table will be created from schema.sql
+            for column, declaration in columns:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+                    print(f"Migrated {table}: added column {column}")
     
-    def get_connection(self):
-        """Get a database connection with proper row factory"""
+    def get_connection(self, shop_id: Optional[int] = None):
+        """Get a database connection with proper row factory (shop_id picks the file in a sharded store)"""
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row  # This allows accessing columns by name
         return conn
     
+    def shards(self) -> List['CoffeeShopDatabaseService']:
+        """The single-file store is its own only shard"""
+        return [self]
+    
     def insert_coffee_shop(self, shop_data: Dict) -> int:
         """Insert a new coffee shop and return its ID"""
         with self.get_connection() as conn:
@@ -38,61 +99,248 @@ class CoffeeShopDatabaseService:
             cursor.execute("""
                 INSERT INTO coffee_shops 
                 (name, address, city, state, zip_code, lat, lng, signature_drink, 
-                 rating, description, phone, hours, website)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 rating, description, phone, hours, website, open_intervals)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 shop_data['name'], shop_data['address'], shop_data['city'],
                 shop_data.get('state', 'HI'), shop_data['zip_code'],
                 shop_data['lat'], shop_data['lng'], shop_data.get('signature_drink'),
                 shop_data.get('rating', 0.0), shop_data.get('description'),
-                shop_data.get('phone'), shop_data.get('hours'), shop_data.get('website')
+                shop_data.get('phone'), shop_data.get('hours'), shop_data.get('website'),
+                encode_intervals(parse_hours_text(shop_data.get('hours')))
             ))
-            return cursor.lastrowid
+            shop_id = cursor.lastrowid
+        self.tag_shops([shop_id])
+        return shop_id
     
-    def get_all_shops(self) -> List[Dict]:
+    def _backfill_tags(self):
+        """Tag every shop once for databases created before tags were derived at ingest"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT EXISTS(SELECT 1 FROM coffee_shop_tags), EXISTS(SELECT 1 FROM coffee_shops)")
+            has_tags, has_shops = cursor.fetchone()
+        if has_shops and not has_tags:
+            self.tag_shops()
+    
+    def _backfill_open_intervals(self):
+        """Parse stored hours text once for rows written before hours were parsed at ingest"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, hours FROM coffee_shops WHERE open_intervals IS NULL AND hours IS NOT NULL")
+            # '' marks hours that could not be parsed, so they are not retried on every start
+            cursor.executemany("UPDATE coffee_shops SET open_intervals = ? WHERE id = ?",
+                               [(encode_intervals(parse_hours_text(row['hours'])), row['id'])
+                                for row in cursor.fetchall()])
+    
+    def _store_yelp_hours(self, cursor, key_column: str, keyed_businesses: List[Tuple]):
+        """Store parsed hours from business details ((key, business) pairs); search results carry none"""
+        rows = []
+        for key, business in keyed_businesses:
+            intervals = parse_yelp_hours(business.get('hours'))
+            if intervals:
+                rows.append((format_week(intervals), encode_intervals(intervals), key))
+        # Unchanged hours are skipped so the updated_at trigger only fires on real changes
+        cursor.executemany(f"""
+            UPDATE coffee_shops SET hours = ?1, open_intervals = ?2
+            WHERE {key_column} = ?3 AND open_intervals IS NOT ?2
+        """, rows)
+    
+    def tag_shops(self, shop_ids: Optional[List[int]] = None):
+        """Derive and store tags for the given shops (all shops when None)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if shop_ids is None:
+                cursor.execute("SELECT id, name, description FROM coffee_shops")
+                rows = cursor.fetchall()
+            else:
+                rows = []
+                for start in range(0, len(shop_ids), 500):
+                    chunk = shop_ids[start:start + 500]
+                    cursor.execute(f"SELECT id, name, description FROM coffee_shops WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+                    rows.extend(cursor.fetchall())
+            
+            shop_tags = {row['id']: self.tagger(dict(row)) for row in rows}
+            all_tags = {tag for tags in shop_tags.values() for tag in tags}
+            cursor.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", [(tag,) for tag in all_tags])
+            cursor.executemany("DELETE FROM coffee_shop_tags WHERE coffee_shop_id = ?", [(shop_id,) for shop_id in shop_tags])
+            cursor.executemany("""
+                INSERT INTO coffee_shop_tags (coffee_shop_id, tag_id)
+                SELECT ?, id FROM tags WHERE name = ?
+            """, [(shop_id, tag) for shop_id, tags in shop_tags.items() for tag in tags])
+    
+    def get_all_open_intervals(self) -> List[Dict]:
+        """Get every shop's id, Yelp id and encoded weekly opening hours"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, yelp_id, open_intervals FROM coffee_shops WHERE open_intervals != ''")
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_all_shop_tags(self) -> List[Dict]:
+        """Get every shop's id, Yelp id and tag names"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT cs.id, cs.yelp_id, GROUP_CONCAT(t.name) AS tags
+                FROM coffee_shops cs
+                LEFT JOIN coffee_shop_tags cst ON cst.coffee_shop_id = cs.id
+                LEFT JOIN tags t ON t.id = cst.tag_id
+                GROUP BY cs.id
+            """)
+            return [{'id': row['id'], 'yelp_id': row['yelp_id'],
+                     'tags': row['tags'].split(',') if row['tags'] else []} for row in cursor.fetchall()]
+    
+    def _yelp_business_row(self, business: Dict) -> Optional[Tuple]:
+        """Map a raw Yelp business to the stored content columns (YELP_CONTENT_COLUMNS order)"""
+        location = business.get('location') or {}
+        coordinates = business.get('coordinates') or {}
+        if coordinates.get('latitude') is None or coordinates.get('longitude') is None:
+            return None
+        categories = business.get('categories') or [{}]
+        return (
+            business.get('name', ''), location.get('address1') or '', location.get('city') or '',
+            location.get('state') or '', location.get('zip_code') or '',
+            coordinates['latitude'], coordinates['longitude'],
+            business.get('rating', 0.0), categories[0].get('title', 'Coffee Shop'),
+            business.get('phone', ''), business.get('review_count', 0),
+            business.get('price', ''), business.get('url', ''), business.get('image_url', '')
+        )
+    
+    def content_hash(self, row: Tuple) -> str:
+        """Hash of the stored content, so unchanged Yelp payloads can skip the write"""
+        return hashlib.sha1(json.dumps(row).encode('utf-8')).hexdigest()
+    
+    def bulk_upsert_yelp_businesses(self, businesses: List[Dict]) -> int:
+        """Insert or update raw Yelp businesses keyed by Yelp business id in one transaction"""
+        rows = []
+        for business in businesses:
+            row = self._yelp_business_row(business)
+            if row is not None:
+                rows.append(row + (business['id'], self.content_hash(row)))
+        
+        columns = ', '.join(YELP_CONTENT_COLUMNS)
+        placeholders = ', '.join('?' * (len(YELP_CONTENT_COLUMNS) + 2))
+        updates = ', '.join(f"{column} = excluded.{column}" for column in YELP_CONTENT_COLUMNS)
+        
+        with self.get_connection() as conn:
+            # Rows whose content hash is unchanged are left alone so updated_at stays meaningful
+            conn.executemany(f"""
+                INSERT INTO coffee_shops ({columns}, yelp_id, content_hash)
+                VALUES ({placeholders})
+                ON CONFLICT(yelp_id) DO UPDATE SET {updates}, content_hash = excluded.content_hash
+                WHERE coffee_shops.content_hash IS NOT excluded.content_hash
+            """, rows)
+            conn.executemany("UPDATE coffee_shops SET fetched_at = CURRENT_TIMESTAMP WHERE yelp_id = ?",
+                             [(row[-2],) for row in rows])
+            cursor = conn.cursor()
+            self._store_yelp_hours(cursor, 'yelp_id', [(business.get('id'), business) for business in businesses])
+            shop_ids = []
+            yelp_ids = [row[-2] for row in rows]
+            for start in range(0, len(yelp_ids), 500):
+                chunk = yelp_ids[start:start + 500]
+                cursor.execute(f"SELECT id FROM coffee_shops WHERE yelp_id IN ({','.join('?' * len(chunk))})", chunk)
+                shop_ids.extend(row[0] for row in cursor.fetchall())
+        self.tag_shops(shop_ids)
+        return len(rows)
+    
+    def get_stale_shops(self, max_age_seconds: int, limit: int = 100) -> List[Dict]:
+        """Get Yelp-backed shops not fetched within max_age_seconds, most viewed first"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, yelp_id, content_hash, view_count, fetched_at FROM coffee_shops
+                WHERE yelp_id IS NOT NULL
+                  AND (fetched_at IS NULL OR fetched_at <= datetime('now', ?))
+                ORDER BY view_count DESC, fetched_at ASC
+                LIMIT ?
+            """, (f"-{int(max_age_seconds)} seconds", limit))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def apply_refresh(self, fetched: List[Tuple[int, Optional[Dict]]]) -> List[int]:
+        """Store refreshed Yelp payloads for (shop id, business) pairs; returns ids whose content changed"""
+        changed_ids = []
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for shop_id, business in fetched:
+                row = self._yelp_business_row(business) if business else None
+                if row is not None:
+                    new_hash = self.content_hash(row)
+                    cursor.execute("SELECT content_hash FROM coffee_shops WHERE id = ?", (shop_id,))
+                    current = cursor.fetchone()
+                    if current is not None and current[0] != new_hash:
+                        assignments = ', '.join(f"{column} = ?" for column in YELP_CONTENT_COLUMNS)
+                        cursor.execute(f"UPDATE coffee_shops SET {assignments}, content_hash = ? WHERE id = ?",
+                                       row + (new_hash, shop_id))
+                        changed_ids.append(shop_id)
+                cursor.execute("UPDATE coffee_shops SET fetched_at = CURRENT_TIMESTAMP WHERE id = ?", (shop_id,))
+            self._store_yelp_hours(cursor, 'id', [(shop_id, business) for shop_id, business in fetched if business])
+        if changed_ids:
+            self.tag_shops(changed_ids)
+            self.statistics_cache.clear()
+        return changed_ids
+    
+    def record_views(self, view_counts: Dict[str, int]):
+        """Add buffered view counts, keyed by Yelp business id"""
+        if not view_counts:
+            return
+        with self.get_connection() as conn:
+            conn.executemany("UPDATE coffee_shops SET view_count = view_count + ? WHERE yelp_id = ?",
+                             [(count, yelp_id) for yelp_id, count in view_counts.items()])
+    
+    def get_all_shops(self) -> List[Shop]:
         """Get all coffee shops"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM coffee_shops ORDER BY name")
-            return [dict(row) for row in cursor.fetchall()]
+            return [Shop.from_row(row) for row in cursor.fetchall()]
+    
+    def get_data_version(self) -> Tuple:
+        """Get a cheap fingerprint of the coffee_shops table that changes when shops change"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # content_version is bumped by triggers on every insert, delete and content update
+            cursor.execute("""
+                SELECT (SELECT value FROM store_meta WHERE key = 'content_version'), COUNT(*)
+                FROM coffee_shops
+            """)
+            return tuple(cursor.fetchone())
     
-    def get_shop_by_id(self, shop_id: int) -> Optional[Dict]:
+    def get_shop_by_id(self, shop_id: int) -> Optional[Shop]:
         """Get a specific coffee shop by ID"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM coffee_shops WHERE id = ?", (shop_id,))
             row = cursor.fetchone()
-            return dict(row) if row else None
+            return Shop.from_row(row) if row else None
     
-    def get_shops_by_zip(self, zip_code: str) -> List[Dict]:
+    def get_shops_by_zip(self, zip_code: str) -> List[Shop]:
         """Get coffee shops by zip code"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM coffee_shops WHERE zip_code = ? ORDER BY rating DESC", (zip_code,))
-            return [dict(row) for row in cursor.fetchall()]
+            return [Shop.from_row(row) for row in cursor.fetchall()]
     
-    def get_shops_by_city(self, city: str) -> List[Dict]:
+    def get_shops_by_city(self, city: str) -> List[Shop]:
         """Get coffee shops by city"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM coffee_shops WHERE city LIKE ? ORDER BY rating DESC", (f"%{city}%",))
-            return [dict(row) for row in cursor.fetchall()]
+            return [Shop.from_row(row) for row in cursor.fetchall()]
     
-    def get_shops_by_state(self, state: str) -> List[Dict]:
+    def get_shops_by_state(self, state: str) -> List[Shop]:
         """Get coffee shops by state"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM coffee_shops WHERE state = ? ORDER BY rating DESC", (state,))
-            return [dict(row) for row in cursor.fetchall()]
+            return [Shop.from_row(row) for row in cursor.fetchall()]
     
-    def get_shops_by_rating(self, min_rating: float = 0.0) -> List[Dict]:
+    def get_shops_by_rating(self, min_rating: float = 0.0) -> List[Shop]:
         """Get coffee shops with minimum rating"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM coffee_shops WHERE rating >= ? ORDER BY rating DESC", (min_rating,))
-            return [dict(row) for row in cursor.fetchall()]
+            return [Shop.from_row(row) for row in cursor.fetchall()]
     
-    def search_shops(self, query: str) -> List[Dict]:
+    def search_shops(self, query: str) -> List[Shop]:
         """Search coffee shops by name, description, or city"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
@@ -102,9 +350,9 @@ class CoffeeShopDatabaseService:
                 WHERE name LIKE ? OR description LIKE ? OR city LIKE ?
                 ORDER BY rating DESC
             """, (search_term, search_term, search_term))
-            return [dict(row) for row in cursor.fetchall()]
+            return [Shop.from_row(row) for row in cursor.fetchall()]
     
-    def get_shops_near_location(self, lat: float, lng: float, radius_miles: float = 10.0) -> List[Dict]:
+    def get_shops_near_location(self, lat: float, lng: float, radius_miles: float = 10.0) -> List[Shop]:
         """Get coffee shops within a certain radius (approximate using bounding box)"""
         # Simple bounding box approximation (1 degree ≈ 69 miles)
         lat_range = radius_miles / 69.0
@@ -120,23 +368,56 @@ class CoffeeShopDatabaseService:
                 ORDER BY distance_sq
             """, (lat, lat, lng, lng, lat - lat_range, lat + lat_range, lng - lng_range, lng + lng_range))
             
-            shops = [dict(row) for row in cursor.fetchall()]
             # Filter by actual distance (more accurate)
             from geopy.distance import geodesic
             target_location = (lat, lng)
             
-            for shop in shops:
-                shop_location = (shop['lat'], shop['lng'])
-                shop['distance'] = round(geodesic(target_location, shop_location).miles, 2)
+            shops = []
+            for row in cursor.fetchall():
+                distance = round(geodesic(target_location, (row['lat'], row['lng'])).miles, 2)
+                # Filter by actual radius
+                if distance <= radius_miles:
+                    shops.append(Shop.from_row(row).replace(distance=distance))
             
-            # Filter by actual radius and sort
-            shops = [shop for shop in shops if shop['distance'] <= radius_miles]
             shops.sort(key=lambda x: x['distance'])
             
             return shops
     
+    def get_shops_in_bbox(self, south: float, west: float, north: float, east: float) -> List[Shop]:
+        """Get coffee shops inside a bounding box (served by idx_location)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM coffee_shops WHERE lat BETWEEN ? AND ? AND lng BETWEEN ? AND ?",
+                           (south, north, west, east))
+            return [Shop.from_row(row) for row in cursor.fetchall()]
+    
+    def get_location_totals(self, location_query: str) -> Tuple[float, float, int]:
+        """Sum of latitudes, sum of longitudes and count of the stored shops in a ZIP code or city"""
+        place = location_query.split(',')[0].strip()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT COALESCE(SUM(lat), 0), COALESCE(SUM(lng), 0), COUNT(*) FROM coffee_shops
+                WHERE zip_code = ? OR city = ? COLLATE NOCASE
+            """, (place, place))
+            return tuple(cursor.fetchone())
+    
+    def get_location_centroid(self, location_query: str) -> Optional[Tuple[float, float]]:
+        """Average position of the stored shops in a ZIP code or city ('Kailua, HI' matches Kailua)"""
+        lat_sum, lng_sum, count = self.get_location_totals(location_query)
+        return (lat_sum / count, lng_sum / count) if count else None
+    
     def get_statistics(self) -> Dict:
-        """Get statistics about the coffee shop data"""
+        """Get statistics about the coffee shop data (cached per data version)"""
+        version = self.get_data_version()
+        stats = self.statistics_cache.get(version)
+        if stats is None:
+            stats = self._compute_statistics()
+            self.statistics_cache.set(version, stats)
+        return stats
+    
+    def _compute_statistics(self) -> Dict:
+        """Compute statistics about the coffee shop data"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
@@ -254,12 +535,15 @@ class CoffeeShopDatabaseService:
                 cursor.execute("""
                     INSERT OR REPLACE INTO coffee_shops 
                     (name, address, city, state, zip_code, lat, lng, signature_drink, 
-                     rating, description, phone, hours, website)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                     rating, description, phone, hours, website, open_intervals)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
                     shop['name'], shop['address'], shop['city'], shop['state'],
                     shop['zip_code'], shop['lat'], shop['lng'], shop['signature_drink'],
-                    shop['rating'], shop['description'], shop['phone'], shop['hours'], shop['website']
+                    shop['rating'], shop['description'], shop['phone'], shop['hours'], shop['website'],
+                    encode_intervals(parse_hours_text(shop['hours']))
                 ))
             
-            print(f"Populated database with {len(hawaii_shops)} Hawaii coffee shops") 
\ No newline at end of file
+            print(f"Populated database with {len(hawaii_shops)} Hawaii coffee shops")
+        
+        self.tag_shops() 
\ No newline at end of file
@@ -0,0 +1,257 @@
+import os
+import re
+import sqlite3
+import time
+from collections import defaultdict
+from difflib import SequenceMatcher
+from math import floor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .geo_utils import haversine_miles
+
+# Words that vary between sources for the same shop ("Honolulu Coffee Co." / "Honolulu Coffee Company")
+NAME_STOPWORDS = {'the', 'and', 'co', 'company', 'inc', 'llc', 'ltd', 'cafe', 'coffee', 'shop', 'house', 'bar'}
+ADDRESS_ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'road': 'rd', 'boulevard': 'blvd', 'highway': 'hwy', 'drive': 'dr',
+    'lane': 'ln', 'place': 'pl', 'parkway': 'pkwy', 'court': 'ct', 'suite': 'ste', 'east': 'e', 'west': 'w',
+    'north': 'n', 'south': 's'
+}
+# Weight of each field in the match score; fields missing on either side are left out
+SCORE_WEIGHTS = {'name': 0.45, 'address': 0.25, 'phone': 0.15, 'distance': 0.15}
+
+def _words(text: Optional[str]) -> List[str]:
+    return re.findall(r"[a-z0-9]+", (text or '').lower().replace("'", ''))
+
+def normalize_name(name: Optional[str]) -> str:
+    """Name with punctuation, case and generic business words removed"""
+    words = _words(name)
+    kept = [word for word in words if word not in NAME_STOPWORDS]
+    return ' '.join(kept or words)
+
+def normalize_address(address: Optional[str]) -> str:
+    """Street address with case, punctuation and common suffix spellings normalized"""
+    return ' '.join(ADDRESS_ABBREVIATIONS.get(word, word) for word in _words(address))
+
+def normalize_phone(phone: Optional[str]) -> str:
+    """Last ten digits of a phone number ('' when there are too few digits to compare)"""
+    digits = re.sub(r"\D", '', str(phone or ''))[-10:]
+    return digits if len(digits) == 10 else ''
+
+class EntityResolutionService:
+    def __init__(self, db_service, data_service=None, links_path: str = None, cell_size_degrees: float = 0.005,
+                 match_threshold: float = None):
+        """Link the CSV, SQLite and Yelp records of the same shop to one entity id
+
+        Candidates come from blocking keys (grid cell and its neighbours, normalized name, phone),
+        so each record is only scored against a handful of others. Links are kept in a mapping
+        table, so each run only resolves records that have not been linked before.
+        """
+        self.db_service = db_service
+        self.data_service = data_service
+        self.links_path = links_path or os.getenv('ENTITY_LINKS_PATH', 'database/shop_links.db')
+        self.cell_size = cell_size_degrees  # ~0.35 miles
+        self.resolution_config = {
+            'match_threshold': match_threshold or float(os.getenv('ENTITY_MATCH_THRESHOLD', 0.8)),
+            # Branches of a chain share name and phone; records this far apart are never the same shop
+            'max_link_miles': 1.0,
+            # Scores fall to zero at this distance
+            'distance_scale_miles': 0.5,
+            # Name and phone blocks bigger than this (chains) are skipped; their grid cells still pair them
+            'max_block_size': 50
+        }
+
+        os.makedirs(os.path.dirname(self.links_path) or '.', exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shop_links (
+                    source TEXT NOT NULL,
+                    source_id TEXT NOT NULL,
+                    entity_id INTEGER NOT NULL,
+                    score REAL NOT NULL,
+                    linked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (source, source_id)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_shop_links_entity ON shop_links(entity_id)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.links_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _record(self, source: str, source_id, shop) -> Dict:
+        """Normalized comparison fields of one shop record"""
+        name = normalize_name(shop.get('name'))
+        lat, lng = shop.get('lat'), shop.get('lng')
+        if lat != lat or lng != lng:  # NaN from unparseable CSV coordinates
+            lat = lng = None
+        return {
+            'key': (source, str(source_id)),
+            'yelp_id': shop.get('yelp_id'),
+            'name': name,
+            'name_words': set(name.split()),
+            'address': normalize_address(shop.get('address')),
+            'phone': normalize_phone(shop.get('phone')),
+            'lat': lat,
+            'lng': lng
+        }
+
+    def yelp_record(self, business: Dict) -> Dict:
+        """Comparison record of a raw Yelp business payload"""
+        location = business.get('location') or {}
+        coordinates = business.get('coordinates') or {}
+        return self._record('yelp', business['id'], {
+            'name': business.get('name'), 'address': location.get('address1'), 'phone': business.get('phone'),
+            'lat': coordinates.get('latitude'), 'lng': coordinates.get('longitude')})
+
+    def load_records(self, yelp_businesses: Iterable[Dict] = ()) -> List[Dict]:
+        """Records from every source: the CSV dataset, stored shops and any raw Yelp payloads"""
+        records = []
+        if self.data_service is not None:
+            records.extend(self._record('csv', shop['id'], shop) for shop in self.data_service.get_all_shops())
+        records.extend(self._record('sqlite', shop['id'], shop) for shop in self.db_service.get_all_shops())
+        records.extend(self.yelp_record(business) for business in yelp_businesses if business.get('id'))
+        return records
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return floor(lat / self.cell_size), floor(lng / self.cell_size)
+
+    def _build_blocks(self, records: List[Dict]) -> Dict[Tuple, List[int]]:
+        """Blocking index: grid cell, normalized name and phone -> record positions"""
+        blocks = defaultdict(list)
+        for position, record in enumerate(records):
+            if record['lat'] is not None and record['lng'] is not None:
+                blocks[('cell',) + self._cell(record['lat'], record['lng'])].append(position)
+            if record['name']:
+                blocks[('name', record['name'])].append(position)
+            if record['phone']:
+                blocks[('phone', record['phone'])].append(position)
+        return blocks
+
+    def _candidates(self, record: Dict, blocks: Dict[Tuple, List[int]]) -> set:
+        candidates = set()
+        if record['lat'] is not None and record['lng'] is not None:
+            row, column = self._cell(record['lat'], record['lng'])
+            for d_row in (-1, 0, 1):
+                for d_column in (-1, 0, 1):
+                    candidates.update(blocks.get(('cell', row + d_row, column + d_column), ()))
+        for key in (('name', record['name']), ('phone', record['phone'])):
+            block = blocks.get(key, ()) if key[1] else ()
+            if len(block) <= self.resolution_config['max_block_size']:
+                candidates.update(block)
+        return candidates
+
+    def score(self, a: Dict, b: Dict) -> float:
+        """Similarity of two records in [0, 1] from name, address, phone and distance"""
+        parts = {}
+        if a['lat'] is not None and b['lat'] is not None:
+            distance = haversine_miles(a['lat'], a['lng'], b['lat'], b['lng'])
+            if distance > self.resolution_config['max_link_miles']:
+                return 0.0
+            parts['distance'] = max(0.0, 1 - distance / self.resolution_config['distance_scale_miles'])
+        if a['name'] and b['name']:
+            overlap = len(a['name_words'] & b['name_words']) / len(a['name_words'] | b['name_words'])
+            parts['name'] = max(overlap, SequenceMatcher(None, a['name'], b['name']).ratio())
+        if a['address'] and b['address']:
+            parts['address'] = SequenceMatcher(None, a['address'], b['address']).ratio()
+        if a['phone'] and b['phone']:
+            parts['phone'] = 1.0 if a['phone'] == b['phone'] else 0.0
+        if 'name' not in parts:
+            return 0.0
+        weight = sum(SCORE_WEIGHTS[field] for field in parts)
+        return sum(SCORE_WEIGHTS[field] * value for field, value in parts.items()) / weight
+
+    def get_links(self) -> Dict[Tuple[str, str], int]:
+        with self._connection() as conn:
+            return {(row['source'], row['source_id']): row['entity_id']
+                    for row in conn.execute("SELECT source, source_id, entity_id FROM shop_links")}
+
+    def resolve(self, yelp_businesses: Iterable[Dict] = (), full: bool = False) -> Dict:
+        """Link records that have no entity yet (every record when full) and persist the links
+
+        A new record joins the entity of its best match above the threshold, or starts a new one.
+        A record matching several entities merges them into the lowest entity id.
+        """
+        started = time.time()
+        if full:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM shop_links")
+        records = self.load_records(yelp_businesses)
+        links = self.get_links()
+        blocks = self._build_blocks(records)
+        next_entity = max(links.values(), default=0) + 1
+        threshold = self.resolution_config['match_threshold']
+        stats = {'records': len(records), 'new_records': 0, 'linked': 0, 'new_entities': 0, 'merged_entities': 0,
+                 'comparisons': 0}
+        new_links, merges = [], {}
+
+        def final_entity(entity):
+            while entity in merges:
+                entity = merges[entity]
+            return entity
+
+        for position, record in enumerate(records):
+            if record['key'] in links:
+                continue
+            stats['new_records'] += 1
+            best_score, matched = 0.0, set()
+            for candidate in self._candidates(record, blocks):
+                other = records[candidate]
+                # Unlinked candidates are compared when their own turn comes
+                if candidate == position or other['key'] not in links:
+                    continue
+                stats['comparisons'] += 1
+                score = self.score(record, other)
+                if score >= threshold:
+                    matched.add(final_entity(links[other['key']]))
+                    best_score = max(best_score, score)
+
+            if matched:
+                entity = min(matched)
+                for other_entity in matched - {entity}:
+                    merges[other_entity] = entity
+                stats['linked'] += 1
+            else:
+                entity, best_score = next_entity, 1.0
+                next_entity += 1
+                stats['new_entities'] += 1
+            links[record['key']] = entity
+            new_links.append((record['key'], entity, round(best_score, 4)))
+            # Stored Yelp-backed shops and their raw payloads share the Yelp business id
+            if record['yelp_id'] and ('yelp', record['yelp_id']) not in links:
+                links[('yelp', record['yelp_id'])] = entity
+                new_links.append((('yelp', record['yelp_id']), entity, 1.0))
+
+        with self._connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO shop_links (source, source_id, entity_id, score) VALUES (?, ?, ?, ?)",
+                             [(key[0], key[1], entity, score) for key, entity, score in new_links])
+            conn.executemany("UPDATE shop_links SET entity_id = ? WHERE entity_id = ?",
+                             [(final_entity(entity), merged) for merged, entity in merges.items()])
+        stats['merged_entities'] = len(merges)
+        stats['elapsed_seconds'] = round(time.time() - started, 2)
+        return stats
+
+    def get_entity(self, source: str, source_id) -> List[Dict]:
+        """Every record linked to the same shop as (source, source_id)"""
+        with self._connection() as conn:
+            rows = conn.execute("""
+                SELECT source, source_id, entity_id, score FROM shop_links
+                WHERE entity_id = (SELECT entity_id FROM shop_links WHERE source = ? AND source_id = ?)
+                ORDER BY source, source_id
+            """, (source, str(source_id))).fetchall()
+            return [dict(row) for row in rows]
+
+    def get_duplicates(self, source: str = 'sqlite', limit: int = 100) -> List[Dict]:
+        """Entities holding more than one record of a source (duplicate rows to merge)"""
+        with self._connection() as conn:
+            rows = conn.execute("""
+                SELECT entity_id, GROUP_CONCAT(source_id) AS source_ids FROM shop_links
+                WHERE source = ? GROUP BY entity_id HAVING COUNT(*) > 1 ORDER BY entity_id LIMIT ?
+            """, (source, limit)).fetchall()
+            return [{'entity_id': row['entity_id'], 'source_ids': row['source_ids'].split(',')} for row in rows]
+
+    def get_statistics(self) -> Dict:
+        with self._connection() as conn:
+            entities, records = conn.execute("SELECT COUNT(DISTINCT entity_id), COUNT(*) FROM shop_links").fetchone()
+            by_source = {row[0]: row[1] for row in conn.execute("SELECT source, COUNT(*) FROM shop_links GROUP BY source")}
+        return {'entities': entities, 'records': records, 'records_by_source': by_source}
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Optional
+
+from .geo_utils import haversine_miles
+
+# Built-in policy, used when the policy file is missing; a policy file only needs the keys it changes
+DEFAULT_POLICY = {
+    'version': 0,
+    'primary_categories': ['coffee', 'coffeeroasteries', 'cafes'],
+    # Shops without a coffee word in their name still pass with one of these categories
+    'strong_categories': ['coffeeroasteries', 'coffee'],
+    'excluded_categories': ['restaurants', 'bakeries', 'breakfast_brunch', 'sandwiches', 'pizza', 'burgers', 'food'],
+    'name_keywords': ['coffee', 'cafe', 'brew', 'drip', 'roast', 'espresso', 'latte', 'speciality', 'specialty'],
+    'business_name_patterns': [r'\bcoffee\b', r'\bcafe\b', r'\bbrew\b', r'\bdrip\b', r'\broast\b', r'\bespresso\b',
+                               r'\blatte\b', r'\bspeciality\b', r'\bspecialty\b'],
+    'min_review_count': 80,
+    'min_rating': 4.2,
+    'price_range': ['$', '$$', '$$$'],  # Exclude $$$$ (too expensive)
+    # Shops matching no name keyword or pattern need this rating and review count
+    'fallback_min_rating': 4.5,
+    'fallback_min_review_count': 150,
+    'max_results': 20
+}
+
+# Rules in the order they are checked; a rejected shop is attributed to the first rule it fails
+FILTER_RULES = ('min_review_count', 'min_rating', 'outside_radius', 'price_range', 'excluded_category',
+                'no_primary_category', 'no_coffee_keyword', 'weak_name_match')
+
+class FilterPolicy:
+    def __init__(self, config: Dict):
+        """Compile a validated policy (see from_dict) into sets and one name regex"""
+        self.config = config
+        canonical = json.dumps(config, sort_keys=True).encode('utf-8')
+        self.version = f"{config['version']}-{hashlib.sha1(canonical).hexdigest()[:8]}"
+        self.primary_categories = frozenset(config['primary_categories'])
+        self.strong_categories = frozenset(config['strong_categories'])
+        self.excluded_categories = frozenset(config['excluded_categories'])
+        self.price_range = frozenset(config['price_range'])
+        self.name_keywords = tuple(keyword.lower() for keyword in config['name_keywords'])
+        self.name_pattern = re.compile('|'.join(f"(?:{pattern})" for pattern in config['business_name_patterns']),
+                                       re.IGNORECASE) if config['business_name_patterns'] else None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'FilterPolicy':
+        """Build a policy from DEFAULT_POLICY overridden by data; raises ValueError on a bad policy"""
+        if not isinstance(data, dict):
+            raise ValueError("Filter policy must be a JSON object")
+        unknown = set(data) - set(DEFAULT_POLICY)
+        if unknown:
+            raise ValueError(f"Unknown filter policy keys: {', '.join(sorted(unknown))}")
+        config = dict(DEFAULT_POLICY, **data)
+        for key, default in DEFAULT_POLICY.items():
+            if isinstance(default, list):
+                if not isinstance(config[key], list) or not all(isinstance(item, str) for item in config[key]):
+                    raise ValueError(f"{key} must be a list of strings")
+            elif not isinstance(config[key], (int, float)) or isinstance(config[key], bool):
+                raise ValueError(f"{key} must be a number")
+        try:
+            return cls(config)
+        except re.error as e:
+            raise ValueError(f"Invalid business_name_patterns: {e}") from None
+
+    def failed_rules(self, business: Dict, search_lat: float = None, search_lng: float = None,
+                     radius_miles: float = None) -> Iterator[str]:
+        """Yield every rule a Yelp business fails, in FILTER_RULES order"""
+        config = self.config
+        rating = business.get('rating', 0)
+        review_count = business.get('review_count', 0)
+        if review_count < config['min_review_count']:
+            yield 'min_review_count'
+        if rating < config['min_rating']:
+            yield 'min_rating'
+
+        # Distance from the search center is more reliable than Yelp's distance field
+        coordinates = business.get('coordinates') or {}
+        business_lat, business_lng = coordinates.get('latitude'), coordinates.get('longitude')
+        if business_lat and business_lng and search_lat and search_lng and radius_miles is not None:
+            if haversine_miles(search_lat, search_lng, business_lat, business_lng) > radius_miles:
+                yield 'outside_radius'
+
+        price = business.get('price', '')
+        if price and price not in self.price_range:
+            yield 'price_range'
+
+        category_aliases = {category.get('alias', '') for category in business.get('categories', [])}
+        if category_aliases & self.excluded_categories:
+            yield 'excluded_category'
+        if not category_aliases & self.primary_categories:
+            yield 'no_primary_category'
+
+        business_name = business.get('name', '').lower()
+        has_coffee_keyword = any(keyword in business_name for keyword in self.name_keywords)
+        if not has_coffee_keyword and not category_aliases & self.strong_categories:
+            yield 'no_coffee_keyword'
+        has_name_pattern = bool(self.name_pattern and self.name_pattern.search(business_name))
+        if not has_name_pattern and not has_coffee_keyword:
+            if rating < config['fallback_min_rating'] or review_count < config['fallback_min_review_count']:
+                yield 'weak_name_match'
+
+    def rejection(self, business: Dict, search_lat: float = None, search_lng: float = None,
+                  radius_miles: float = None) -> Optional[str]:
+        """First rule a business fails, or None if it passes"""
+        return next(self.failed_rules(business, search_lat, search_lng, radius_miles), None)
+
+    def apply(self, businesses: List[Dict], search_lat: float = None, search_lng: float = None,
+              radius_miles: float = None) -> List[Dict]:
+        """Businesses that pass every rule"""
+        failed_rules = self.failed_rules
+        return [business for business in businesses
+                if next(failed_rules(business, search_lat, search_lng, radius_miles), None) is None]
+
+    def report(self, businesses: List[Dict], search_lat: float = None, search_lng: float = None,
+               radius_miles: float = None) -> Dict:
+        """Dry run: how many businesses each rule removes (first failing rule) and fails overall"""
+        removed_by, fails = Counter(), Counter()
+        for business in businesses:
+            failed = list(self.failed_rules(business, search_lat, search_lng, radius_miles))
+            if failed:
+                removed_by[failed[0]] += 1
+                fails.update(failed)
+        return {
+            'candidates': len(businesses),
+            'kept': len(businesses) - sum(removed_by.values()),
+            'removed_by': {rule: removed_by[rule] for rule in FILTER_RULES},
+            'fails': {rule: fails[rule] for rule in FILTER_RULES}
+        }
+
+class FilterPolicyStore:
+    def __init__(self, path: str = None, check_interval: float = None):
+        """Serve the filter policy from a JSON file, reloading it when the file changes
+
+        A policy file that fails validation is reported and ignored; the previous policy stays active.
+        """
+        self.path = path or os.getenv('FILTER_POLICY_PATH', 'data/filter_policy.json')
+        self.check_interval = check_interval if check_interval is not None else float(os.getenv('FILTER_POLICY_CHECK_SECONDS', 5))
+        self._policy = FilterPolicy.from_dict({})
+        self._mtime = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.last_error = None
+        self._check(force=True)
+
+    def current(self) -> FilterPolicy:
+        """The active policy (the file is checked for changes at most every check_interval)"""
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self._check()
+        return self._policy
+
+    def _check(self, force: bool = False):
+        with self._lock:
+            if not force and time.monotonic() - self._last_check < self.check_interval:
+                return
+            self._last_check = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime == self._mtime and not force:
+                return
+            self._mtime = mtime
+            if mtime is None:
+                return
+            try:
+                with open(self.path, 'r') as f:
+                    policy = FilterPolicy.from_dict(json.load(f))
+            except (OSError, ValueError) as e:
+                self.last_error = f"{self.path}: {e}"
+                print(f"Filter policy not reloaded: {self.last_error}")
+                return
+            if policy.version != self._policy.version:
+                self._policy = policy
+                self.reloads += 1
+                print(f"Filter policy {policy.version} loaded from {self.path}")
+            self.last_error = None
+
+    def get_statistics(self) -> Dict:
+        policy = self.current()
+        return {
+            'path': self.path,
+            'version': policy.version,
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+            'config': policy.config
+        }
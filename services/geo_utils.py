@@ -0,0 +1,130 @@
+from math import radians, degrees, cos, sin, asin, sqrt, log, tan, pi, atan, sinh
+from typing import List, Tuple
+
+EARTH_RADIUS_MILES = 3956  # Same radius the Yelp filtering has always used
+MILES_PER_DEGREE_LAT = 69.0
+TILE_SIZE = 256  # Web Mercator tile size in pixels
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def haversine_miles(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in miles (Haversine formula)"""
+    lat1, lon1 = radians(lat1), radians(lng1)
+    lat2, lon2 = radians(lat2), radians(lng2)
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+    return EARTH_RADIUS_MILES * c
+
+def bounding_box(lat: float, lng: float, radius_miles: float) -> Tuple[float, float, float, float]:
+    """Return (south, west, north, east) enclosing a circle of radius_miles"""
+    lat_range = radius_miles / MILES_PER_DEGREE_LAT
+    # Longitude degrees shrink with latitude; clamp so the poles don't divide by zero
+    lng_range = radius_miles / (MILES_PER_DEGREE_LAT * max(cos(radians(lat)), 0.01))
+    return (lat - lat_range, lng - lng_range, lat + lat_range, lng + lng_range)
+
+def geohash_encode(lat: float, lng: float, precision: int) -> str:
+    """Geohash of a coordinate with precision characters (5 bits each, longitude bit first)"""
+    south, north, west, east = -90.0, 90.0, -180.0, 180.0
+    chars = []
+    bit_count = value = 0
+    use_lng = True
+    while len(chars) < precision:
+        if use_lng:
+            middle = (west + east) / 2
+            value = value * 2 + (lng >= middle)
+            west, east = (middle, east) if lng >= middle else (west, middle)
+        else:
+            middle = (south + north) / 2
+            value = value * 2 + (lat >= middle)
+            south, north = (middle, north) if lat >= middle else (south, middle)
+        use_lng = not use_lng
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bit_count = value = 0
+    return ''.join(chars)
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """Return (south, west, north, east) of a geohash cell"""
+    south, north, west, east = -90.0, 90.0, -180.0, 180.0
+    use_lng = True
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if use_lng:
+                middle = (west + east) / 2
+                west, east = (middle, east) if bit else (west, middle)
+            else:
+                middle = (south + north) / 2
+                south, north = (middle, north) if bit else (south, middle)
+            use_lng = not use_lng
+    return (south, west, north, east)
+
+def lat_lng_to_world_pixel(lat: float, lng: float, zoom: int) -> Tuple[float, float]:
+    """Project a coordinate to Web Mercator pixel space at the given zoom level"""
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    scale = TILE_SIZE * (2 ** zoom)
+    x = (lng + 180.0) / 360.0 * scale
+    y = (1.0 - log(tan(radians(lat)) + 1.0 / cos(radians(lat))) / pi) / 2.0 * scale
+    return x, y
+
+def lat_lng_to_tile(lat: float, lng: float, zoom: int) -> Tuple[int, int]:
+    """Return the (x, y) Web Mercator tile containing a coordinate"""
+    x, y = lat_lng_to_world_pixel(lat, lng, zoom)
+    max_index = 2 ** zoom - 1
+    return (min(int(x // TILE_SIZE), max_index), min(int(y // TILE_SIZE), max_index))
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Return (south, west, north, east) of a Web Mercator (slippy map) tile"""
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = degrees(atan(sinh(pi * (1 - 2 * y / n))))
+    south = degrees(atan(sinh(pi * (1 - 2 * (y + 1) / n))))
+    return (south, west, north, east)
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[Tuple[float, float]]:
+    """Decode an encoded polyline (Google polyline algorithm) into (lat, lng) points"""
+    points = []
+    index = lat = lng = 0
+    factor = 10 ** precision
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                if index >= len(encoded):
+                    raise ValueError("Truncated polyline")
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+    return points
+
+def project_onto_segment(lat: float, lng: float, start: Tuple[float, float],
+                         end: Tuple[float, float]) -> Tuple[float, float, float]:
+    """Project a point onto a short segment using a local flat approximation
+
+    Returns (fraction along the segment, offset from it in miles, segment length in miles).
+    """
+    miles_per_degree_lng = MILES_PER_DEGREE_LAT * cos(radians(start[0]))
+    segment_x = (end[1] - start[1]) * miles_per_degree_lng
+    segment_y = (end[0] - start[0]) * MILES_PER_DEGREE_LAT
+    point_x = (lng - start[1]) * miles_per_degree_lng
+    point_y = (lat - start[0]) * MILES_PER_DEGREE_LAT
+
+    length_sq = segment_x * segment_x + segment_y * segment_y
+    fraction = 0.0
+    if length_sq > 0:
+        fraction = max(0.0, min(1.0, (point_x * segment_x + point_y * segment_y) / length_sq))
+    offset = sqrt((point_x - fraction * segment_x) ** 2 + (point_y - fraction * segment_y) ** 2)
+    return fraction, offset, sqrt(length_sq)
@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from .opening_hours import OPEN_NOW, OpeningHoursIndex, decode_intervals, minute_of_week, now_in, timezone_name
+from .shop import Shop
+
+class HoursIndexService:
+    def __init__(self, db_service, refresh_interval: float = None):
+        """Initialize the weekly opening-hours index over stored shops"""
+        self.db_service = db_service
+        self.refresh_interval = refresh_interval if refresh_interval is not None else float(os.getenv('HOURS_INDEX_REFRESH_SECONDS', 30))
+        # (data version, OpeningHoursIndex), swapped in as a whole
+        self._state = None
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+
+    def _get_index(self) -> OpeningHoursIndex:
+        """Return the index, rebuilding it when the underlying store has changed"""
+        state = self._state
+        now = time.monotonic()
+        if state is not None and now - self._last_check < self.refresh_interval:
+            return state[1]
+
+        with self._lock:
+            self._last_check = now
+            version = self.db_service.get_data_version()
+            if self._state is None or self._state[0] != version:
+                self._state = (version, self._load())
+            return self._state[1]
+
+    def _load(self) -> OpeningHoursIndex:
+        """Build the index from the open_intervals column (shops with unknown hours are left out)"""
+        entries = []
+        for shop in self.db_service.get_all_open_intervals():
+            intervals = decode_intervals(shop['open_intervals'])
+            if intervals:
+                # Search results identify stored shops by their Yelp id
+                entries.append(((shop['id'], shop['yelp_id']), intervals))
+        return OpeningHoursIndex(entries)
+
+    def reload(self, *args):
+        """Drop the index so it is rebuilt from the store on next use"""
+        self._state = None
+
+    def filter_shops(self, shops: List[Dict], minute) -> Tuple[List[Shop], int]:
+        """Drop shops closed at a minute of the week, or at OPEN_NOW in each shop's own timezone
+
+        Kept shops are flagged open=True, or open=None when their hours are unknown (every Yelp
+        search result and shop without stored hours); returns them with the count of unknown ones.
+        """
+        index = self._get_index()
+        minutes = {}     # OPEN_NOW: timezone -> its current minute of the week
+        open_bytes = {}  # minute -> open shops bitset
+        kept, unknown = [], 0
+        for shop in shops:
+            shop_minute = minute
+            if minute == OPEN_NOW:
+                zone = timezone_name(shop.get('lat'), shop.get('lng'))
+                if zone not in minutes:
+                    minutes[zone] = minute_of_week(now_in(zone))
+                shop_minute = minutes[zone]
+            if shop_minute not in open_bytes:
+                open_bytes[shop_minute] = index.open_bytes(shop_minute)
+            is_open = index.is_open(shop.get('id'), shop_minute, open_bytes[shop_minute])
+            if is_open is None:
+                unknown += 1
+            elif not is_open:
+                continue
+            kept.append(Shop.from_record(shop).replace(open=is_open))
+        return kept, unknown
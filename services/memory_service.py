@@ -0,0 +1,156 @@
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Sequence
+
+# Containers whose items are followed when sizing a cached value
+_CONTAINERS = (dict, list, tuple, set, frozenset)
+# Leaf types that never reference other objects
+_ATOMIC = (str, bytes, int, float, bool, type(None))
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """Approximate bytes held by an object and everything it references (shared objects counted once)
+
+    Follows containers, instance dicts and __slots__ (Shop records); other objects count shallowly.
+    """
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, _ATOMIC):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, _CONTAINERS):
+            stack.extend(current)
+        else:
+            if hasattr(current, '__dict__'):
+                stack.append(current.__dict__)
+            for cls in type(current).__mro__:
+                for slot in getattr(cls, '__slots__', ()):
+                    value = getattr(current, slot, None)
+                    if value is not None:
+                        stack.append(value)
+    return size
+
+def process_rss_bytes() -> Optional[int]:
+    """Resident set size of this process (None where it cannot be read)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current RSS; kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class MemoryService:
+    def __init__(self, root_dir: str = None, sample_size: int = None, top_limit: int = 25):
+        """Report memory held by the service caches and diff tracemalloc snapshots of our own code
+
+        Snapshots are filtered to allocations made in services/ and app.py under root_dir.
+        """
+        self.root_dir = os.path.abspath(root_dir or os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        # Caches with more entries than this are sized from a random sample
+        self.sample_size = sample_size or int(os.getenv('MEMORY_SAMPLE_SIZE', 200))
+        self.top_limit = top_limit
+        self._baseline = None
+        self._baseline_at = None
+        self._started_tracing = False
+        self._lock = threading.Lock()
+
+    def cache_usage(self, cache) -> Dict:
+        """Entry count and approximate bytes of one cache"""
+        usage = cache.get_statistics()
+        usage.update(cache.memory_usage(self.sample_size))
+        return usage
+
+    def report(self, caches: List) -> Dict:
+        """Per-cache usage plus process RSS and tracing state"""
+        cache_usage = [self.cache_usage(cache) for cache in caches]
+        return {
+            'pid': os.getpid(),
+            'rss_bytes': process_rss_bytes(),
+            'caches': cache_usage,
+            'cache_bytes': sum(usage['approximate_bytes'] for usage in cache_usage
+                               if usage.get('storage') == 'memory'),
+            'tracemalloc': self.tracing_status()
+        }
+
+    def tracing_status(self) -> Dict:
+        status = {'tracing': tracemalloc.is_tracing(), 'baseline_at': self._baseline_at}
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            status.update({'traced_bytes': current, 'peak_traced_bytes': peak,
+                           'overhead_bytes': tracemalloc.get_tracemalloc_memory()})
+        return status
+
+    def _filtered_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(True, os.path.join(self.root_dir, 'services', '*')),
+            tracemalloc.Filter(True, os.path.join(self.root_dir, 'app.py'))
+        ))
+
+    def start_tracing(self, frames: int = 1) -> Dict:
+        """Start tracemalloc (if needed) and take the baseline snapshot later diffs compare against"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, frames))
+                self._started_tracing = True
+            self._baseline = self._filtered_snapshot()
+            self._baseline_at = time.time()
+        return self.tracing_status()
+
+    def stop_tracing(self) -> Dict:
+        """Stop tracemalloc (when started here) and drop the baseline"""
+        with self._lock:
+            if self._started_tracing and tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self._started_tracing = False
+            self._baseline = self._baseline_at = None
+        return self.tracing_status()
+
+    def diff(self, limit: int = None, key_type: str = 'lineno', rebase: bool = False) -> Dict:
+        """Top allocation sites by growth since the baseline snapshot
+
+        Raises RuntimeError when tracing was not started. With rebase, the new snapshot becomes the baseline.
+        """
+        with self._lock:
+            if self._baseline is None or not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc is not running (start it first)")
+            snapshot = self._filtered_snapshot()
+            baseline, baseline_at = self._baseline, self._baseline_at
+            if rebase:
+                self._baseline, self._baseline_at = snapshot, time.time()
+
+        stats = snapshot.compare_to(baseline, key_type)
+        return {
+            'baseline_at': baseline_at,
+            'seconds': round(time.time() - baseline_at, 1),
+            'size_diff_bytes': sum(stat.size_diff for stat in stats),
+            'top': [{
+                'site': ' <- '.join(f"{os.path.relpath(frame.filename, self.root_dir)}:{frame.lineno}"
+                                    for frame in stat.traceback),
+                'size_bytes': stat.size,
+                'size_diff_bytes': stat.size_diff,
+                'count': stat.count,
+                'count_diff': stat.count_diff
+            } for stat in stats[:limit or self.top_limit]]
+        }
+
+def sample_values(values: Sequence, sample_size: int) -> Sequence:
+    """Values to size for a cache: all of them, or a random sample of sample_size"""
+    return values if len(values) <= sample_size else random.sample(values, sample_size)
@@ -1,11 +1,49 @@
 import re
 import json
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional
 from collections import Counter
+import os
+from .cache_service import create_cache
+from .shop import Shop
+from .ranking_service import RankingService
+
+# Review themes: a theme is praised once at least min_terms distinct terms have been mentioned
+REVIEW_THEMES = {
+    'quality': {
+        'terms': ['amazing', 'delicious', 'best', 'great', 'excellent', 'outstanding'],
+        'min_terms': 3,
+        'label': 'exceptional coffee quality'
+    },
+    'service': {
+        'terms': ['friendly', 'helpful', 'knowledgeable', 'attentive'],
+        'min_terms': 2,
+        'label': 'excellent service'
+    },
+    'atmosphere': {
+        'terms': ['cozy', 'welcoming', 'relaxing', 'beautiful'],
+        'min_terms': 2,
+        'label': 'great atmosphere'
+    },
+    'value': {
+        'terms': ['worth', 'reasonable', 'fair', 'good value'],
+        'min_terms': 2,
+        'label': 'good value'
+    }
+}
+
+# Tags derived from the shop name at ingest; they stand in for _analyze_shop_name's flags
+NAME_FLAG_TAGS = {
+    'is_roastery': 'roastery',
+    'is_cafe': 'cafe',
+    'is_specialty': 'specialty',
+    'is_brew': 'brew',
+    'is_coffee': 'coffee'
+}
 
 class NLPSummaryService:
-    def __init__(self):
+    def __init__(self, ranking_service: RankingService = None):
         """Initialize NLP summary service"""
+        self.ranking_service = ranking_service or RankingService()
         # Common coffee-related keywords and phrases
         self.coffee_keywords = [
             'coffee', 'espresso', 'latte', 'cappuccino', 'americano', 'mocha',
@@ -35,8 +73,25 @@ class NLPSummaryService:
             'dessert', 'cake', 'cookie', 'muffin', 'croissant',
             'avocado toast', 'acai bowl', 'smoothie', 'tea'
         ]
+        
+        # Summaries only depend on the fields in _summary_cache_key
+        self.summary_cache = create_cache('summary', max_entries=int(os.getenv('SUMMARY_CACHE_MAX_ENTRIES', 5000)),
+                                          ttl_seconds=float(os.getenv('SUMMARY_CACHE_TTL', 86400)))
     
     def generate_shop_summary(self, shop_data: Dict) -> str:
+        """Generate a natural language summary for a coffee shop (cached)"""
+        cache_key = self._summary_cache_key(shop_data)
+        summary = self.summary_cache.get(cache_key)
+        if summary is None:
+            summary = self._build_shop_summary(shop_data)
+            self.summary_cache.set(cache_key, summary)
+        return summary
+    
+    def _summary_cache_key(self, shop_data: Dict) -> tuple:
+        return (shop_data.get('id'), shop_data.get('name', ''), shop_data.get('rating', 0),
+                shop_data.get('review_count', 0), shop_data.get('price', ''), shop_data.get('description', ''))
+    
+    def _build_shop_summary(self, shop_data: Dict) -> str:
         """Generate a natural language summary for a coffee shop"""
         try:
             # Extract key information
@@ -46,8 +101,12 @@ class NLPSummaryService:
             description = shop_data.get('description', '')
             price = shop_data.get('price', '')
             
-            # Analyze the shop name for characteristics
-            name_analysis = self._analyze_shop_name(name)
+            # Use the name flags precomputed as tags at ingest when available
+            tags = shop_data.get('tags')
+            if tags is not None:
+                name_analysis = {flag: tag in tags for flag, tag in NAME_FLAG_TAGS.items()}
+            else:
+                name_analysis = self._analyze_shop_name(name)
             
             # Create a structured summary
             summary_parts = []
@@ -136,6 +195,23 @@ class NLPSummaryService:
             'has_location': any(word in name_lower for word in ['honolulu', 'hawaii', 'hi', 'oahu'])
         }
     
+    def derive_tags(self, shop_data: Dict) -> List[str]:
+        """Derive facet tags for a shop: name flags plus coffee/atmosphere/food keywords"""
+        name = shop_data.get('name') or ''
+        name_analysis = self._analyze_shop_name(name)
+        tags = {tag for flag, tag in NAME_FLAG_TAGS.items() if name_analysis[flag]}
+        
+        category_titles = ' '.join(category.get('title', '') for category in shop_data.get('categories') or [])
+        text = f"{name} {shop_data.get('description') or ''} {category_titles}".lower()
+        name_tags = set(NAME_FLAG_TAGS.values())
+        for keyword in self.coffee_keywords + self.atmosphere_keywords + self.food_keywords:
+            tag = keyword.replace(' ', '-')
+            # Name flag tags only ever come from the name so they match _analyze_shop_name
+            if tag not in name_tags and keyword in text:
+                tags.add(tag)
+        
+        return sorted(tags)
+    
     def _generate_atmosphere_notes(self, name: str, description: str) -> str:
         """Generate notes about atmosphere based on name and description"""
         text = f"{name} {description}".lower()
@@ -179,62 +255,51 @@ class NLPSummaryService:
     
     def generate_top_shops_summary(self, shops: List[Dict], top_count: int = 3) -> Dict:
         """Generate summaries for the top-rated coffee shops"""
+        return {
+            'top_shops': list(self.iter_top_shop_summaries(shops, top_count)),
+            'all_shops_count': len(shops)
+        }
+    
+    def iter_top_shop_summaries(self, shops: List[Dict], top_count: int = 3) -> Iterator[Shop]:
+        """Yield the top-rated shops, best first, each as soon as its summary is generated"""
         if not shops:
-            return {
-                'top_shops': [],
-                'all_shops_count': 0
-            }
+            return
         
-        # Sort shops by rating (highest first), then by review count
-        sorted_shops = sorted(shops, key=lambda x: (x.get('rating', 0), x.get('review_count', 0)), reverse=True)
+        # Reuse the scores assigned at the filter stage; shops from other sources are scored here
+        scores = [shop.get('score') for shop in shops]
+        ranked = self.ranking_service.top_k(shops, top_count, scores=None if None in scores else scores)
         
-        # Get top shops
-        top_shops = sorted_shops[:top_count]
+        # New records, so shared/cached shops are never mutated
+        for score, shop in ranked:
+            yield Shop.from_record(shop).replace(nlp_summary=self.generate_shop_summary(shop),
+                                                 score=round(score, 4))
+    
+    def extract_review_terms(self, text: str) -> List[tuple]:
+        """Get the (theme, term) pairs mentioned in one review's text"""
+        text = (text or '').lower()
+        return [(theme, term)
+                for theme, config in REVIEW_THEMES.items()
+                for term in config['terms']
+                if term in text]
+    
+    def summarize_review_themes(self, terms_present: Dict[str, int]) -> str:
+        """Build the praise summary from the number of distinct terms seen per theme"""
+        themes = [config['label'] for theme, config in REVIEW_THEMES.items()
+                  if terms_present.get(theme, 0) >= config['min_terms']]
         
-        # Generate summaries for top shops
-        for shop in top_shops:
-            shop['nlp_summary'] = self.generate_shop_summary(shop)
+        if themes:
+            return f"Customers particularly praise: {', '.join(themes)}."
         
-        return {
-            'top_shops': top_shops,
-            'all_shops_count': len(shops)
-        }
+        return ""
     
     def analyze_reviews_for_summary(self, reviews: List[Dict]) -> str:
         """Analyze reviews to generate a more detailed summary"""
         if not reviews:
             return ""
         
-        # Extract common themes from reviews
-        all_text = " ".join([review.get('text', '') for review in reviews]).lower()
-        
-        themes = []
-        
-        # Coffee quality
-        coffee_quality_words = ['amazing', 'delicious', 'best', 'great', 'excellent', 'outstanding']
-        coffee_quality_count = sum(1 for word in coffee_quality_words if word in all_text)
-        if coffee_quality_count >= 3:
-            themes.append("exceptional coffee quality")
-        
-        # Service
-        service_words = ['friendly', 'helpful', 'knowledgeable', 'attentive']
-        service_count = sum(1 for word in service_words if word in all_text)
-        if service_count >= 2:
-            themes.append("excellent service")
-        
-        # Atmosphere
-        atmosphere_words = ['cozy', 'welcoming', 'relaxing', 'beautiful']
-        atmosphere_count = sum(1 for word in atmosphere_words if word in all_text)
-        if atmosphere_count >= 2:
-            themes.append("great atmosphere")
-        
-        # Value
-        value_words = ['worth', 'reasonable', 'fair', 'good value']
-        value_count = sum(1 for word in value_words if word in all_text)
-        if value_count >= 2:
-            themes.append("good value")
-        
-        if themes:
-            return f"Customers particularly praise: {', '.join(themes)}."
+        # Count the distinct theme terms mentioned across all reviews
+        seen_terms = set()
+        for review in reviews:
+            seen_terms.update(self.extract_review_terms(review.get('text', '')))
         
-        return "" 
\ No newline at end of file
+        return self.summarize_review_themes(Counter(theme for theme, _ in seen_terms))
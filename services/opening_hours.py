@@ -0,0 +1,277 @@
+import os
+import re
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from .bitmap_index import bitmap_from_positions
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+SLOT_MINUTES = 15
+SLOTS_PER_WEEK = MINUTES_PER_WEEK // SLOT_MINUTES
+DAY_NAMES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')  # Yelp and datetime.weekday(): Monday is 0
+
+# Opening hours as sorted, disjoint (start, end) minute-of-week pairs, end exclusive
+Intervals = Tuple[Tuple[int, int], ...]
+
+# Open filter for the current time in each shop's own timezone
+OPEN_NOW = 'now'
+
+# Coarse (south, west, north, east) boxes of US timezones, first match wins; exact near zone
+# boundaries only to a state or so. Coordinates outside every box use OPEN_NOW_TZ.
+TIMEZONE_REGIONS = (
+    ((18.5, -161.0, 22.5, -154.5), 'Pacific/Honolulu'),
+    ((51.0, -180.0, 72.0, -129.5), 'America/Anchorage'),
+    ((31.3, -114.8, 37.0, -109.05), 'America/Phoenix'),
+    ((32.0, -125.0, 49.5, -116.5), 'America/Los_Angeles'),
+    ((35.0, -120.0, 42.0, -114.05), 'America/Los_Angeles'),  # Nevada
+    ((31.0, -116.5, 49.5, -101.5), 'America/Denver'),
+    ((25.5, -101.5, 49.5, -86.5), 'America/Chicago'),
+    ((24.0, -86.5, 47.5, -66.5), 'America/New_York'),
+)
+
+_TIME = r'(\d{1,2})(?::(\d{2}))?\s*([ap])?\.?\s*m?\.?'
+_RANGE_RE = re.compile(_TIME + r'\s*(?:-|–|to)\s*' + _TIME, re.IGNORECASE)
+_DAY_RE = re.compile(r'\b(mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?(?:\s*(?:-|–|to)\s*(mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?)?',
+                     re.IGNORECASE)
+
+def normalize_intervals(intervals: Iterable[Tuple[int, int]]) -> Intervals:
+    """Wrap intervals past the end of the week to its start, then sort and merge them"""
+    pieces = []
+    for start, end in intervals:
+        if end <= start:
+            end += MINUTES_PER_DAY  # Overnight: closes the next day
+        start, end = start % MINUTES_PER_WEEK, start % MINUTES_PER_WEEK + (end - start)
+        if end > MINUTES_PER_WEEK:
+            pieces.append((start, MINUTES_PER_WEEK))
+            pieces.append((0, min(end - MINUTES_PER_WEEK, MINUTES_PER_WEEK)))
+        else:
+            pieces.append((start, end))
+
+    merged = []
+    for start, end in sorted(pieces):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return tuple(merged)
+
+def parse_yelp_hours(hours_data: Optional[List[Dict]]) -> Optional[Intervals]:
+    """Parse Yelp business hours ([{'hours_type': 'REGULAR', 'open': [{'day', 'start', 'end'}]}])"""
+    if not hours_data:
+        return None
+    entries = []
+    for item in hours_data:
+        if 'open' in item:
+            if item.get('hours_type', 'REGULAR') == 'REGULAR':
+                entries.extend(item['open'])
+        else:
+            entries.append(item)  # Already a list of open entries
+
+    intervals = []
+    for entry in entries:
+        try:
+            day = int(entry['day'])
+            start = int(entry['start'][:2]) * 60 + int(entry['start'][2:])
+            end = int(entry['end'][:2]) * 60 + int(entry['end'][2:])
+        except (KeyError, TypeError, ValueError):
+            continue
+        offset = day * MINUTES_PER_DAY
+        intervals.append((offset + start, offset + end))
+    return normalize_intervals(intervals) if intervals else None
+
+def _minutes(hour: str, minute: Optional[str], meridiem: Optional[str]) -> int:
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem.lower() == 'p' else 0)
+    if hour > 24 or minute > 59:
+        raise ValueError("Invalid time")
+    return hour * 60 + minute
+
+def _days(spec: str) -> List[int]:
+    """Days named in a prefix like 'Mon-Fri', 'Sat, Sun' or 'Daily' (all days when none)"""
+    days = []
+    for match in _DAY_RE.finditer(spec):
+        first = DAY_NAMES.index(match.group(1).lower()[:3])
+        last = DAY_NAMES.index(match.group(2).lower()[:3]) if match.group(2) else first
+        days.extend((first + step) % 7 for step in range((last - first) % 7 + 1))
+    return days or list(range(7))
+
+def parse_hours_text(text: Optional[str]) -> Optional[Intervals]:
+    """Parse free-text hours such as '7:00 AM - 6:00 PM' or 'Mon-Fri 6am-5pm; Sat 8am-2pm'"""
+    if not text:
+        return None
+    intervals = []
+    for part in re.split(r'[;\n|]', text):
+        if 'closed' in part.lower():
+            continue
+        if '24 hours' in part.lower():
+            intervals.extend((day * MINUTES_PER_DAY, (day + 1) * MINUTES_PER_DAY) for day in _days(part))
+            continue
+        matches = list(_RANGE_RE.finditer(part))
+        if not matches:
+            continue
+        days = _days(part[:matches[0].start()])
+        for match in matches:
+            try:
+                start = _minutes(match.group(1), match.group(2), match.group(3) or match.group(6))
+                end = _minutes(match.group(4), match.group(5), match.group(6))
+            except ValueError:
+                continue
+            intervals.extend((day * MINUTES_PER_DAY + start, day * MINUTES_PER_DAY + end) for day in days)
+    return normalize_intervals(intervals) if intervals else None
+
+def encode_intervals(intervals: Optional[Intervals]) -> str:
+    """Compact column encoding: '420-1080,1860-2520' ('' when hours are unknown)"""
+    return ','.join(f"{start}-{end}" for start, end in intervals or ())
+
+def decode_intervals(encoded: Optional[str]) -> Optional[Intervals]:
+    if not encoded:
+        return None
+    return tuple(tuple(int(value) for value in pair.split('-')) for pair in encoded.split(','))
+
+def is_open(intervals: Optional[Intervals], minute_of_week: int) -> bool:
+    """Whether the intervals contain a minute of the week (binary search)"""
+    if not intervals:
+        return False
+    index = bisect_right(intervals, (minute_of_week, MINUTES_PER_WEEK)) - 1
+    return index >= 0 and intervals[index][0] <= minute_of_week < intervals[index][1]
+
+def _clock(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+def format_day(intervals: Optional[Intervals], weekday: int) -> Optional[str]:
+    """Render one day's opening hours as 'HH:MM - HH:MM' (None when closed or unknown)
+
+    Overnight ranges are shown on the day they open; multi-day stretches are clipped to the day.
+    """
+    day_start = weekday * MINUTES_PER_DAY
+    day_end = day_start + MINUTES_PER_DAY
+    ranges = []
+    for start, end in intervals or ():
+        if end <= day_start or start >= day_end:
+            continue
+        if end - start >= MINUTES_PER_DAY:
+            ranges.append(f"{_clock(max(start, day_start) - day_start)} - {_clock(min(end, day_end) - day_start)}")
+        elif start >= day_start:
+            ranges.append(f"{_clock(start - day_start)} - {_clock(end % MINUTES_PER_DAY)}")
+    return ', '.join(ranges) or None
+
+def format_week(intervals: Optional[Intervals]) -> Optional[str]:
+    """Render weekly hours as 'Mon 07:00 - 18:00; Tue ...' (readable back by parse_hours_text)"""
+    days = [(name, format_day(intervals, day)) for day, name in enumerate(DAY_NAMES)]
+    return '; '.join(f"{name.title()} {hours}" for name, hours in days if hours) or None
+
+def timezone_name(lat: Optional[float] = None, lng: Optional[float] = None) -> str:
+    """Timezone of a location from TIMEZONE_REGIONS (OPEN_NOW_TZ, Hawaii by default, elsewhere)"""
+    if lat is not None and lng is not None:
+        for (south, west, north, east), name in TIMEZONE_REGIONS:
+            if south <= lat <= north and west <= lng <= east:
+                return name
+    return os.getenv('OPEN_NOW_TZ', 'Pacific/Honolulu')
+
+def now_in(zone: str) -> datetime:
+    """Current time in a named timezone"""
+    try:
+        from zoneinfo import ZoneInfo
+        return datetime.now(ZoneInfo(zone))
+    except Exception:
+        return datetime.now()  # No tz database: fall back to server local time
+
+def local_now(lat: Optional[float] = None, lng: Optional[float] = None) -> datetime:
+    """Current time at a location, or in OPEN_NOW_TZ without one"""
+    return now_in(timezone_name(lat, lng))
+
+def minute_of_week(moment: datetime) -> int:
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+def parse_open_at(value: str) -> int:
+    """Minute of week for 'sun 06:00', 'sunday 6am', '18:30' (today) or an ISO datetime"""
+    value = value.strip()
+    try:
+        return minute_of_week(datetime.fromisoformat(value))
+    except ValueError:
+        pass
+
+    day_match = re.match(r'([a-z]+)\.?\s+(.*)$', value, re.IGNORECASE)
+    if day_match and day_match.group(1).lower()[:3] in DAY_NAMES:
+        weekday = DAY_NAMES.index(day_match.group(1).lower()[:3])
+        time_text = day_match.group(2)
+    else:
+        weekday = local_now().weekday()
+        time_text = value
+
+    time_match = re.fullmatch(_TIME, time_text.strip(), re.IGNORECASE)
+    if not time_match:
+        raise ValueError(f"Unrecognized time: {value}")
+    minute = _minutes(*time_match.groups())
+    if minute >= MINUTES_PER_DAY:
+        raise ValueError(f"Unrecognized time: {value}")
+    return weekday * MINUTES_PER_DAY + minute
+
+class OpeningHoursIndex:
+    def __init__(self, entries: Iterable[Tuple[Sequence[Hashable], Intervals]]):
+        """Index shops' weekly hours as one bitset per 15-minute slot
+
+        entries are (keys, intervals); every key of an entry (local id, Yelp id) maps to the same bit.
+        Slots a shop is open for entirely go in the slot's bitset; slots where it opens or closes
+        mid-slot are listed separately and checked exactly, so lookups stay exact.
+        """
+        self.positions: Dict[Hashable, int] = {}
+        self.intervals: List[Intervals] = []
+        opens = [[] for _ in range(SLOTS_PER_WEEK + 1)]
+        closes = [[] for _ in range(SLOTS_PER_WEEK + 1)]
+        self.partial: List[List[int]] = [[] for _ in range(SLOTS_PER_WEEK)]
+
+        for keys, intervals in entries:
+            position = len(self.intervals)
+            self.intervals.append(intervals)
+            for key in keys:
+                if key is not None:
+                    self.positions[key] = position
+            for start, end in intervals:
+                first_full, end_full = -(-start // SLOT_MINUTES), end // SLOT_MINUTES
+                if first_full < end_full:
+                    opens[first_full].append(position)
+                    closes[end_full].append(position)
+                edge_slots = {start // SLOT_MINUTES} if start % SLOT_MINUTES else set()
+                if end % SLOT_MINUTES:
+                    edge_slots.add(end // SLOT_MINUTES)
+                for slot in edge_slots:
+                    self.partial[slot].append(position)
+
+        # Sweep the week once, carrying the set of open shops from slot to slot
+        size = len(self.intervals)
+        self.full_slots: List[int] = []
+        open_now = 0
+        for slot in range(SLOTS_PER_WEEK):
+            if closes[slot]:
+                open_now &= ~bitmap_from_positions(closes[slot], size)
+            if opens[slot]:
+                open_now |= bitmap_from_positions(opens[slot], size)
+            self.full_slots.append(open_now)
+
+    def __len__(self) -> int:
+        return len(self.intervals)
+
+    def open_mask(self, minute: int) -> int:
+        """Bitset of shops open at a minute of the week"""
+        slot = (minute % MINUTES_PER_WEEK) // SLOT_MINUTES
+        mask = self.full_slots[slot]
+        for position in self.partial[slot]:
+            if is_open(self.intervals[position], minute % MINUTES_PER_WEEK):
+                mask |= 1 << position
+        return mask
+
+    def open_bytes(self, minute: int) -> bytes:
+        """open_mask as little-endian bytes, for constant-time per-shop lookups"""
+        return self.open_mask(minute).to_bytes((len(self.intervals) + 7) // 8, 'little')
+
+    def is_open(self, key: Hashable, minute: int, open_bytes: bytes = None) -> Optional[bool]:
+        """Whether a shop is open (None when its hours are not indexed)"""
+        position = self.positions.get(key)
+        if position is None:
+            return None
+        open_bytes = self.open_bytes(minute) if open_bytes is None else open_bytes
+        return bool(open_bytes[position >> 3] >> (position & 7) & 1)
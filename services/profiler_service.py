@@ -0,0 +1,122 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict
+
+class SamplingProfilerService:
+    def __init__(self, interval_ms: float = None, retention_seconds: int = None,
+                 max_overhead: float = None, module_prefix: str = 'services.'):
+        """Initialize the sampling profiler (does not start sampling)"""
+        self.interval = (interval_ms or float(os.getenv('PROFILER_INTERVAL_MS', 20))) / 1000.0
+        self.retention_seconds = retention_seconds or int(os.getenv('PROFILER_RETENTION_SECONDS', 600))
+        # Fraction of wall time the sampler may spend holding the GIL
+        self.max_overhead = max_overhead or float(os.getenv('PROFILER_MAX_OVERHEAD', 0.01))
+        self.module_prefix = module_prefix
+
+        # One Counter of collapsed stacks per wall-clock second, oldest first
+        self._buckets = deque()
+        self._frame_labels = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.samples_taken = 0
+        self.sampling_seconds = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the background sampling thread"""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        print(f"Sampling profiler started ({self.interval * 1000:.0f} ms interval)")
+
+    def stop(self):
+        """Stop the background sampling thread"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def _run(self):
+        """Sampling loop, backing off when a sample costs more than the overhead budget"""
+        own_thread_id = threading.get_ident()
+        while not self._stop_event.is_set():
+            started = time.perf_counter()
+            self._sample(own_thread_id)
+            elapsed = time.perf_counter() - started
+            self.samples_taken += 1
+            self.sampling_seconds += elapsed
+
+            delay = max(self.interval, elapsed / self.max_overhead) - elapsed
+            self._stop_event.wait(max(delay, 0.0))
+
+    def _sample(self, own_thread_id: int):
+        """Take one sample of every thread and record stacks that pass through services"""
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+
+            labels = []
+            in_services = False
+            while frame is not None:
+                label = self._frame_label(frame)
+                if label[1]:
+                    in_services = True
+                labels.append(label[0])
+                frame = frame.f_back
+
+            if in_services:
+                labels.reverse()
+                stacks.append(';'.join(labels))
+
+        if not stacks:
+            return
+
+        second = int(time.time())
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append((second, Counter()))
+                while self._buckets and self._buckets[0][0] <= second - self.retention_seconds:
+                    self._buckets.popleft()
+            self._buckets[-1][1].update(stacks)
+
+    def _frame_label(self, frame) -> tuple:
+        """Return (label, is_services_frame) for a frame, cached per code object"""
+        code = frame.f_code
+        cached = self._frame_labels.get(code)
+        if cached is None:
+            module = frame.f_globals.get('__name__', '?')
+            cached = (f"{module}:{code.co_name}", module.startswith(self.module_prefix))
+            self._frame_labels[code] = cached
+        return cached
+
+    def collapsed_stacks(self, seconds: int = 60) -> str:
+        """Aggregate the last `seconds` of samples in collapsed-stack (flamegraph.pl) format"""
+        cutoff = int(time.time()) - seconds
+        totals = Counter()
+        with self._lock:
+            for second, counts in self._buckets:
+                if second > cutoff:
+                    totals.update(counts)
+
+        return "\n".join(f"{stack} {count}" for stack, count in totals.most_common())
+
+    def get_statistics(self) -> Dict:
+        """Get sampler state and measured overhead"""
+        with self._lock:
+            buckets = len(self._buckets)
+        return {
+            'running': self.is_running,
+            'interval_ms': self.interval * 1000,
+            'samples_taken': self.samples_taken,
+            'avg_sample_ms': round(self.sampling_seconds / self.samples_taken * 1000, 3) if self.samples_taken else 0.0,
+            'retained_seconds': buckets
+        }
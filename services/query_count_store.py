@@ -0,0 +1,82 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+class QueryCountStore:
+    def __init__(self, path: str = None, decay_seconds: float = 86400, min_count: float = 0.5):
+        """Search counts per region in SQLite, shared by every thread and worker process
+
+        Counts are halved every decay_seconds (applied lazily from each row's last update), so the
+        ranking follows recent traffic; regions whose count decays below min_count are deleted.
+        """
+        self.path = path or os.getenv('QUERY_COUNTS_PATH', 'cache/query_counts.db')
+        self.decay_seconds = decay_seconds
+        self.min_count = min_count
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS region_counts (
+                    key TEXT PRIMARY KEY,
+                    region TEXT NOT NULL,
+                    count REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread, reopened in a forked child"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _decayed(self, count: float, updated_at: float, now: float) -> float:
+        return count * 0.5 ** (max(0.0, now - updated_at) / self.decay_seconds)
+
+    def add(self, counts: Dict[str, int], regions: Dict[str, Dict]):
+        """Add one process's counts (by region key) in one write transaction; the widest radius is kept"""
+        if not counts:
+            return
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, count in counts.items():
+                region = regions[key]
+                row = conn.execute("SELECT region, count, updated_at FROM region_counts WHERE key = ?",
+                                   (key,)).fetchone()
+                if row is not None:
+                    stored = json.loads(row[0])
+                    if stored['radius_miles'] >= region['radius_miles']:
+                        region = stored
+                    count += self._decayed(row[1], row[2], now)
+                conn.execute("INSERT OR REPLACE INTO region_counts (key, region, count, updated_at) VALUES (?, ?, ?, ?)",
+                             (key, json.dumps(region), count, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def top(self, limit: int) -> List[Dict]:
+        """The limit most searched regions across all processes, dropping ones that have decayed away"""
+        conn = self._connection()
+        now = time.time()
+        ranked, expired = [], []
+        for key, region, count, updated_at in conn.execute("SELECT key, region, count, updated_at FROM region_counts"):
+            count = self._decayed(count, updated_at, now)
+            if count < self.min_count:
+                expired.append((key,))
+            else:
+                ranked.append((count, region))
+        if expired:
+            conn.executemany("DELETE FROM region_counts WHERE key = ?", expired)
+        ranked.sort(key=lambda item: -item[0])
+        return [json.loads(region) for _, region in ranked[:limit]]
@@ -0,0 +1,274 @@
+import atexit
+import contextvars
+import glob
+import gzip
+import json
+import os
+import queue
+import random
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Log record of the current request (None when the request is not being logged)
+_entry: contextvars.ContextVar = contextvars.ContextVar('query_log_entry', default=None)
+
+# Query parameters kept in the log, per kind of value
+STRING_PARAMS = ('zip_code', 'q', 'open_at')
+COORDINATE_PARAMS = ('lat', 'lng')
+NUMBER_PARAMS = ('radius', 'min_rating')
+FLAG_PARAMS = ('open_now',)
+
+def normalize_params(args) -> Dict:
+    """Search parameters in a canonical form, so equal searches log equal parameters
+
+    Location text is lowercased and whitespace-collapsed (like the geocode cache key), coordinates are
+    rounded like the search cache key and tags are sorted; unknown parameters are dropped.
+    """
+    params = {}
+    for name in STRING_PARAMS:
+        value = args.get(name)
+        if value:
+            params[name] = ' '.join(str(value).lower().split())
+    for name in COORDINATE_PARAMS + NUMBER_PARAMS:
+        try:
+            value = float(args.get(name))
+        except (TypeError, ValueError):
+            continue
+        if name in COORDINATE_PARAMS:
+            value = round(value, 4)
+        params[name] = int(value) if value.is_integer() else value
+    for name in FLAG_PARAMS:
+        if str(args.get(name, '')).lower() in ('1', 'true', 'yes'):
+            params[name] = 1
+    tags = sorted({tag.strip().lower() for value in args.getlist('tags') for tag in value.split(',') if tag.strip()})
+    if tags:
+        params['tags'] = ','.join(tags)
+    return params
+
+def record_cache_lookup(layer: str, hit: bool):
+    """Count a cache hit or miss against the current request's log record"""
+    entry = _entry.get()
+    if entry is not None:
+        counts = entry['cache'].setdefault(layer, {'hit': 0, 'miss': 0})
+        counts['hit' if hit else 'miss'] += 1
+
+def annotate(**fields):
+    """Add fields (result count, resolved center) to the current request's log record"""
+    entry = _entry.get()
+    if entry is not None:
+        entry.update(fields)
+
+class stage:
+    """Time a block as a named stage of the current request (repeated stages add up)"""
+    __slots__ = ('name', 'entry', 'started')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.entry = _entry.get()
+        if self.entry is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.entry is not None:
+            stages = self.entry['stages']
+            stages[self.name] = round(stages.get(self.name, 0.0) + (time.perf_counter() - self.started) * 1000, 2)
+        return False
+
+class QueryLogService:
+    def __init__(self, log_dir: str = None, enabled: bool = None, sample_rate: float = None,
+                 max_file_bytes: int = None, rotate_seconds: float = None, max_files: int = None,
+                 queue_size: int = 10000, flush_seconds: float = 1.0):
+        """Opt-in log of search requests, written by a background thread to rotating gzip JSON-lines files
+
+        Requests only pay for building their record and a non-blocking enqueue; when the writer falls
+        behind, records are dropped and counted rather than slowing requests down. Each worker process
+        writes its own files (the pid is in the file name).
+        """
+        self.log_dir = log_dir or os.getenv('QUERY_LOG_DIR', 'logs/queries')
+        self.enabled = enabled if enabled is not None else \
+            os.getenv('QUERY_LOG_ENABLED', '').lower() in ('1', 'true', 'yes')
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv('QUERY_LOG_SAMPLE_RATE', 1.0))
+        self.log_config = {
+            # Uncompressed bytes per file before rotating (files compress roughly 10x)
+            'max_file_bytes': max_file_bytes or int(os.getenv('QUERY_LOG_MAX_BYTES', 64 * 1024 * 1024)),
+            'rotate_seconds': rotate_seconds or float(os.getenv('QUERY_LOG_ROTATE_SECONDS', 3600)),
+            # Oldest files beyond this many are deleted
+            'max_files': max_files or int(os.getenv('QUERY_LOG_MAX_FILES', 48)),
+            'queue_size': queue_size,
+            'flush_seconds': flush_seconds
+        }
+        self._queue = None
+        self._writer = None
+        self._writer_pid = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_path = None
+        self._file_bytes = 0
+        self._file_opened_at = 0.0
+        self.logged = 0
+        self.dropped = 0
+        self.files_written = 0
+
+    def begin(self, endpoint: str, args) -> Optional[contextvars.Token]:
+        """Start the log record of a request (None when logging is off or the request is not sampled)"""
+        if not self.enabled or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return None
+        entry = {'ts': round(time.time(), 3), 'endpoint': endpoint, 'params': normalize_params(args),
+                 'cache': {}, 'stages': {}, '_started': time.perf_counter()}
+        return _entry.set(entry)
+
+    def finish(self, token: Optional[contextvars.Token], status: int):
+        """Complete the current record with status and total time and queue it for the writer"""
+        if token is None:
+            return
+        entry = _entry.get()
+        _entry.reset(token)
+        self._enqueue(entry, status)
+
+    def stream(self, token: contextvars.Token, status: int, chunks: Iterable) -> Iterator:
+        """Hand the current record to a streamed response body and finish it when the body ends
+
+        The body is generated inside a copy of the request's context, so its stages and cache lookups
+        are recorded; total time covers the whole stream and an error while streaming logs a 500.
+        """
+        entry = _entry.get()
+        context = contextvars.copy_context()
+        _entry.reset(token)
+
+        def generate():
+            nonlocal status
+            iterator = iter(chunks)
+            try:
+                while True:
+                    try:
+                        chunk = context.run(next, iterator)
+                    except StopIteration:
+                        return
+                    yield chunk
+            except Exception:
+                status = 500
+                raise
+            finally:
+                if hasattr(iterator, 'close'):
+                    context.run(iterator.close)
+                self._enqueue(entry, status)
+        return generate()
+
+    def _enqueue(self, entry: Dict, status: int):
+        entry['ms'] = round((time.perf_counter() - entry.pop('_started')) * 1000, 2)
+        entry['status'] = status
+        try:
+            self._writer_queue().put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _writer_queue(self) -> queue.Queue:
+        # Writer threads do not survive fork, so each worker process starts its own
+        if self._writer_pid != os.getpid():
+            with self._lock:
+                if self._writer_pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self.log_config['queue_size'])
+                    self._file = None
+                    self._stop_event.clear()
+                    self._writer = threading.Thread(target=self._run, name='query-log-writer', daemon=True)
+                    self._writer.start()
+                    self._writer_pid = os.getpid()
+                    atexit.register(self.close)
+        return self._queue
+
+    def _run(self):
+        """Write the queued records about every flush_seconds, then once more when stopped"""
+        records = self._queue
+        while True:
+            stopping = self._stop_event.wait(self.log_config['flush_seconds'])
+            batch = []
+            while True:
+                try:
+                    batch.append(records.get_nowait())
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write(batch)
+                except OSError as e:
+                    self.dropped += len(batch)
+                    print(f"Query log write failed: {e}")
+            if stopping:
+                break
+        self._close_file()
+
+    def _write(self, batch: List[Dict]):
+        data = ''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in batch)
+        if self._file is None or self._file_bytes >= self.log_config['max_file_bytes'] or \
+                time.monotonic() - self._file_opened_at >= self.log_config['rotate_seconds']:
+            self._rotate()
+        self._file.write(data)
+        # A sync flush keeps everything written so far readable while the file is still open
+        self._file.flush()
+        self._file_bytes += len(data)
+        self.logged += len(batch)
+
+    def _rotate(self):
+        self._close_file()
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._file_path = os.path.join(self.log_dir, f"queries-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz")
+        self._file = gzip.open(self._file_path, 'at', encoding='utf-8')
+        self._file_bytes = 0
+        self._file_opened_at = time.monotonic()
+        self.files_written += 1
+
+        for path in sorted(glob.glob(os.path.join(self.log_dir, 'queries-*.jsonl.gz')),
+                           key=os.path.getmtime)[:-self.log_config['max_files']]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        """Write out the queued records and close the current file"""
+        if self._writer is not None and self._writer_pid == os.getpid():
+            self._stop_event.set()
+            self._writer.join(timeout=5.0)
+
+    def get_statistics(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'log_dir': self.log_dir,
+            'current_file': self._file_path,
+            'logged': self.logged,
+            'dropped': self.dropped,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'files_written': self.files_written
+        }
+
+def read_query_log(paths: List[str]) -> Iterator[Dict]:
+    """Records from log files or directories of them, oldest file first
+
+    A file still being written ends without a gzip trailer; its records up to the last flush are read.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, 'queries-*.jsonl.gz')))
+        else:
+            files.append(path)
+    for path in sorted(files, key=os.path.getmtime):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    if line.endswith('\n'):
+                        yield json.loads(line)
+            except EOFError:
+                pass
@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+
+# Highest priority first; lower classes are cut off first as the budget runs down
+PRIORITIES = ('interactive', 'warmup', 'crawl')
+
+def retry_after_seconds(value: Optional[str], now: float, default: float = 1.0) -> float:
+    """Seconds to wait from a Retry-After header: delta-seconds or an HTTP-date (default when unparseable)"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - now)
+    except (TypeError, ValueError):
+        return default
+
+class QuotaExceeded(Exception):
+    def __init__(self, priority: str, retry_after: float):
+        super().__init__(f"Yelp quota reserved for higher priorities than {priority} (retry in {retry_after:.0f}s)")
+        self.priority = priority
+        self.retry_after = retry_after
+
+class YelpQuotaManager:
+    def __init__(self, daily_quota: int = None, path: str = None, reserves: Dict[str, float] = None):
+        """Initialize a token bucket for the Yelp daily quota, shared by every thread and worker process
+
+        Each priority class may only draw while the bucket holds more than its reserve (a share of the
+        daily quota kept for the classes above it), so crawls stop first and warm-ups next, leaving the
+        rest for interactive searches.
+        """
+        self.daily_quota = daily_quota or int(os.getenv('YELP_DAILY_QUOTA', 500))
+        self.path = path or os.getenv('QUOTA_PATH', 'cache/yelp_quota.db')
+        self.reserves = reserves or {
+            'interactive': 0.0,
+            'warmup': float(os.getenv('QUOTA_WARMUP_RESERVE', 0.3)),
+            'crawl': float(os.getenv('QUOTA_CRAWL_RESERVE', 0.5))
+        }
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS quota_bucket (
+                    name TEXT PRIMARY KEY,
+                    capacity REAL NOT NULL,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    reset_at REAL,
+                    blocked_until REAL NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("INSERT OR IGNORE INTO quota_bucket (name, capacity, tokens, updated_at) VALUES ('yelp', ?, ?, ?)",
+                         (self.daily_quota, self.daily_quota, time.time()))
+            # A changed YELP_DAILY_QUOTA applies unless Yelp's own headers have set the limit
+            conn.execute("UPDATE quota_bucket SET capacity = ?, tokens = MIN(tokens, ?) WHERE name = 'yelp' AND reset_at IS NULL",
+                         (self.daily_quota, self.daily_quota))
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread, reopened in a forked child"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _update(self, change):
+        """Apply change(state, now) to the refilled bucket in one write transaction; returns its result"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT capacity, tokens, updated_at, reset_at, blocked_until FROM quota_bucket "
+                               "WHERE name = 'yelp'").fetchone()
+            state = dict(zip(('capacity', 'tokens', 'updated_at', 'reset_at', 'blocked_until'), row))
+            now = time.time()
+            if state['reset_at'] is not None:
+                # Yelp reported its reset time: the whole quota comes back at once
+                if now >= state['reset_at']:
+                    state['tokens'], state['reset_at'] = state['capacity'], None
+            else:
+                state['tokens'] = min(state['capacity'],
+                                      state['tokens'] + (now - state['updated_at']) * state['capacity'] / 86400)
+            state['updated_at'] = now
+            result = change(state, now)
+            conn.execute("UPDATE quota_bucket SET capacity = ?, tokens = ?, updated_at = ?, reset_at = ?, "
+                         "blocked_until = ? WHERE name = 'yelp'",
+                         (state['capacity'], state['tokens'], state['updated_at'], state['reset_at'],
+                          state['blocked_until']))
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _floor(self, state: Dict, priority: str) -> float:
+        return self.reserves[priority] * state['capacity']
+
+    def _retry_after(self, state: Dict, priority: str, cost: float, now: float) -> float:
+        if state['blocked_until'] > now:
+            return state['blocked_until'] - now
+        if state['reset_at'] is not None:
+            return state['reset_at'] - now
+        missing = self._floor(state, priority) + cost - state['tokens']
+        return missing / (state['capacity'] / 86400)
+
+    def acquire(self, priority: str = 'interactive', cost: float = 1):
+        """Take cost tokens for a request of a priority class, or raise QuotaExceeded"""
+        if priority not in self.reserves:
+            raise ValueError(f"Unknown quota priority: {priority}")
+
+        def take(state, now):
+            if state['blocked_until'] <= now and state['tokens'] - cost >= self._floor(state, priority):
+                state['tokens'] -= cost
+                return None
+            return self._retry_after(state, priority, cost, now)
+
+        retry_after = self._update(take)
+        if retry_after is not None:
+            raise QuotaExceeded(priority, retry_after)
+
+    def available(self, priority: str) -> int:
+        """Requests a priority class may still make now"""
+        return self.snapshot()['available'][priority]
+
+    def observe(self, headers: Mapping[str, str], status_code: int = 200):
+        """Adjust the bucket from Yelp's RateLimit-DailyLimit/-Remaining/-ResetTime response headers"""
+        daily_limit = headers.get('RateLimit-DailyLimit')
+        remaining = headers.get('RateLimit-Remaining')
+        reset_time = headers.get('RateLimit-ResetTime')
+        retry_after = headers.get('Retry-After')
+        if daily_limit is None and remaining is None and status_code != 429:
+            return
+
+        def adjust(state, now):
+            if daily_limit is not None:
+                state['capacity'] = float(daily_limit)
+            if remaining is not None:
+                # Yelp counts every client of the API key, so its count is authoritative
+                state['tokens'] = float(remaining)
+            if reset_time:
+                try:
+                    state['reset_at'] = datetime.fromisoformat(reset_time).timestamp()
+                except ValueError:
+                    pass
+            if status_code == 429:
+                if remaining is not None and float(remaining) <= 0:
+                    state['tokens'] = 0.0
+                else:
+                    # Per-second throttling: back off briefly without spending the daily budget
+                    state['blocked_until'] = now + retry_after_seconds(retry_after, now)
+
+        self._update(adjust)
+
+    def snapshot(self) -> Dict:
+        """Current budget and what each priority class may still use"""
+        state = self._update(lambda state, now: dict(state))
+        return {
+            'daily_quota': state['capacity'],
+            'tokens': round(state['tokens'], 2),
+            'reset_at': state['reset_at'],
+            'blocked_until': state['blocked_until'] if state['blocked_until'] > time.time() else None,
+            'available': {priority: max(0, int(state['tokens'] - self._floor(state, priority)))
+                          for priority in PRIORITIES}
+        }
@@ -0,0 +1,168 @@
+import heapq
+import os
+from collections import namedtuple
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .geo_utils import haversine_miles, EARTH_RADIUS_MILES
+
+# Per-candidate inputs to the scorers; distance is None without a search center or coordinates
+ShopFeatures = namedtuple('ShopFeatures', ['rating', 'review_count', 'price_level', 'distance'])
+
+def bayesian_rating(features: ShopFeatures, config: Dict) -> float:
+    """Rating shrunk toward prior_rating until a shop has enough reviews (0..1)"""
+    if not features.review_count:
+        return features.rating / 5.0  # Local shops without review counts keep their raw rating
+    prior_reviews, prior_rating = config['prior_reviews'], config['prior_rating']
+    return ((prior_reviews * prior_rating + features.rating * features.review_count) /
+            (prior_reviews + features.review_count) / 5.0)
+
+def bayesian_rating_vector(columns: Dict, config: Dict, np) -> Any:
+    ratings, review_counts = columns['rating'], columns['review_count']
+    prior_reviews, prior_rating = config['prior_reviews'], config['prior_rating']
+    shrunk = (prior_reviews * prior_rating + ratings * review_counts) / (prior_reviews + review_counts)
+    return np.where(review_counts > 0, shrunk, ratings) / 5.0
+
+def distance_decay(features: ShopFeatures, config: Dict) -> float:
+    """1.0 at the search center, halving every distance_half_life_miles"""
+    if features.distance is None:
+        return 1.0
+    return 0.5 ** (features.distance / config['distance_half_life_miles'])
+
+def distance_decay_vector(columns: Dict, config: Dict, np) -> Any:
+    distances = columns['distance']
+    return np.where(np.isnan(distances), 1.0,
+                    0.5 ** (np.nan_to_num(distances) / config['distance_half_life_miles']))
+
+def price_preference(features: ShopFeatures, config: Dict) -> float:
+    """1.0 at the preferred price level, 0.0 three levels away; unknown prices count as 0.5"""
+    if features.price_level is None:
+        return 0.5
+    return 1.0 - abs(features.price_level - config['preferred_price_level']) / 3.0
+
+def price_preference_vector(columns: Dict, config: Dict, np) -> Any:
+    levels = columns['price_level']
+    return np.where(np.isnan(levels), 0.5,
+                    1.0 - np.abs(np.nan_to_num(levels) - config['preferred_price_level']) / 3.0)
+
+# name -> (scalar scorer, optional vectorized scorer); register_scorer adds more
+SCORERS: Dict[str, Tuple[Callable, Optional[Callable]]] = {
+    'bayesian_rating': (bayesian_rating, bayesian_rating_vector),
+    'distance_decay': (distance_decay, distance_decay_vector),
+    'price_preference': (price_preference, price_preference_vector)
+}
+
+def register_scorer(name: str, scorer: Callable[[ShopFeatures, Dict], float],
+                    vectorized: Optional[Callable] = None):
+    """Add a scoring function usable in RANKING_WEIGHTS (vectorized=None keeps large sets on the Python path)"""
+    SCORERS[name] = (scorer, vectorized)
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Parse 'bayesian_rating=1,distance_decay=0.25' into a weights dict"""
+    weights = {}
+    for part in spec.split(','):
+        if '=' in part:
+            name, value = part.split('=', 1)
+            weights[name.strip()] = float(value)
+    return weights
+
+class RankingService:
+    def __init__(self, weights: Dict[str, float] = None):
+        """Initialize weighted scoring and top-k selection of shop candidates"""
+        self.weights = weights or parse_weights(
+            os.getenv('RANKING_WEIGHTS', 'bayesian_rating=1.0,distance_decay=0.25,price_preference=0.1'))
+        unknown = set(self.weights) - set(SCORERS)
+        if unknown:
+            raise ValueError(f"Unknown ranking scorers: {', '.join(sorted(unknown))}")
+
+        preferred_price = os.getenv('RANKING_PRICE_PREFERENCE', '')
+        self.ranking_config = {
+            # Bayesian prior: a shop "starts" with prior_reviews reviews of prior_rating stars
+            'prior_rating': float(os.getenv('RANKING_PRIOR_RATING', 4.0)),
+            'prior_reviews': float(os.getenv('RANKING_PRIOR_REVIEWS', 25)),
+            'distance_half_life_miles': float(os.getenv('RANKING_DISTANCE_HALF_LIFE_MILES', 3.0)),
+            # '$'..'$$$$'; price_preference is skipped when unset
+            'preferred_price_level': len(preferred_price) or None,
+            # Candidate count from which scoring and selection switch to NumPy
+            'numpy_min_candidates': int(os.getenv('RANKING_NUMPY_MIN_CANDIDATES', 5000))
+        }
+
+    def _raw_features(self, item: Dict) -> Tuple:
+        """(rating, review_count, price_level, lat, lng) from a raw Yelp business or a Shop"""
+        coordinates = item.get('coordinates')
+        if coordinates:
+            item_lat, item_lng = coordinates.get('latitude'), coordinates.get('longitude')
+        else:
+            item_lat, item_lng = item.get('lat'), item.get('lng')
+        return (float(item.get('rating') or 0.0), int(item.get('review_count') or 0),
+                len(item.get('price') or '') or None, item_lat, item_lng)
+
+    def extract_features(self, item: Dict, lat: float = None, lng: float = None) -> ShopFeatures:
+        """Read scoring inputs from a raw Yelp business or a Shop"""
+        rating, review_count, price_level, item_lat, item_lng = self._raw_features(item)
+        distance = None
+        if lat is not None and lng is not None and item_lat is not None and item_lng is not None:
+            distance = haversine_miles(lat, lng, item_lat, item_lng)
+        return ShopFeatures(rating, review_count, price_level, distance)
+
+    def _active_scorers(self, has_center: bool) -> List[Tuple[str, float]]:
+        active = []
+        for name, weight in self.weights.items():
+            if not weight:
+                continue
+            if name == 'distance_decay' and not has_center:
+                continue
+            if name == 'price_preference' and self.ranking_config['preferred_price_level'] is None:
+                continue
+            active.append((name, weight))
+        return active
+
+    def score(self, items: Sequence[Dict], lat: float = None, lng: float = None) -> Sequence[float]:
+        """Weighted score of every candidate (a list, or a NumPy array for large candidate sets)"""
+        scorers = self._active_scorers(lat is not None and lng is not None)
+
+        vectorizable = all(SCORERS[name][1] is not None for name, _ in scorers)
+        if vectorizable and len(items) >= self.ranking_config['numpy_min_candidates']:
+            return self._score_vectorized(items, scorers, lat, lng)
+
+        features = [self.extract_features(item, lat, lng) for item in items]
+        return [sum(weight * SCORERS[name][0](f, self.ranking_config) for name, weight in scorers)
+                for f in features]
+
+    def _score_vectorized(self, items: Sequence[Dict], scorers: List[Tuple[str, float]],
+                          lat: float = None, lng: float = None):
+        import numpy as np
+        # None (missing price or coordinates) becomes NaN
+        raw = np.array([self._raw_features(item) for item in items], dtype=float)
+        columns = {'rating': raw[:, 0], 'review_count': raw[:, 1], 'price_level': raw[:, 2],
+                   'distance': np.full(len(items), np.nan)}
+        if lat is not None and lng is not None:
+            lat1, lng1 = np.radians(lat), np.radians(lng)
+            lat2, lng2 = np.radians(raw[:, 3]), np.radians(raw[:, 4])
+            a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+            columns['distance'] = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+        scores = np.zeros(len(items))
+        for name, weight in scorers:
+            scores += weight * SCORERS[name][1](columns, self.ranking_config, np)
+        return scores
+
+    def top_k(self, items: Sequence[Dict], k: int, lat: float = None, lng: float = None,
+              scores: Sequence[float] = None) -> List[Tuple[float, Dict]]:
+        """Best k candidates as (score, item), highest first, without sorting the whole set"""
+        if not items or k <= 0:
+            return []
+        if scores is None:
+            scores = self.score(items, lat, lng)
+
+        if hasattr(scores, 'argpartition'):
+            import numpy as np
+            if k < len(items):
+                indices = np.argpartition(-scores, k - 1)[:k]
+            else:
+                indices = np.arange(len(items))
+            indices = indices[np.argsort(-scores[indices], kind='stable')]
+            return [(float(scores[i]), items[i]) for i in indices]
+
+        # Ties keep the candidates' input order
+        indices = heapq.nlargest(k, range(len(items)), key=scores.__getitem__)
+        return [(scores[i], items[i]) for i in indices]
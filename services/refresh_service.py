@@ -0,0 +1,128 @@
+import atexit
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Callable, Iterable
+
+class ShopRefreshService:
+    def __init__(self, yelp_client, db_service, max_workers: int = 4):
+        """Initialize the delta refresh pipeline for stored Yelp shops"""
+        self.yelp_client = yelp_client
+        self.db_service = db_service
+        self.max_workers = max_workers
+
+        self.refresh_config = {
+            'max_age_seconds': float(os.getenv('REFRESH_MAX_AGE_SECONDS', 7 * 86400)),
+            'batch_size': int(os.getenv('REFRESH_BATCH_SIZE', 100)),
+            'interval_seconds': float(os.getenv('REFRESH_INTERVAL_SECONDS', 3600)),
+            # Buffered views are written to view_count this often, in every process
+            'views_flush_seconds': float(os.getenv('VIEWS_FLUSH_SECONDS', 10))
+        }
+
+        # Called with [{'id', 'yelp_id'}] of shops whose content changed (summary/tile caches)
+        self.invalidation_listeners: List[Callable[[List[Dict]], None]] = []
+
+        self.pending_views = Counter()
+        self._views_lock = threading.Lock()
+        self._views_flusher_pid = None
+        self._views_stop_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def add_invalidation_listener(self, listener: Callable[[List[Dict]], None]):
+        self.invalidation_listeners.append(listener)
+
+    def record_views(self, yelp_ids: Iterable[str]):
+        """Buffer shop views in memory; a flusher thread in this process writes them to view_count"""
+        with self._views_lock:
+            self.pending_views.update(yelp_id for yelp_id in yelp_ids if yelp_id)
+            # Threads do not survive fork, so each worker process starts its own flusher
+            if self._views_flusher_pid != os.getpid():
+                self._views_flusher_pid = os.getpid()
+                self._views_stop_event = threading.Event()
+                threading.Thread(target=self._flush_views_periodically, args=(self._views_stop_event,),
+                                 name='view-flusher', daemon=True).start()
+                atexit.register(self._stop_views_flusher, self._views_stop_event)
+
+    def flush_views(self):
+        with self._views_lock:
+            views, self.pending_views = self.pending_views, Counter()
+        if views:
+            self.db_service.record_views(dict(views))
+
+    def _flush_views_periodically(self, stop_event: threading.Event):
+        while not stop_event.wait(self.refresh_config['views_flush_seconds']):
+            try:
+                self.flush_views()
+            except Exception as e:
+                print(f"Error recording shop views: {e}")
+
+    def _stop_views_flusher(self, stop_event: threading.Event):
+        """Write out the views buffered since the last flush (at exit)"""
+        stop_event.set()
+        try:
+            self.flush_views()
+        except Exception as e:
+            print(f"Error recording shop views: {e}")
+
+    def _fetch(self, shop: Dict):
+        try:
+            return shop['id'], self.yelp_client.fetch_business(shop['yelp_id'], priority='crawl'), None
+        except Exception as e:
+            return shop['id'], None, e
+
+    def refresh_stale(self, limit: int = None) -> Dict:
+        """Refetch the stalest, most viewed shops and write only those whose content changed"""
+        started = time.perf_counter()
+        self.flush_views()
+
+        stale_shops = self.db_service.get_stale_shops(self.refresh_config['max_age_seconds'],
+                                                      limit or self.refresh_config['batch_size'])
+        if not stale_shops:
+            return {'checked': 0, 'changed': 0, 'errors': 0}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(self._fetch, stale_shops))
+
+        fetched = [(shop_id, business) for shop_id, business, error in results if error is None]
+        errors = len(results) - len(fetched)
+        changed_ids = self.db_service.apply_refresh(fetched)
+
+        if changed_ids:
+            yelp_ids = {shop['id']: shop['yelp_id'] for shop in stale_shops}
+            changed_shops = [{'id': shop_id, 'yelp_id': yelp_ids[shop_id]} for shop_id in changed_ids]
+            for listener in self.invalidation_listeners:
+                try:
+                    listener(changed_shops)
+                except Exception as e:
+                    print(f"Error propagating refresh invalidation: {e}")
+
+        stats = {
+            'checked': len(fetched),
+            'changed': len(changed_ids),
+            'errors': errors,
+            'elapsed_seconds': round(time.perf_counter() - started, 2)
+        }
+        print(f"Refresh pass: {stats}")
+        return stats
+
+    def start(self):
+        """Run refresh passes in a background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='shop-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.refresh_stale()
+            except Exception as e:
+                print(f"Error refreshing shops: {e}")
+            self._stop_event.wait(self.refresh_config['interval_seconds'])
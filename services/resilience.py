@@ -0,0 +1,200 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# Absolute time.monotonic() deadline of the current request (None outside requests)
+_deadline: contextvars.ContextVar = contextvars.ContextVar('deadline', default=None)
+# Upstreams that fell back during the current request (None outside requests)
+_degraded: contextvars.ContextVar = contextvars.ContextVar('degraded', default=None)
+
+class CircuitOpen(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open (retry in {retry_after:.0f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+class UpstreamUnavailable(Exception):
+    """An upstream missed its hedge budget or its circuit is open; callers serve local data"""
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: float = 0.5, slow_call_seconds: float = 3.0,
+                 slow_threshold: float = 0.8, window: int = 20, min_calls: int = 5, open_seconds: float = None,
+                 ignored: tuple = ()):
+        """Trip when too many of the last calls failed or were slow; probe once after open_seconds
+
+        closed: calls pass and outcomes are recorded. open: calls are refused until open_seconds pass.
+        half_open: a single probe call is let through; success closes the circuit, failure reopens it.
+        Exceptions in ignored (e.g. our own quota refusals) are not the upstream's fault and don't count.
+        """
+        self.name = name
+        self.ignored = ignored
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_threshold = slow_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds if open_seconds is not None else float(os.getenv('BREAKER_OPEN_SECONDS', 30))
+        self.outcomes = deque(maxlen=window)  # (failed, slow) of recent calls
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now (claims the probe slot when half-open)"""
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self.state = 'half_open'
+            if self.state == 'half_open':
+                if self.probe_in_flight:
+                    self.rejected += 1
+                    return False
+                self.probe_in_flight = True
+            return True
+
+    def release(self):
+        """Give back an allowed call that never reached the upstream"""
+        with self._lock:
+            self.probe_in_flight = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+
+    def record(self, failed: bool, elapsed: float):
+        """Record a call's outcome and open or close the circuit"""
+        slow = elapsed >= self.slow_call_seconds
+        with self._lock:
+            if self.state == 'half_open':
+                self.probe_in_flight = False
+                if failed or slow:
+                    self._open()
+                else:
+                    self.state = 'closed'
+                    self.outcomes.clear()
+                return
+
+            self.outcomes.append((failed, slow))
+            if self.state == 'closed' and len(self.outcomes) >= self.min_calls:
+                failures = sum(1 for failed_call, _ in self.outcomes if failed_call)
+                slow_calls = sum(1 for _, slow_call in self.outcomes if slow_call)
+                if (failures / len(self.outcomes) >= self.failure_threshold or
+                        slow_calls / len(self.outcomes) >= self.slow_threshold):
+                    self._open()
+
+    def _open(self):
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+        self.times_opened += 1
+        print(f"Circuit {self.name} opened for {self.open_seconds:.0f}s")
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn through the breaker (raises CircuitOpen without calling it when open)"""
+        if not self.allow():
+            raise CircuitOpen(self.name, self.retry_after())
+        return self.run_allowed(fn, *args, **kwargs)
+
+    def run_allowed(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn after allow() returned True and record its outcome"""
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except self.ignored:
+            self.release()
+            raise
+        except Exception:
+            self.record(True, time.monotonic() - started)
+            raise
+        self.record(False, time.monotonic() - started)
+        return result
+
+    def get_statistics(self) -> Dict:
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self.state,
+                'recent_calls': len(self.outcomes),
+                'recent_failures': sum(1 for failed, _ in self.outcomes if failed),
+                'recent_slow_calls': sum(1 for _, slow in self.outcomes if slow),
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+                'retry_after_seconds': round(self.retry_after(), 1) if self.state == 'open' else 0
+            }
+
+def start_request(seconds: float):
+    """Start a request's deadline and degraded-upstream record; returns tokens for end_request"""
+    return _deadline.set(time.monotonic() + seconds), _degraded.set(set())
+
+def end_request(tokens):
+    deadline_token, degraded_token = tokens
+    _deadline.reset(deadline_token)
+    _degraded.reset(degraded_token)
+
+def remaining(default: Optional[float] = None) -> Optional[float]:
+    """Seconds left before the current deadline (default when there is none)"""
+    current = _deadline.get()
+    return default if current is None else max(0.0, current - time.monotonic())
+
+def mark_degraded(name: str):
+    degraded = _degraded.get()
+    if degraded is not None:
+        degraded.add(name)
+
+def degraded_upstreams() -> list:
+    """Upstreams that fell back to local or cached data during the current request"""
+    return sorted(_degraded.get() or ())
+
+class Hedger:
+    def __init__(self, max_workers: int = None):
+        """Run upstream calls in background threads that outlive a request's hedge budget"""
+        self.max_workers = max_workers or int(os.getenv('HEDGE_MAX_WORKERS', 8))
+        self._executor = None
+        self._executor_pid = None
+        self._in_flight: Dict[Hashable, Any] = {}
+        # Reentrant: a call that finishes before its done-callback is added runs _finished inside call's lock
+        self._lock = threading.RLock()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Executor threads do not survive fork, so each worker process starts its own
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='hedge')
+            self._executor_pid = os.getpid()
+            self._in_flight = {}
+        return self._executor
+
+    def call(self, breaker: CircuitBreaker, key: Hashable, fn: Callable[[], Any], budget_seconds: float) -> Any:
+        """Return fn()'s result if it arrives within the budget (and the request deadline)
+
+        Otherwise raise UpstreamUnavailable so the caller can serve local or cached data at once;
+        fn keeps running in the background and is expected to refresh the cache itself. Concurrent
+        calls with the same key share one upstream call.
+        """
+        wait_seconds = min(budget_seconds, remaining(budget_seconds))
+        with self._lock:
+            future = self._in_flight.get(key) if self._executor_pid == os.getpid() else None
+            if future is None:
+                if not breaker.allow():
+                    mark_degraded(breaker.name)
+                    raise UpstreamUnavailable(str(CircuitOpen(breaker.name, breaker.retry_after())))
+                future = self._pool().submit(breaker.run_allowed, fn)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda done, key=key: self._finished(key, done))
+
+        try:
+            return future.result(timeout=wait_seconds)
+        except FutureTimeoutError:
+            mark_degraded(breaker.name)
+            raise UpstreamUnavailable(f"{breaker.name} did not answer within {wait_seconds:.2f}s") from None
+
+    def _finished(self, key: Hashable, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
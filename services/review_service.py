@@ -0,0 +1,116 @@
+from typing import List, Dict, Optional
+
+class ReviewService:
+    def __init__(self, db_service, nlp_service):
+        """Initialize review ingestion and theme analytics on top of the reviews table"""
+        self.db_service = db_service
+        self.nlp_service = nlp_service
+
+    def _normalize_review(self, review: Dict) -> Dict:
+        """Accept Yelp review payloads as well as the app's {user, rating, comment} shape"""
+        user = review.get('user')
+        if isinstance(user, dict):
+            user = user.get('name')
+        return {
+            'user_name': user or review.get('user_name') or 'Anonymous',
+            'rating': min(max(int(review.get('rating', 5)), 1), 5),
+            'comment': review.get('text', review.get('comment', '')) or '',
+            'yelp_review_id': review.get('id') if isinstance(review.get('id'), str) else review.get('yelp_review_id'),
+            'created_at': review.get('time_created') or review.get('created_at')
+        }
+
+    def ingest_reviews(self, coffee_shop_id: int, reviews: List[Dict]) -> int:
+        """Store new reviews and update the shop's theme counters in the same transaction"""
+        ingested = 0
+        with self.db_service.get_connection(coffee_shop_id) as conn:
+            cursor = conn.cursor()
+            for review in reviews:
+                review = self._normalize_review(review)
+                cursor.execute("""
+                    INSERT OR IGNORE INTO reviews
+                    (coffee_shop_id, user_name, rating, comment, yelp_review_id, created_at)
+                    VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                """, (coffee_shop_id, review['user_name'], review['rating'], review['comment'],
+                      review['yelp_review_id'], review['created_at']))
+                if cursor.rowcount == 0:
+                    continue  # Already ingested (same Yelp review id)
+
+                self._count_terms(cursor, coffee_shop_id, review['comment'])
+                ingested += 1
+        return ingested
+
+    def _count_terms(self, cursor, coffee_shop_id: int, text: str):
+        """Increment term and theme counters for one review"""
+        for theme, term in self.nlp_service.extract_review_terms(text):
+            cursor.execute("""
+                INSERT INTO review_term_counts (coffee_shop_id, theme, term, review_count)
+                VALUES (?, ?, ?, 1)
+                ON CONFLICT(coffee_shop_id, theme, term) DO UPDATE SET review_count = review_count + 1
+            """, (coffee_shop_id, theme, term))
+            cursor.execute("""
+                SELECT review_count FROM review_term_counts
+                WHERE coffee_shop_id = ? AND theme = ? AND term = ?
+            """, (coffee_shop_id, theme, term))
+            first_mention = cursor.fetchone()[0] == 1
+
+            cursor.execute("""
+                INSERT INTO review_themes (coffee_shop_id, theme, terms_present, mentions)
+                VALUES (?, ?, ?, 1)
+                ON CONFLICT(coffee_shop_id, theme) DO UPDATE SET
+                    terms_present = terms_present + excluded.terms_present,
+                    mentions = mentions + 1
+            """, (coffee_shop_id, theme, int(first_mention)))
+
+    def get_theme_counts(self, coffee_shop_id: int) -> Dict[str, Dict]:
+        """Get precomputed theme aggregates for a shop"""
+        with self.db_service.get_connection(coffee_shop_id) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT theme, terms_present, mentions FROM review_themes WHERE coffee_shop_id = ?
+            """, (coffee_shop_id,))
+            return {row['theme']: {'terms_present': row['terms_present'], 'mentions': row['mentions']}
+                    for row in cursor.fetchall()}
+
+    def get_theme_summary(self, coffee_shop_id: int) -> str:
+        """Theme summary served from the aggregates, independent of review volume"""
+        counts = self.get_theme_counts(coffee_shop_id)
+        return self.nlp_service.summarize_review_themes(
+            {theme: values['terms_present'] for theme, values in counts.items()})
+
+    def get_recent_reviews(self, coffee_shop_id: int, limit: int = 10) -> List[Dict]:
+        """Get a shop's newest reviews (served by idx_reviews_shop_created)"""
+        with self.db_service.get_connection(coffee_shop_id) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT user_name, rating, comment, created_at FROM reviews
+                WHERE coffee_shop_id = ?
+                ORDER BY created_at DESC
+                LIMIT ?
+            """, (coffee_shop_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def fetch_and_ingest_yelp_reviews(self, coffee_shop_id: int, yelp_client) -> int:
+        """Pull a stored shop's latest Yelp reviews and ingest the new ones"""
+        shop = self.db_service.get_shop_by_id(coffee_shop_id)
+        if not shop or not shop.get('yelp_id'):
+            return 0
+        return self.ingest_reviews(coffee_shop_id, yelp_client.fetch_reviews(shop['yelp_id']))
+
+    def rebuild_theme_counters(self, coffee_shop_id: Optional[int] = None):
+        """Recompute counters from the stored reviews (backfill after a theme change)"""
+        if coffee_shop_id is None:
+            # Reviews live next to their shop, so every shard is rebuilt on its own
+            for shard in self.db_service.shards():
+                with shard.get_connection() as conn:
+                    self._rebuild_counters(conn, "", ())
+        else:
+            with self.db_service.get_connection(coffee_shop_id) as conn:
+                self._rebuild_counters(conn, "WHERE coffee_shop_id = ?", (coffee_shop_id,))
+
+    def _rebuild_counters(self, conn, where: str, params: tuple):
+        cursor = conn.cursor()
+        cursor.execute(f"DELETE FROM review_term_counts {where}", params)
+        cursor.execute(f"DELETE FROM review_themes {where}", params)
+        cursor.execute(f"SELECT coffee_shop_id, comment FROM reviews {where}", params)
+        for row in cursor.fetchall():
+            self._count_terms(conn.cursor(), row['coffee_shop_id'], row['comment'])
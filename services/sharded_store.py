@@ -0,0 +1,260 @@
+import glob
+import heapq
+import os
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .cache_service import TTLCache
+from .database_service import CoffeeShopDatabaseService
+from .geo_utils import GEOHASH_ALPHABET, bounding_box, geohash_bounds, geohash_encode
+from .nlp_summary_service import NLPSummaryService
+from .shop import Shop
+
+# Shop ids carry their shard number above these bits, so any id routes straight to its file
+SHARD_ID_BITS = 32
+
+class ShardedShopStore:
+    def __init__(self, shard_dir: str = None, precision: int = None, max_workers: int = None, tagger=None):
+        """Initialize a shop store split into one SQLite file per geohash prefix
+
+        Point, radius and bounding-box queries only open the shards whose cells overlap the area and
+        run them in parallel, merging the results by distance. Bulk loads write each region's file on
+        its own, so loads into different regions never wait on the same database lock.
+        """
+        self.shard_dir = shard_dir or os.getenv('SHARD_DIR', 'database/shards')
+        # Geohash characters per shard: 2 gives ~1250 km cells, 3 gives ~156 km cells
+        self.precision = precision or int(os.getenv('SHARD_PRECISION', 3))
+        self.max_workers = max_workers or int(os.getenv('SHARD_MAX_WORKERS', 8))
+        self.tagger = tagger or NLPSummaryService().derive_tags
+        self.statistics_cache = TTLCache('statistics', max_entries=16, ttl_seconds=300)
+        self._shards: Dict[str, CoffeeShopDatabaseService] = {}
+        self._shards_by_number: Dict[int, CoffeeShopDatabaseService] = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+        os.makedirs(self.shard_dir, exist_ok=True)
+        for path in sorted(glob.glob(os.path.join(self.shard_dir, '*.db'))):
+            prefix = os.path.splitext(os.path.basename(path))[0]
+            if len(prefix) == self.precision and all(char in GEOHASH_ALPHABET for char in prefix):
+                self._open_shard(prefix)
+
+    def _shard_number(self, prefix: str) -> int:
+        """Stable number of a geohash prefix (0 is left to the single-file store)"""
+        number = 0
+        for char in prefix:
+            number = number * 32 + GEOHASH_ALPHABET.index(char)
+        return number + 1
+
+    def _open_shard(self, prefix: str) -> CoffeeShopDatabaseService:
+        with self._lock:
+            shard = self._shards.get(prefix)
+            if shard is None:
+                number = self._shard_number(prefix)
+                shard = CoffeeShopDatabaseService(os.path.join(self.shard_dir, f"{prefix}.db"), tagger=self.tagger,
+                                                  id_offset=number << SHARD_ID_BITS)
+                self._shards[prefix] = self._shards_by_number[number] = shard
+            return shard
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Executor threads do not survive fork, so each worker process starts its own
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='shard')
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _map(self, fn: Callable, shards: List[CoffeeShopDatabaseService]) -> List:
+        """Run fn(shard) for each shard, in parallel when there is more than one"""
+        if len(shards) <= 1:
+            return [fn(shard) for shard in shards]
+        return list(self._pool().map(fn, shards))
+
+    def shards(self) -> List[CoffeeShopDatabaseService]:
+        """Every shard that holds data, in prefix order"""
+        return [self._shards[prefix] for prefix in sorted(self._shards)]
+
+    def shard_for(self, lat: float, lng: float) -> CoffeeShopDatabaseService:
+        """Shard that stores a coordinate (created on first write)"""
+        return self._open_shard(geohash_encode(lat, lng, self.precision))
+
+    def _shard_for_id(self, shop_id: int) -> Optional[CoffeeShopDatabaseService]:
+        return self._shards_by_number.get(int(shop_id) >> SHARD_ID_BITS)
+
+    def _shards_in_bbox(self, south: float, west: float, north: float, east: float) -> List[CoffeeShopDatabaseService]:
+        """Existing shards whose geohash cell overlaps a bounding box"""
+        overlapping = []
+        for prefix in sorted(self._shards):
+            cell_south, cell_west, cell_north, cell_east = geohash_bounds(prefix)
+            if cell_south <= north and cell_north >= south and cell_west <= east and cell_east >= west:
+                overlapping.append(self._shards[prefix])
+        return overlapping
+
+    def _group_by_shard(self, items, key: Callable) -> Dict[CoffeeShopDatabaseService, List]:
+        grouped = defaultdict(list)
+        for item in items:
+            shard = key(item)
+            if shard is not None:
+                grouped[shard].append(item)
+        return grouped
+
+    def get_connection(self, shop_id: Optional[int] = None):
+        """Connection to the shard that stores a shop"""
+        shard = self._shard_for_id(shop_id) if shop_id is not None else None
+        if shard is None:
+            raise ValueError(f"No shard stores shop {shop_id}")
+        return shard.get_connection()
+
+    def insert_coffee_shop(self, shop_data: Dict) -> int:
+        """Insert a new coffee shop into its region's shard and return its ID"""
+        return self.shard_for(shop_data['lat'], shop_data['lng']).insert_coffee_shop(shop_data)
+
+    def bulk_upsert_yelp_businesses(self, businesses: List[Dict]) -> int:
+        """Insert or update raw Yelp businesses, writing each region's shard in parallel"""
+        def shard_of(business):
+            coordinates = business.get('coordinates') or {}
+            if coordinates.get('latitude') is None or coordinates.get('longitude') is None:
+                return None
+            return self.shard_for(coordinates['latitude'], coordinates['longitude'])
+
+        grouped = self._group_by_shard(businesses, shard_of)
+        return sum(self._map(lambda shard: shard.bulk_upsert_yelp_businesses(grouped[shard]), list(grouped)))
+
+    def tag_shops(self, shop_ids: Optional[List[int]] = None):
+        """Derive and store tags for the given shops (all shops when None)"""
+        if shop_ids is None:
+            self._map(lambda shard: shard.tag_shops(), self.shards())
+            return
+        grouped = self._group_by_shard(shop_ids, self._shard_for_id)
+        self._map(lambda shard: shard.tag_shops(grouped[shard]), list(grouped))
+
+    def get_all_open_intervals(self) -> List[Dict]:
+        return [row for rows in self._map(lambda shard: shard.get_all_open_intervals(), self.shards()) for row in rows]
+
+    def get_all_shop_tags(self) -> List[Dict]:
+        return [row for rows in self._map(lambda shard: shard.get_all_shop_tags(), self.shards()) for row in rows]
+
+    def get_stale_shops(self, max_age_seconds: int, limit: int = 100) -> List[Dict]:
+        """Get Yelp-backed shops not fetched within max_age_seconds, most viewed first across shards"""
+        per_shard = self._map(lambda shard: shard.get_stale_shops(max_age_seconds, limit), self.shards())
+        # Same order as the per-shard query: most viewed, then never fetched, then oldest fetch
+        merged = heapq.merge(*per_shard, key=lambda shop: (-shop['view_count'], shop['fetched_at'] is not None,
+                                                            shop['fetched_at'] or ''))
+        return list(islice(merged, limit))
+
+    def apply_refresh(self, fetched: List[Tuple[int, Optional[Dict]]]) -> List[int]:
+        """Store refreshed Yelp payloads in each shop's shard; returns ids whose content changed"""
+        grouped = self._group_by_shard(fetched, lambda item: self._shard_for_id(item[0]))
+        changed_ids = [shop_id for ids in self._map(lambda shard: shard.apply_refresh(grouped[shard]), list(grouped))
+                       for shop_id in ids]
+        if changed_ids:
+            self.statistics_cache.clear()
+        return changed_ids
+
+    def record_views(self, view_counts: Dict[str, int]):
+        """Add buffered view counts, keyed by Yelp business id (each id only matches in its own shard)"""
+        if view_counts:
+            self._map(lambda shard: shard.record_views(view_counts), self.shards())
+
+    def get_all_shops(self) -> List[Shop]:
+        return list(heapq.merge(*self._map(lambda shard: shard.get_all_shops(), self.shards()),
+                                key=lambda shop: shop['name']))
+
+    def get_data_version(self) -> Tuple:
+        """Per-shard fingerprints; a new shard or a change in any shard changes the version"""
+        shards = self.shards()
+        return tuple(zip((shard.db_path for shard in shards), self._map(lambda shard: shard.get_data_version(), shards)))
+
+    def get_shop_by_id(self, shop_id: int) -> Optional[Shop]:
+        shard = self._shard_for_id(shop_id)
+        return shard.get_shop_by_id(shop_id) if shard else None
+
+    def _merge_by_rating(self, query: Callable) -> List[Shop]:
+        return list(heapq.merge(*self._map(query, self.shards()), key=lambda shop: -(shop['rating'] or 0)))
+
+    def get_shops_by_zip(self, zip_code: str) -> List[Shop]:
+        return self._merge_by_rating(lambda shard: shard.get_shops_by_zip(zip_code))
+
+    def get_shops_by_city(self, city: str) -> List[Shop]:
+        return self._merge_by_rating(lambda shard: shard.get_shops_by_city(city))
+
+    def get_shops_by_state(self, state: str) -> List[Shop]:
+        return self._merge_by_rating(lambda shard: shard.get_shops_by_state(state))
+
+    def get_shops_by_rating(self, min_rating: float = 0.0) -> List[Shop]:
+        return self._merge_by_rating(lambda shard: shard.get_shops_by_rating(min_rating))
+
+    def search_shops(self, query: str) -> List[Shop]:
+        return self._merge_by_rating(lambda shard: shard.search_shops(query))
+
+    def get_shops_near_location(self, lat: float, lng: float, radius_miles: float = 10.0) -> List[Shop]:
+        """Get coffee shops within a radius from the overlapping shards, nearest first"""
+        shards = self._shards_in_bbox(*bounding_box(lat, lng, radius_miles))
+        per_shard = self._map(lambda shard: shard.get_shops_near_location(lat, lng, radius_miles), shards)
+        # Each shard's list is already sorted by distance, so a k-way merge keeps the order
+        return list(heapq.merge(*per_shard, key=lambda shop: shop['distance']))
+
+    def get_shops_in_bbox(self, south: float, west: float, north: float, east: float) -> List[Shop]:
+        shards = self._shards_in_bbox(south, west, north, east)
+        return [shop for shops in self._map(lambda shard: shard.get_shops_in_bbox(south, west, north, east), shards)
+                for shop in shops]
+
+    def get_location_centroid(self, location_query: str) -> Optional[Tuple[float, float]]:
+        """Average position of the stored shops in a ZIP code or city, across shards"""
+        totals = self._map(lambda shard: shard.get_location_totals(location_query), self.shards())
+        count = sum(total[2] for total in totals)
+        if not count:
+            return None
+        return (sum(total[0] for total in totals) / count, sum(total[1] for total in totals) / count)
+
+    def get_statistics(self) -> Dict:
+        """Get statistics about the coffee shop data (cached per data version)"""
+        version = self.get_data_version()
+        stats = self.statistics_cache.get(version)
+        if stats is None:
+            stats = self._compute_statistics()
+            self.statistics_cache.set(version, stats)
+        return stats
+
+    def _shard_aggregates(self, shard: CoffeeShopDatabaseService) -> Dict:
+        with shard.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*), (SELECT COUNT(*) FROM coffee_shops WHERE rating > 0), "
+                           "(SELECT COALESCE(SUM(rating), 0) FROM coffee_shops WHERE rating > 0) FROM coffee_shops")
+            total, rated, rating_sum = cursor.fetchone()
+            cursor.execute("SELECT name, rating FROM coffee_shops ORDER BY rating DESC LIMIT 3")
+            top_rated = [dict(row) for row in cursor.fetchall()]
+            cursor.execute("SELECT state, COUNT(*) FROM coffee_shops GROUP BY state")
+            states = Counter({row[0]: row[1] for row in cursor.fetchall()})
+            cursor.execute("SELECT city, COUNT(*) FROM coffee_shops GROUP BY city")
+            cities = Counter({row[0]: row[1] for row in cursor.fetchall()})
+        return {'total': total, 'rated': rated, 'rating_sum': rating_sum, 'top_rated': top_rated,
+                'states': states, 'cities': cities}
+
+    def _compute_statistics(self) -> Dict:
+        """Combine exact per-shard aggregates into the single-file statistics shape"""
+        aggregates = self._map(self._shard_aggregates, self.shards())
+        rated = sum(aggregate['rated'] for aggregate in aggregates)
+        states, cities = Counter(), Counter()
+        for aggregate in aggregates:
+            states.update(aggregate['states'])
+            cities.update(aggregate['cities'])
+        return {
+            'total_shops': sum(aggregate['total'] for aggregate in aggregates),
+            'avg_rating': round(sum(aggregate['rating_sum'] for aggregate in aggregates) / rated, 2) if rated else 0.0,
+            'top_rated': heapq.nlargest(3, (shop for aggregate in aggregates for shop in aggregate['top_rated']),
+                                        key=lambda shop: shop['rating']),
+            'shops_by_state': dict(states),
+            'shops_by_city': dict(cities.most_common(10)),
+            'shards': len(aggregates)
+        }
+
+def create_shop_store(db_path: str = None, shard_dir: str = None, tagger=None):
+    """Sharded store when a shard directory is given (or SHARD_DIR is set), else the single-file store
+    at db_path (default $SHOP_DB_PATH or database/coffee_shops.db)"""
+    shard_dir = shard_dir or os.getenv('SHARD_DIR')
+    if shard_dir:
+        return ShardedShopStore(shard_dir, tagger=tagger)
+    return CoffeeShopDatabaseService(db_path or os.getenv('SHOP_DB_PATH', 'database/coffee_shops.db'), tagger=tagger)
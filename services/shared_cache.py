@@ -0,0 +1,149 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .query_log_service import record_cache_lookup
+
+class SQLiteCache:
+    def __init__(self, name: str, max_entries: int = 1000, ttl_seconds: float = 3600,
+                 path: str = "cache/shared_cache.db"):
+        """Initialize a TTL/LRU cache stored in a SQLite file shared by every worker process"""
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        # Recency is only rewritten when older than this, so hot reads don't turn into writes
+        self.touch_interval = min(60.0, ttl_seconds / 10)
+        # Eviction runs every few sets, so a namespace may briefly exceed max_entries by ~10%
+        self.evict_every = max(1, min(64, max_entries // 10))
+        self._local = threading.local()
+        self._sets_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    key_blob BLOB NOT NULL,
+                    value BLOB NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache_entries(namespace, accessed_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread, reopened in a forked child"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _key(self, key: Hashable) -> str:
+        return repr(key)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value, or default if it is missing or expired"""
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at, accessed_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                           (self.name, self._key(key))).fetchone()
+        if row is None or row[1] <= now:
+            self.misses += 1
+            record_cache_lookup(self.name, False)
+            return default
+        if now - row[2] > self.touch_interval:
+            conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                         (now, self.name, self._key(key)))
+        self.hits += 1
+        record_cache_lookup(self.name, True)
+        return pickle.loads(row[0])
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float = None):
+        """Store a value; the least recently used entries beyond max_entries are evicted periodically"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        now = time.time()
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?, ?)",
+                     (self.name, self._key(key), pickle.dumps(key), pickle.dumps(value), now + ttl, now))
+
+        self._sets_since_evict += 1
+        if self._sets_since_evict >= self.evict_every:
+            self._sets_since_evict = 0
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drop expired entries, then the least recently used ones beyond max_entries"""
+        conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?", (self.name, now))
+        conn.execute("""
+            DELETE FROM cache_entries WHERE namespace = ? AND key IN (
+                SELECT key FROM cache_entries WHERE namespace = ?
+                ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.name, self.name, self.max_entries))
+
+    def delete(self, key: Hashable):
+        self._connection().execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                                   (self.name, self._key(key)))
+
+    def delete_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Delete every entry whose key matches predicate; returns the number removed"""
+        conn = self._connection()
+        rows = conn.execute("SELECT key, key_blob FROM cache_entries WHERE namespace = ?", (self.name,)).fetchall()
+        keys = [(self.name, key) for key, key_blob in rows if predicate(pickle.loads(key_blob))]
+        conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", keys)
+        return len(keys)
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.name,))
+
+    def ttl_remaining(self, key: Hashable) -> Optional[float]:
+        """Seconds until an entry expires, or None if it is not cached"""
+        row = self._connection().execute("SELECT expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                                         (self.name, self._key(key))).fetchone()
+        if row is None:
+            return None
+        remaining = row[0] - time.time()
+        return remaining if remaining > 0 else None
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Snapshot of the unexpired (key, value) pairs (not counted as lookups)"""
+        rows = self._connection().execute("SELECT key_blob, value FROM cache_entries WHERE namespace = ? AND expires_at > ?",
+                                          (self.name, time.time())).fetchall()
+        return [(pickle.loads(key_blob), pickle.loads(value)) for key_blob, value in rows]
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM cache_entries WHERE namespace = ? AND expires_at > ?",
+                                          (self.name, time.time())).fetchone()[0]
+
+    def memory_usage(self, sample_size: int = 200) -> Dict:
+        """Serialized bytes of the unexpired entries, held in the shared file rather than this process"""
+        stored = self._connection().execute("""
+            SELECT COALESCE(SUM(LENGTH(key) + LENGTH(key_blob) + LENGTH(value)), 0) FROM cache_entries
+            WHERE namespace = ? AND expires_at > ?
+        """, (self.name, time.time())).fetchone()[0]
+        return {'storage': 'sqlite', 'approximate_bytes': stored, 'path': self.path}
+
+    def get_statistics(self) -> Dict:
+        """Get entry count (shared) and hit ratio (this process)"""
+        lookups = self.hits + self.misses
+        return {
+            'name': self.name,
+            'backend': 'sqlite',
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+        }
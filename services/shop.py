@@ -0,0 +1,89 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+# Every field a shop can carry, across Yelp results, database rows and the CSV dataset
+SHOP_FIELDS = (
+    'id', 'yelp_id', 'name', 'address', 'city', 'state', 'zip_code', 'lat', 'lng',
+    'rating', 'review_count', 'price', 'description', 'signature_drink', 'phone', 'hours',
+    'website', 'yelp_url', 'image_url', 'nlp_summary', 'tags', 'distance', 'route_miles', 'score', 'open',
+    'fetched_at', 'content_hash', 'view_count', 'created_at', 'updated_at'
+)
+_FIELD_SET = frozenset(SHOP_FIELDS)
+
+class Shop(Mapping):
+    """Immutable shop record shared by every service and cache
+
+    Only the fields a source actually provides are set, so to_dict() keeps each source's JSON
+    shape. Reads work like a dict (shop['name'], shop.get('rating')); changes go through
+    replace(), which returns a new record, so one instance can sit in several caches safely.
+    """
+    __slots__ = SHOP_FIELDS
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_record(cls, record: Mapping) -> 'Shop':
+        """Build from a dict-like record, ignoring keys that are not shop fields"""
+        if isinstance(record, cls):
+            return record
+        return cls(**{key: value for key, value in record.items() if key in _FIELD_SET})
+
+    @classmethod
+    def from_row(cls, row) -> 'Shop':
+        """Build from a sqlite3.Row without an intermediate dict"""
+        return cls(**{key: row[key] for key in row.keys() if key in _FIELD_SET})
+
+    @classmethod
+    def from_columns(cls, columns: Tuple[str, ...], values: Iterable[Any]) -> 'Shop':
+        """Build from parallel column names and values (e.g. DataFrame.itertuples)"""
+        return cls(**{key: value for key, value in zip(columns, values) if key in _FIELD_SET})
+
+    def replace(self, **changes) -> 'Shop':
+        """Return a copy with some fields changed"""
+        fields = self.to_dict()
+        fields.update(changes)
+        return Shop(**fields)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict of the fields that are set (used at the JSON edge)"""
+        return {name: getattr(self, name) for name in SHOP_FIELDS if hasattr(self, name)}
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Shop is immutable; use replace()")
+
+    def __delattr__(self, name):
+        raise AttributeError("Shop is immutable; use replace()")
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Optional[Any] = None) -> Any:
+        if key not in _FIELD_SET:
+            return default
+        return getattr(self, key, default)
+
+    def __contains__(self, key) -> bool:
+        return key in _FIELD_SET and hasattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name in SHOP_FIELDS if hasattr(self, name))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __reduce__(self):
+        # Pickled by the shared cache; the default slots protocol would go through __setattr__
+        return (_restore_shop, (self.to_dict(),))
+
+    def __repr__(self) -> str:
+        return f"Shop(id={self.get('id')!r}, name={self.get('name')!r})"
+
+def _restore_shop(fields: Dict[str, Any]) -> Shop:
+    return Shop(**fields)
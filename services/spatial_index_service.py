@@ -0,0 +1,274 @@
+import hashlib
+import os
+import threading
+import time
+from math import ceil, floor, log2
+from typing import List, Dict, Sequence, Tuple
+
+from .geo_utils import haversine_miles, bounding_box, lat_lng_to_world_pixel, project_onto_segment
+from .shop import Shop
+
+class SpatialIndexService:
+    def __init__(self, db_service, cell_size_degrees: float = 0.05, refresh_interval: float = None):
+        """Initialize an in-memory grid index and per-zoom clusters over the local shop store"""
+        self.db_service = db_service
+        self.cell_size = cell_size_degrees
+        self.refresh_interval = refresh_interval if refresh_interval is not None else float(os.getenv('SPATIAL_INDEX_REFRESH_SECONDS', 30))
+
+        self.clustering_config = {
+            'cluster_radius_px': 60,  # Shops closer than this on screen share a cluster
+            'max_cluster_zoom': 14,  # At this zoom and above individual shops are returned
+            'min_zoom': 0,
+            'max_zoom': 20,  # Higher requested zooms are clamped to this (as tile requests are)
+            # Viewports wider or taller than this on screen are answered at a lower zoom that fits,
+            # which bounds the features per request (about (4096 / 60)^2 clusters)
+            'max_viewport_px': int(os.getenv('MAP_MAX_VIEWPORT_PX', 4096))
+        }
+
+        # Built structures are swapped in as a whole so readers never see a partial index
+        self._state = None
+        self._build_lock = threading.Lock()
+        self._last_check = 0.0
+
+    def _current_state(self) -> Dict:
+        """Return the index, rebuilding it when the underlying store has changed"""
+        state = self._state
+        now = time.monotonic()
+        if state is not None and now - self._last_check < self.refresh_interval:
+            return state
+
+        with self._build_lock:
+            self._last_check = now
+            version = self.db_service.get_data_version()
+            if self._state is None or self._state['version'] != version:
+                self._state = self._build(version)
+            return self._state
+
+    def rebuild(self):
+        """Force a rebuild of the index from the store"""
+        with self._build_lock:
+            self._last_check = time.monotonic()
+            self._state = self._build(self.db_service.get_data_version())
+
+    def _build(self, version) -> Dict:
+        """Build the grid buckets and the per-zoom cluster hierarchy"""
+        started = time.perf_counter()
+        shops = [shop for shop in self.db_service.get_all_shops()
+                 if shop.get('lat') is not None and shop.get('lng') is not None]
+
+        grid = {}
+        for shop in shops:
+            grid.setdefault(self._cell(shop['lat'], shop['lng']), []).append(shop)
+
+        clusters_by_zoom = {}
+        for zoom in range(self.clustering_config['min_zoom'], self.clustering_config['max_cluster_zoom']):
+            clusters_by_zoom[zoom] = self._build_clusters(shops, zoom)
+
+        print(f"Spatial index built: {len(shops)} shops, {len(grid)} cells in {time.perf_counter() - started:.3f}s")
+        return {
+            'version': version,
+            'version_key': hashlib.sha1(repr(version).encode('utf-8')).hexdigest()[:12],
+            'shop_count': len(shops),
+            'grid': grid,
+            'clusters': clusters_by_zoom
+        }
+
+    def _build_clusters(self, shops: List[Shop], zoom: int) -> Dict:
+        """Aggregate shops into screen-space grid clusters for one zoom level"""
+        radius_px = self.clustering_config['cluster_radius_px']
+        buckets = {}
+
+        for shop in shops:
+            x, y = lat_lng_to_world_pixel(shop['lat'], shop['lng'], zoom)
+            key = (int(x // radius_px), int(y // radius_px))
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = {'count': 0, 'lat_sum': 0.0, 'lng_sum': 0.0, 'rating_sum': 0.0,
+                                         'bounds': [shop['lat'], shop['lng'], shop['lat'], shop['lng']],
+                                         'shop': shop}
+            bucket['count'] += 1
+            bucket['lat_sum'] += shop['lat']
+            bucket['lng_sum'] += shop['lng']
+            bucket['rating_sum'] += shop.get('rating') or 0.0
+            bounds = bucket['bounds']
+            bounds[0], bounds[1] = min(bounds[0], shop['lat']), min(bounds[1], shop['lng'])
+            bounds[2], bounds[3] = max(bounds[2], shop['lat']), max(bounds[3], shop['lng'])
+
+        clusters = {}
+        for key, bucket in buckets.items():
+            count = bucket['count']
+            if count == 1:
+                clusters[key] = {'type': 'shop', 'shop': bucket['shop']}
+            else:
+                clusters[key] = {
+                    'type': 'cluster',
+                    'id': f"{zoom}/{key[0]}/{key[1]}",
+                    'lat': bucket['lat_sum'] / count,
+                    'lng': bucket['lng_sum'] / count,
+                    'count': count,
+                    'avg_rating': round(bucket['rating_sum'] / count, 2),
+                    'bounds': bucket['bounds']  # [south, west, north, east] of its shops
+                }
+        return clusters
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (floor(lat / self.cell_size), floor(lng / self.cell_size))
+
+    def get_version_key(self) -> str:
+        """Short identifier of the store snapshot the index was built from"""
+        return self._current_state()['version_key']
+
+    def get_shop_points(self) -> List[Tuple[float, float]]:
+        """Get (lat, lng) of every indexed shop"""
+        grid = self._current_state()['grid']
+        return [(shop['lat'], shop['lng']) for cell_shops in grid.values() for shop in cell_shops]
+
+    def query_bbox(self, south: float, west: float, north: float, east: float) -> List[Shop]:
+        """Get shops inside a bounding box using the grid buckets"""
+        return self._query_grid(self._current_state()['grid'], south, west, north, east)
+
+    def _query_grid(self, grid: Dict, south: float, west: float, north: float, east: float) -> List[Shop]:
+        min_row, min_col = self._cell(south, west)
+        max_row, max_col = self._cell(north, east)
+
+        shops = []
+        cell_count = (max_row - min_row + 1) * (max_col - min_col + 1)
+        if cell_count > len(grid):
+            # Very large boxes: scanning occupied cells is cheaper than enumerating empty ones
+            candidates = (shop for cell_shops in grid.values() for shop in cell_shops)
+        else:
+            candidates = (shop
+                          for row in range(min_row, max_row + 1)
+                          for col in range(min_col, max_col + 1)
+                          for shop in grid.get((row, col), ()))
+
+        for shop in candidates:
+            if south <= shop['lat'] <= north and west <= shop['lng'] <= east:
+                shops.append(shop)
+        return shops
+
+    def query_radius(self, lat: float, lng: float, radius_miles: float) -> List[Shop]:
+        """Get shops within radius_miles of a point, nearest first"""
+        nearby_shops = []
+        for shop in self.query_bbox(*bounding_box(lat, lng, radius_miles)):
+            distance = haversine_miles(lat, lng, shop['lat'], shop['lng'])
+            if distance <= radius_miles:
+                nearby_shops.append(shop.replace(distance=round(distance, 2)))
+
+        nearby_shops.sort(key=lambda x: x['distance'])
+        return nearby_shops
+
+    def _route_segments(self, points: Sequence[Tuple[float, float]], max_segment_miles: float) -> Tuple[List[Tuple], float]:
+        """Split a route into (start, end, route miles at start) pieces no longer than max_segment_miles"""
+        segments = []
+        route_miles = 0.0
+        for start, end in zip(points, points[1:]):
+            pieces = max(1, ceil(haversine_miles(start[0], start[1], end[0], end[1]) / max_segment_miles))
+            for piece in range(pieces):
+                piece_start = (start[0] + (end[0] - start[0]) * piece / pieces,
+                               start[1] + (end[1] - start[1]) * piece / pieces)
+                piece_end = (start[0] + (end[0] - start[0]) * (piece + 1) / pieces,
+                             start[1] + (end[1] - start[1]) * (piece + 1) / pieces)
+                segments.append((piece_start, piece_end, route_miles))
+                route_miles += project_onto_segment(piece_end[0], piece_end[1], piece_start, piece_end)[2]
+        return segments, route_miles
+
+    def query_route(self, points: Sequence[Tuple[float, float]], corridor_miles: float,
+                    max_segment_miles: float = 2.0) -> Dict:
+        """Get shops within corridor_miles of a route, ordered by distance along it
+
+        The route is buffered into short segment bounding boxes whose grid cells are probed in one
+        batch, so the work grows with route length rather than with the number of stops.
+        """
+        state = self._current_state()
+        grid = state['grid']
+        if len(points) == 1:
+            points = [points[0], points[0]]
+        segments, total_miles = self._route_segments(points, max_segment_miles)
+
+        # Batch the probes: every grid cell touched by a buffered segment, with the segments near it
+        segments_by_cell = {}
+        for index, (start, end, _) in enumerate(segments):
+            south, west, _, _ = bounding_box(min(start[0], end[0]), min(start[1], end[1]), corridor_miles)
+            _, _, north, east = bounding_box(max(start[0], end[0]), max(start[1], end[1]), corridor_miles)
+            min_row, min_col = self._cell(south, west)
+            max_row, max_col = self._cell(north, east)
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    if (row, col) in grid:
+                        segments_by_cell.setdefault((row, col), []).append(index)
+
+        # Keep each shop's closest approach to the route
+        best = {}
+        for cell, segment_indices in segments_by_cell.items():
+            for shop in grid[cell]:
+                for index in segment_indices:
+                    start, end, route_miles = segments[index]
+                    fraction, offset, length = project_onto_segment(shop['lat'], shop['lng'], start, end)
+                    if offset <= corridor_miles:
+                        key = shop.get('id')
+                        if key not in best or offset < best[key][0]:
+                            best[key] = (offset, route_miles + fraction * length, shop)
+
+        shops = [shop.replace(distance=round(offset, 2), route_miles=round(along, 2))
+                 for offset, along, shop in sorted(best.values(), key=lambda match: match[1])]
+        return {'version_key': state['version_key'], 'route_miles': round(total_miles, 2),
+                'segments': len(segments), 'cells_probed': len(segments_by_cell), 'shops': shops}
+
+    def get_map_features(self, south: float, west: float, north: float, east: float, zoom: int) -> Dict:
+        """Get clusters (low zoom) or individual shops (high zoom) for a map viewport
+
+        A viewport larger than max_viewport_px at the requested zoom is answered at the highest
+        zoom it fits (the zoom used is returned), so one request cannot list a whole region's shops.
+        """
+        state = self._current_state()
+        zoom = min(max(zoom, self.clustering_config['min_zoom']), self.clustering_config['max_zoom'])
+        min_x, min_y = lat_lng_to_world_pixel(north, west, zoom)
+        max_x, max_y = lat_lng_to_world_pixel(south, east, zoom)
+        span_px = max(max_x - min_x, max_y - min_y)
+        if span_px > self.clustering_config['max_viewport_px']:
+            zoom = max(self.clustering_config['min_zoom'],
+                       zoom - ceil(log2(span_px / self.clustering_config['max_viewport_px'])))
+
+        if zoom >= self.clustering_config['max_cluster_zoom']:
+            shops = self._query_grid(state['grid'], south, west, north, east)
+            return {'clustered': False, 'zoom': zoom, 'version_key': state['version_key'],
+                    'features': [{'type': 'shop', 'shop': shop} for shop in shops]}
+
+        clusters = state['clusters'][zoom]
+        radius_px = self.clustering_config['cluster_radius_px']
+        min_x, min_y = lat_lng_to_world_pixel(north, west, zoom)
+        max_x, max_y = lat_lng_to_world_pixel(south, east, zoom)
+        min_col, max_col = int(min_x // radius_px), int(max_x // radius_px)
+        min_row, max_row = int(min_y // radius_px), int(max_y // radius_px)
+
+        # Enumerate only the cells covering the viewport, so work is proportional to screen size
+        if (max_col - min_col + 1) * (max_row - min_row + 1) > len(clusters):
+            candidates = clusters.values()
+        else:
+            candidates = (clusters[(col, row)]
+                          for col in range(min_col, max_col + 1)
+                          for row in range(min_row, max_row + 1)
+                          if (col, row) in clusters)
+
+        # A cluster is shown when any of its shops is in view, even if its centroid is not
+        features = []
+        for feature in candidates:
+            if feature['type'] == 'shop':
+                shop = feature['shop']
+                bounds = (shop['lat'], shop['lng'], shop['lat'], shop['lng'])
+            else:
+                bounds = feature['bounds']
+            if bounds[0] <= north and bounds[2] >= south and bounds[1] <= east and bounds[3] >= west:
+                features.append(feature)
+
+        return {'clustered': True, 'zoom': zoom, 'version_key': state['version_key'], 'features': features}
+
+    def get_statistics(self) -> Dict:
+        """Get index size information"""
+        state = self._current_state()
+        return {
+            'shop_count': state['shop_count'],
+            'grid_cells': len(state['grid']),
+            'clusters_per_zoom': {zoom: len(clusters) for zoom, clusters in state['clusters'].items()}
+        }
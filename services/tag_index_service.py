@@ -0,0 +1,58 @@
+import os
+import threading
+from typing import List, Dict, Tuple
+
+from .bitmap_index import BitmapIndex
+
+class TagIndexService:
+    def __init__(self, db_service, nlp_service, max_keys: int = None):
+        """Initialize in-memory tag bitmaps over stored shops and shops seen in search results"""
+        self.db_service = db_service
+        self.nlp_service = nlp_service
+        # Search results keep adding shops; the index is rebuilt from the store beyond this size
+        self.max_keys = max_keys or int(os.getenv('TAG_INDEX_MAX_KEYS', 200000))
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _get_index(self) -> BitmapIndex:
+        index = self._index
+        if index is None or len(index) > self.max_keys:
+            with self._lock:
+                if self._index is None or len(self._index) > self.max_keys:
+                    self._index = self._load()
+                index = self._index
+        return index
+
+    def _load(self) -> BitmapIndex:
+        """Build the bitmaps from the coffee_shop_tags table"""
+        index = BitmapIndex()
+        for shop in self.db_service.get_all_shop_tags():
+            index.add(shop['id'], shop['tags'])
+            if shop['yelp_id']:
+                # Search results identify stored shops by their Yelp id
+                index.add(shop['yelp_id'], shop['tags'])
+        return index
+
+    def reload(self, *args):
+        """Drop the bitmaps so they are rebuilt from the store on next use"""
+        self._index = None
+
+    def filter_shops(self, shops: List[Dict], required_tags: List[str]) -> Tuple[List[Dict], Dict[str, int]]:
+        """Keep shops carrying every required tag; returns them with tag facet counts"""
+        index = self._get_index()
+        for shop in shops:
+            if index.position(shop.get('id')) is None:
+                tags = shop.get('tags')
+                index.add(shop.get('id'), tags if tags is not None else self.nlp_service.derive_tags(shop))
+
+        mask = index.all_of(required_tags, within=index.mask_for_keys(shop.get('id') for shop in shops))
+        if required_tags:
+            matching = set(index.keys_for(mask))
+            shops = [shop for shop in shops if shop.get('id') in matching]
+        return shops, index.facet_counts(mask)
+
+    def query(self, required_tags: List[str]) -> Dict:
+        """Resolve a tag query over every indexed shop"""
+        index = self._get_index()
+        mask = index.all_of(required_tags)
+        return {'shop_ids': index.keys_for(mask), 'facets': index.facet_counts(mask)}
@@ -0,0 +1,165 @@
+import json
+import os
+import shutil
+import threading
+import time
+from typing import List, Dict, Optional
+
+from .geo_utils import lat_lng_to_tile, tile_bounds
+
+class TileCacheService:
+    def __init__(self, spatial_index, cache_dir: str = None, hot_zooms: List[int] = None):
+        """Initialize the on-disk JSON tile cache on top of the spatial index
+
+        Every process renders missing tiles on demand; only the builder process (see run_builder)
+        prebuilds hot tiles and prunes old versions, so workers never race over directories.
+        """
+        self.spatial_index = spatial_index
+        self.cache_dir = cache_dir or os.getenv('TILE_CACHE_DIR', 'cache/tiles')
+        if hot_zooms is None:
+            hot_zooms = [int(z) for z in os.getenv('TILE_HOT_ZOOMS', '8,9,10,11,12,13,14').split(',') if z.strip()]
+        self.hot_zooms = hot_zooms
+        self.max_zoom = 20
+        # How often the builder checks the store version for hot tiles to prebuild
+        self.check_seconds = float(os.getenv('TILE_BUILD_CHECK_SECONDS', 30))
+
+        self.builder = False
+        self._build_thread = None
+        self._build_lock = threading.Lock()
+        self._built_version = None
+
+    def tile_path(self, version_key: str, z: int, x: int, y: int) -> str:
+        return os.path.join(self.cache_dir, version_key, str(z), str(x), f"{y}.json")
+
+    def is_valid_tile(self, z: int, x: int, y: int) -> bool:
+        return 0 <= z <= self.max_zoom and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+    def get_tile(self, z: int, x: int, y: int, version_key: str = None) -> Optional[str]:
+        """Return the path of a cached tile, rendering it first; None for an unknown old version"""
+        current_key = self.spatial_index.get_version_key()
+        if self.builder and current_key != self._built_version:
+            # Shops changed since the last build: re-render the hot zooms for the new version
+            self.build_in_background()
+        version_key = version_key or current_key
+        if not version_key.isalnum():
+            return None
+
+        path = self.tile_path(version_key, z, x, y)
+        if os.path.exists(path):
+            return path
+        if version_key != current_key:
+            return None
+
+        return self._render_tile(z, x, y)
+
+    def _render_tile(self, z: int, x: int, y: int) -> str:
+        """Render one tile from the spatial index and write it to disk atomically"""
+        south, west, north, east = tile_bounds(z, x, y)
+        result = self.spatial_index.get_map_features(south, west, north, east, z)
+
+        features = []
+        for feature in result['features']:
+            if feature['type'] == 'shop':
+                shop = feature['shop']
+                features.append({
+                    'type': 'shop',
+                    'id': shop.get('id'),
+                    'name': shop.get('name'),
+                    'lat': shop['lat'],
+                    'lng': shop['lng'],
+                    'rating': shop.get('rating'),
+                    'address': shop.get('address')
+                })
+            else:
+                features.append(feature)
+
+        payload = json.dumps({
+            'z': z, 'x': x, 'y': y,
+            'version': result['version_key'],
+            'clustered': result['clustered'],
+            'features': features
+        }, separators=(',', ':'))
+
+        path = self.tile_path(result['version_key'], z, x, y)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        for attempt in range(2):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                with open(tmp_path, 'w') as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+                return path
+            except FileNotFoundError:
+                # The builder pruned this version's directory in between; recreate it once
+                if attempt:
+                    raise
+        return path
+
+    def build_hot_tiles(self) -> Dict:
+        """Render every non-empty tile at the hot zoom levels and prune stale versions"""
+        started = time.perf_counter()
+        version_key = self.spatial_index.get_version_key()
+        self._built_version = version_key
+        points = self.spatial_index.get_shop_points()
+
+        built = 0
+        for z in self.hot_zooms:
+            tiles = {lat_lng_to_tile(lat, lng, z) for lat, lng in points}
+            for x, y in tiles:
+                if not os.path.exists(self.tile_path(version_key, z, x, y)):
+                    self._render_tile(z, x, y)
+                    built += 1
+
+        removed = self.prune_stale_versions(version_key)
+        elapsed = time.perf_counter() - started
+        print(f"Tile cache {version_key}: built {built} tiles, removed {removed} stale versions in {elapsed:.2f}s")
+        return {'version': version_key, 'built': built, 'removed_versions': removed}
+
+    def run_builder(self):
+        """Make this process the builder: prebuild hot tiles now and whenever the store version changes
+        (blocks; run it in a thread)"""
+        self.builder = True
+        while True:
+            try:
+                if self.spatial_index.get_version_key() != self._built_version:
+                    self.build_in_background()
+            except Exception as e:
+                print(f"Error checking tile cache version: {e}")
+            time.sleep(self.check_seconds)
+
+    def build_in_background(self) -> bool:
+        """Start a background hot-tile build unless one is running (it rebuilds if the version moved on);
+        only the builder process builds"""
+        if not self.builder:
+            return False
+        with self._build_lock:
+            if self._build_thread is not None and self._build_thread.is_alive():
+                return False
+            self._build_thread = threading.Thread(target=self._safe_build, name='tile-cache-build', daemon=True)
+            self._build_thread.start()
+            return True
+
+    def _safe_build(self):
+        # A version that appears while a build runs is built right after it
+        while True:
+            try:
+                version_key = self.build_hot_tiles()['version']
+            except Exception as e:
+                print(f"Error building tile cache: {e}")
+                return
+            if self.spatial_index.get_version_key() == version_key:
+                return
+
+    def prune_stale_versions(self, current_key: str) -> int:
+        """Delete tile directories older than both the current and the previous version
+
+        The previous version stays, since workers whose index has not caught up yet still serve it.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+
+        older = sorted((entry for entry in os.listdir(self.cache_dir) if entry != current_key),
+                       key=lambda entry: os.path.getmtime(os.path.join(self.cache_dir, entry)), reverse=True)
+        for entry in older[1:]:
+            shutil.rmtree(os.path.join(self.cache_dir, entry), ignore_errors=True)
+        return len(older[1:])
@@ -1,14 +1,18 @@
-import requests
 import os
-import re
-from typing import List, Dict, Optional
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
-import time
+from typing import List, Dict, Optional, Tuple
 from .nlp_summary_service import NLPSummaryService
+from .cache_service import create_cache
+from .shop import Shop
+from .ranking_service import RankingService
+from .opening_hours import format_day, local_now, parse_yelp_hours
+from .quota_service import QuotaExceeded, YelpQuotaManager
+from .filter_policy import FILTER_RULES, FilterPolicy, FilterPolicyStore
+from .resilience import CircuitBreaker, CircuitOpen, Hedger, UpstreamUnavailable, mark_degraded, remaining
+from .query_log_service import stage
 
 class YelpCoffeeShopService:
-    def __init__(self):
+    def __init__(self, nlp_service: NLPSummaryService = None, ranking_service: RankingService = None,
+                 quota: YelpQuotaManager = None, local_store=None):
         """Initialize Yelp service with API key"""
         self.api_key = os.getenv('YELP_API_KEY')
         self.base_url = "https://api.yelp.com/v3"
@@ -16,31 +20,45 @@ class YelpCoffeeShopService:
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json'
         }
-        # Initialize NLP summary service
-        self.nlp_service = NLPSummaryService()
+        # Initialize NLP summary service (the app passes its shared instance)
+        self.nlp_service = nlp_service or NLPSummaryService()
+        self.ranking_service = ranking_service or self.nlp_service.ranking_service
+        self._geolocator = None
         
-        # Improved filtering criteria based on analysis
-        self.filtering_config = {
-            'primary_categories': ['coffee', 'coffeeroasteries', 'cafes'],
-            'excluded_categories': ['restaurants', 'bakeries', 'breakfast_brunch', 'sandwiches', 'pizza', 'burgers', 'food'],
-            'name_keywords': ['coffee', 'cafe', 'brew', 'drip', 'roast', 'espresso', 'latte', 'speciality', 'specialty'],
-            'min_review_count': 80,  # Updated to 80 reviews minimum
-            'min_rating': 4.2,  # Based on target shops analysis
-            'price_range': ['$', '$$', '$$$'],  # Exclude $$$$ (too expensive)
-            'business_name_patterns': [
-                r'\bcoffee\b',
-                r'\bcafe\b',
-                r'\bbrew\b',
-                r'\bdrip\b',
-                r'\broast\b',
-                r'\bespresso\b',
-                r'\blatte\b',
-                r'\bspeciality\b',
-                r'\bspecialty\b'
-            ]
+        # Daily Yelp budget shared with the warmer, crawler and refresh jobs (all processes)
+        self.quota = quota or YelpQuotaManager()
+        # Stored shops (CoffeeShopDatabaseService) answer interactive searches when Yelp can't
+        self.local_store = local_store
+        
+        # Interactive calls wait up to a hedge budget, then serve local/cached data while the
+        # upstream call finishes in the background and refreshes the cache
+        self.resilience_config = {
+            'yelp_hedge_seconds': float(os.getenv('YELP_HEDGE_SECONDS', 2.0)),
+            'geocode_hedge_seconds': float(os.getenv('GEOCODE_HEDGE_SECONDS', 1.5)),
+            'upstream_timeout_seconds': float(os.getenv('UPSTREAM_TIMEOUT_SECONDS', 10))
         }
+        self.yelp_breaker = CircuitBreaker('yelp', slow_call_seconds=3.0, ignored=(QuotaExceeded,))
+        self.geocode_breaker = CircuitBreaker('nominatim', slow_call_seconds=2.0)
+        self.hedger = Hedger()
+        
+        # Geocoded coordinates per normalized location query
+        self.geocode_cache = create_cache('geocode', max_entries=int(os.getenv('GEOCODE_CACHE_MAX_ENTRIES', 2000)),
+                                          ttl_seconds=float(os.getenv('GEOCODE_CACHE_TTL', 7 * 86400)))
+        
+        # Raw Yelp candidates per search center (its widest search), plus narrower searches a
+        # truncated wider one cannot answer under (center, radius) keys; see search_cache_entry
+        self.search_cache = create_cache('yelp', max_entries=int(os.getenv('YELP_CACHE_MAX_ENTRIES', 500)),
+                                         ttl_seconds=float(os.getenv('YELP_CACHE_TTL', 3600)))
+        
+        # Filtering criteria from the versioned policy file, reloaded when it changes
+        self.filter_policy = FilterPolicyStore()
+    
+    @property
+    def filtering_config(self) -> Dict:
+        """Criteria of the active filter policy"""
+        return self.filter_policy.current().config
     
-    def get_coffee_shops_by_zip(self, zip_code: str, radius_miles: int = 5) -> List[Dict]:
+    def get_coffee_shops_by_zip(self, zip_code: str, radius_miles: int = 5) -> List[Shop]:
         """Get coffee shops near a zip code using Yelp API with improved filtering"""
         if not self.api_key:
             return self._get_fallback_data(zip_code)
@@ -52,37 +70,13 @@ class YelpCoffeeShopService:
                 return []
             
             lat, lng = coords
-            
-            # Search for coffee shops with improved criteria
-            url = f"{self.base_url}/businesses/search"
-            params = {
-                'latitude': lat,
-                'longitude': lng,
-                'radius': radius_miles * 1609,  # Convert miles to meters
-                'categories': ','.join(self.filtering_config['primary_categories']),
-                'term': 'coffee',
-                'limit': 50,  # Increased limit to get more candidates for filtering
-                'sort_by': 'rating'  # Sort by rating to prioritize better shops
-            }
-            
-            response = requests.get(url, headers=self.headers, params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            businesses = data.get('businesses', [])
-            
-            
-            
-            # Apply improved filtering
-            filtered_businesses = self._apply_improved_filtering(businesses, lat, lng, radius_miles)
-            
-            return self._format_yelp_results(filtered_businesses)
+            return self.get_coffee_shops_by_location(lat, lng, radius_miles)
             
         except Exception as e:
             print(f"Error fetching from Yelp API: {e}")
             return self._get_fallback_data(zip_code)
     
-    def get_coffee_shops_by_location_query(self, location_query: str, radius_miles: int = 5) -> List[Dict]:
+    def get_coffee_shops_by_location_query(self, location_query: str, radius_miles: int = 5) -> List[Shop]:
         """Get coffee shops near a location (zip code or place name) using Yelp API with improved filtering"""
         if not self.api_key:
             return self._get_fallback_data(location_query)
@@ -101,228 +95,339 @@ class YelpCoffeeShopService:
             print(f"Error fetching from Yelp API: {e}")
             return self._get_fallback_data(location_query)
     
-    def get_coffee_shops_by_location(self, lat: float, lng: float, radius_miles: int = 5) -> List[Dict]:
+    def get_coffee_shops_by_location(self, lat: float, lng: float, radius_miles: int = 5) -> List[Shop]:
         """Get coffee shops near coordinates using Yelp API with improved filtering"""
+        return self.get_coffee_shops_for_areas(lat, lng, radius_miles, [(lat, lng, radius_miles)])[0]
+    
+    def get_coffee_shops_for_areas(self, search_lat: float, search_lng: float, search_radius_miles: float,
+                                   areas: List[Tuple[float, float, float]]) -> List[Optional[List[Shop]]]:
+        """Answer several (lat, lng, radius) areas inside one search circle with a single Yelp search
+
+        When the search was cut off at one page it can miss shops of the areas inside it; those
+        areas (all but the search's own) come back as None, for the caller to search on their own.
+        """
         if not self.api_key:
-            return self._get_fallback_data_by_coords(lat, lng)
+            return [self._get_fallback_data_by_coords(lat, lng) for lat, lng, _ in areas]
         
         try:
-            url = f"{self.base_url}/businesses/search"
-            params = {
-                'latitude': lat,
-                'longitude': lng,
-                'radius': radius_miles * 1609,
-                'categories': ','.join(self.filtering_config['primary_categories']),
-                'term': 'coffee',
-                'limit': 50,  # Increased limit to get more candidates for filtering
-                'sort_by': 'rating'  # Sort by rating to prioritize better shops
-            }
-            
-
-            response = requests.get(url, headers=self.headers, params=params)
-            response.raise_for_status()
+            businesses, complete = self._search_candidates(search_lat, search_lng, search_radius_miles)
+            search = (self.search_cache_key(search_lat, search_lng), search_radius_miles)
             
-            data = response.json()
-            businesses = data.get('businesses', [])
-            
-
-            
-            # Apply improved filtering
-            filtered_businesses = self._apply_improved_filtering(businesses, lat, lng, radius_miles)
-            
-            return self._format_yelp_results(filtered_businesses)
+            # Apply improved filtering around each area's own center
+            return [self._format_yelp_results(self._apply_improved_filtering(businesses, lat, lng, radius_miles))
+                    if complete or (self.search_cache_key(lat, lng), radius_miles) == search else None
+                    for lat, lng, radius_miles in areas]
             
+        except (QuotaExceeded, UpstreamUnavailable, CircuitOpen) as e:
+            print(f"{e}; serving stored shops")
         except Exception as e:
-            print(f"Error fetching from Yelp API: {e}")
-            return self._get_fallback_data_by_coords(lat, lng)
+            print(f"Error fetching from Yelp API: {e}; serving stored shops")
+        mark_degraded(self.yelp_breaker.name)
+        return [self._get_local_shops(lat, lng, radius_miles) for lat, lng, radius_miles in areas]
+    
+    def warm_location(self, lat: float, lng: float, radius_miles: int = 5) -> List[Shop]:
+        """Refetch a search ahead of cache expiry and precompute its summaries"""
+        businesses = self._search_businesses(lat, lng, radius_miles, refresh=True, priority='warmup')
+        ranked_businesses = self._apply_improved_filtering(businesses, lat, lng, radius_miles)
+        return self._format_yelp_results(ranked_businesses)
+    
+    def search_cache_key(self, lat: float, lng: float, radius_miles: float = None) -> tuple:
+        center = (round(lat, 4), round(lng, 4))
+        return center if radius_miles is None else center + (float(radius_miles),)
     
-    def _apply_improved_filtering(self, businesses: List[Dict], search_lat: float = None, search_lng: float = None, radius_miles: int = 5) -> List[Dict]:
-        """Apply improved filtering criteria to Yelp results"""
-        filtered_businesses = []
+    def search_cache_entry(self, lat: float, lng: float, radius_miles: float) -> Tuple[tuple, Optional[Dict]]:
+        """Cache key a search of radius_miles around a center is kept under, and the entry there (if any)
+
+        The center key holds the widest search of the center. A narrower search that a truncated
+        wider one cannot answer is kept under its own (center, radius) key, so it never replaces it.
+        """
+        key = self.search_cache_key(lat, lng)
+        cached = self.search_cache.get(key)
+        if cached and cached['radius_miles'] > radius_miles and not self._search_complete(cached):
+            key = self.search_cache_key(lat, lng, radius_miles)
+            cached = self.search_cache.get(key)
+        return key, cached
+    
+    def cached_search_covers(self, cached: Optional[Dict], radius_miles: float) -> bool:
+        """Whether a cached search answers a search of radius_miles around the same center
+
+        Yelp returns at most one page of matches, so a wider search only contains a narrower one
+        when it returned every match (its total); otherwise only the same radius is reused.
+        """
+        if not cached or cached['radius_miles'] < radius_miles:
+            return False
+        return cached['radius_miles'] == radius_miles or self._search_complete(cached)
+    
+    def _search_complete(self, search: Dict) -> bool:
+        # Entries cached without a total are treated as truncated
+        return search.get('total', float('inf')) <= len(search['businesses'])
+    
+    def _search_businesses(self, lat: float, lng: float, radius_miles: int, refresh: bool = False,
+                           priority: str = 'interactive') -> List[Dict]:
+        """Get raw Yelp candidates, reusing a cached search of the same center that covers radius_miles"""
+        return self._search_candidates(lat, lng, radius_miles, refresh, priority)[0]
+    
+    def _search_candidates(self, lat: float, lng: float, radius_miles: int, refresh: bool = False,
+                           priority: str = 'interactive') -> Tuple[List[Dict], bool]:
+        """Raw Yelp candidates and whether they are every match in the circle (not cut off at one page)
+
+        A narrower cached search served while Yelp is unavailable counts as complete, so areas
+        inside it are not refetched from an upstream that is failing anyway.
+        """
+        cache_key, cached = self.search_cache_entry(lat, lng, radius_miles)
+        covered = self.cached_search_covers(cached, radius_miles)
+        if covered and not refresh:
+            # The wider search contains this one; _apply_improved_filtering trims it by distance
+            return cached['businesses'], self._search_complete(cached)
+        if covered and refresh:
+            # Keep the cached containment radius when refreshing
+            radius_miles = cached['radius_miles']
         
-        for business in businesses:
-            # Skip if doesn't meet minimum thresholds
-            if business.get('review_count', 0) < self.filtering_config['min_review_count']:
-                continue
-                
-            if business.get('rating', 0) < self.filtering_config['min_rating']:
-                continue
-            
-            # Calculate distance from search center to business location
-            # This is more reliable than relying on Yelp's distance field
-            business_lat = business.get('coordinates', {}).get('latitude')
-            business_lng = business.get('coordinates', {}).get('longitude')
-            
-            if business_lat and business_lng and search_lat and search_lng:
-                # Calculate distance using Haversine formula
-                from math import radians, cos, sin, asin, sqrt
-                
-                # Convert to radians
-                lat1, lon1 = radians(search_lat), radians(search_lng)
-                lat2, lon2 = radians(business_lat), radians(business_lng)
-                
-                # Haversine formula
-                dlat = lat2 - lat1
-                dlon = lon2 - lon1
-                a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-                c = 2 * asin(sqrt(a))
-                distance_miles = 3956 * c  # Earth's radius in miles
-                
-                if distance_miles > radius_miles:
-                    continue
-            
-            # Skip if price is too expensive
-            price = business.get('price', '')
-            if price and price not in self.filtering_config['price_range']:
-                continue
-            
-            # Check categories - exclude unwanted categories
-            categories = business.get('categories', [])
-            category_aliases = [cat.get('alias', '') for cat in categories]
-            
-            # Skip if has excluded categories
-            has_excluded_category = any(cat in self.filtering_config['excluded_categories'] 
-                                      for cat in category_aliases)
-            if has_excluded_category:
-                continue
-            
-            # Check if has at least one primary category
-            has_primary_category = any(cat in self.filtering_config['primary_categories'] 
-                                     for cat in category_aliases)
-            if not has_primary_category:
-                continue
-            
-            # Name-based filtering - prioritize businesses with coffee-related keywords
-            business_name = business.get('name', '').lower()
-            has_coffee_keyword = any(keyword in business_name 
-                                   for keyword in self.filtering_config['name_keywords'])
-            
-            # If no coffee keywords in name, check if it's still a good match
-            if not has_coffee_keyword:
-                # Only include if it has strong coffee-related categories
-                strong_coffee_categories = ['coffeeroasteries', 'coffee']
-                has_strong_category = any(cat in strong_coffee_categories 
-                                        for cat in category_aliases)
-                if not has_strong_category:
-                    continue
-            
-            # Additional filtering: check for specific patterns in name
-            name_patterns = self.filtering_config['business_name_patterns']
-            has_name_pattern = any(re.search(pattern, business_name, re.IGNORECASE) 
-                                 for pattern in name_patterns)
-            
-            # If no name pattern but has good categories and rating, still include
-            if not has_name_pattern and not has_coffee_keyword:
-                # Only include if it has very high rating and good review count
-                if (business.get('rating', 0) < 4.5 or 
-                    business.get('review_count', 0) < 150):
-                    continue
-            
-            filtered_businesses.append(business)
+        def fetch():
+            data = self.fetch_search_page(lat, lng, radius_miles * 1609, priority=priority)  # Convert miles to meters
+            search = {'radius_miles': radius_miles, 'businesses': data.get('businesses', []),
+                      'total': data.get('total', len(data.get('businesses', [])))}
+            self.search_cache.set(cache_key, search)
+            return search['businesses'], self._search_complete(search)
         
-        # Sort by rating (highest first) and limit to top 20
-        filtered_businesses.sort(key=lambda x: (x.get('rating', 0), x.get('review_count', 0)), reverse=True)
-        return filtered_businesses[:20]
-    
-    def _location_to_coordinates(self, location_query: str) -> Optional[tuple]:
-        """Convert location query (zip code or place name) to latitude/longitude coordinates"""
         try:
-            geolocator = Nominatim(user_agent="coffee_shop_finder")
-            
-            # Try different geocoding strategies
-            location = None
-            
-            # First try as-is
-            location = geolocator.geocode(location_query)
-            
-            # If that fails and it looks like a zip code, try with USA
-            if not location and location_query.isdigit() and len(location_query) == 5:
-                location = geolocator.geocode(f"{location_query}, USA")
-            
-            # If still no result, try with common location suffixes
-            if not location:
-                for suffix in [", HI", ", Hawaii", ", USA"]:
-                    location = geolocator.geocode(f"{location_query}{suffix}")
-                    if location:
-                        break
-            
-            if location:
-                print(f"Geocoded '{location_query}' to: {location.latitude}, {location.longitude}")
-                return (location.latitude, location.longitude)
-            
-            print(f"Could not geocode location: {location_query}")
+            with stage('yelp_upstream'):
+                if priority != 'interactive':
+                    return self.yelp_breaker.call(fetch)
+                return self.hedger.call(self.yelp_breaker, ('search', cache_key, radius_miles), fetch,
+                                        self.resilience_config['yelp_hedge_seconds'])
+        except (QuotaExceeded, UpstreamUnavailable):
+            if priority == 'interactive':
+                # A narrower or truncated cached search of this center beats no Yelp results
+                cached = cached or self.search_cache.get(self.search_cache_key(lat, lng))
+                if cached:
+                    return cached['businesses'], True
+            raise
+    
+    def fetch_search_page(self, lat: float, lng: float, radius_meters: int, offset: int = 0, limit: int = 50,
+                          priority: str = 'interactive') -> Dict:
+        """Run one raw Yelp business search request and return the JSON payload"""
+        params = {
+            'latitude': lat,
+            'longitude': lng,
+            'radius': int(radius_meters),
+            'categories': ','.join(self.filtering_config['primary_categories']),
+            'term': 'coffee',
+            'limit': limit,  # Increased limit to get more candidates for filtering
+            'sort_by': 'rating'  # Sort by rating to prioritize better shops
+        }
+        if offset:
+            params['offset'] = offset
+        
+        response = self._get("/businesses/search", params=params, priority=priority)
+        response.raise_for_status()
+        return response.json()
+    
+    def _get(self, path: str, params: Dict = None, priority: str = 'interactive'):
+        """GET a Yelp API path within the shared quota (raises QuotaExceeded when over budget)
+
+        requests is imported on first use to keep startup fast.
+        """
+        import requests
+        self.quota.acquire(priority)
+        # Bounded by the request deadline when called on a request thread
+        timeout = remaining(self.resilience_config['upstream_timeout_seconds'])
+        response = requests.get(f"{self.base_url}{path}", headers=self.headers, params=params, timeout=timeout)
+        self.quota.observe(response.headers, response.status_code)
+        return response
+    
+    def fetch_business(self, business_id: str, priority: str = 'interactive') -> Optional[Dict]:
+        """Fetch one business's details from Yelp (None if it no longer exists)"""
+        response = self._get(f"/businesses/{business_id}", priority=priority)
+        if response.status_code == 404:
             return None
-            
-        except (GeocoderTimedOut, GeocoderUnavailable) as e:
+        response.raise_for_status()
+        return response.json()
+    
+    def fetch_reviews(self, business_id: str, priority: str = 'interactive') -> List[Dict]:
+        """Fetch the review excerpts Yelp exposes for a business"""
+        response = self._get(f"/businesses/{business_id}/reviews", priority=priority)
+        response.raise_for_status()
+        return response.json().get('reviews', [])
+    
+    def _apply_improved_filtering(self, businesses: List[Dict], search_lat: float = None, search_lng: float = None, radius_miles: int = 5) -> List[Tuple[float, Dict]]:
+        """Apply the active filter policy to raw Yelp results and rank the survivors as (score, business)"""
+        policy = self.filter_policy.current()
+        filtered_businesses = policy.apply(businesses, search_lat, search_lng, radius_miles)
+        
+        # Keep the best-scoring results; the scores travel with the shops to the top-shops stage
+        return self.ranking_service.top_k(filtered_businesses, policy.config['max_results'],
+                                          search_lat, search_lng)
+    
+    def dry_run_filter_policy(self, candidate: Optional[Dict] = None) -> Dict:
+        """Report what the active policy (and a candidate policy) keep and remove over the cached raw searches
+
+        Nothing is fetched from Yelp and the active policy is not changed.
+        """
+        policies = {'active': self.filter_policy.current()}
+        if candidate is not None:
+            policies['candidate'] = FilterPolicy.from_dict(candidate)
+        
+        searches = self.search_cache.items()
+        report = {'cached_searches': len(searches), 'changed_searches': 0}
+        for name, policy in policies.items():
+            report[name] = {'version': policy.version, 'candidates': 0, 'kept': 0,
+                            'removed_by': dict.fromkeys(FILTER_RULES, 0), 'fails': dict.fromkeys(FILTER_RULES, 0)}
+        
+        for (lat, lng, *_), search in searches:
+            kept_ids = {}
+            for name, policy in policies.items():
+                result = policy.report(search['businesses'], lat, lng, search['radius_miles'])
+                totals = report[name]
+                totals['candidates'] += result['candidates']
+                totals['kept'] += result['kept']
+                for rule in FILTER_RULES:
+                    totals['removed_by'][rule] += result['removed_by'][rule]
+                    totals['fails'][rule] += result['fails'][rule]
+                kept_ids[name] = {business.get('id') for business in
+                                  policy.apply(search['businesses'], lat, lng, search['radius_miles'])}
+            if len(set(map(frozenset, kept_ids.values()))) > 1:
+                report['changed_searches'] += 1
+        return report
+    
+    def _location_to_coordinates(self, location_query: str, refresh: bool = False) -> Optional[tuple]:
+        """Convert location query (zip code or place name) to latitude/longitude coordinates (cached)"""
+        cache_key = self.geocode_cache_key(location_query)
+        if not refresh:
+            coords = self.geocode_cache.get(cache_key)
+            if coords is not None:
+                return coords
+        
+        def fetch():
+            coords = self._geocode_location(location_query)
+            if coords is not None:
+                self.geocode_cache.set(cache_key, coords)
+            return coords
+        
+        try:
+            with stage('geocode_upstream'):
+                if refresh:
+                    return self.geocode_breaker.call(fetch)
+                return self.hedger.call(self.geocode_breaker, ('geocode', cache_key), fetch,
+                                        self.resilience_config['geocode_hedge_seconds'])
+        except (UpstreamUnavailable, CircuitOpen) as e:
+            print(f"{e}; locating '{location_query}' from stored shops")
+        except Exception as e:
             print(f"Geocoding error: {e}")
+        mark_degraded(self.geocode_breaker.name)
+        return self._local_coordinates(location_query)
+    
+    def _local_coordinates(self, location_query: str) -> Optional[tuple]:
+        """Center of the stored shops in a ZIP code or city (None without a local store or match)"""
+        if self.local_store is None:
             return None
+        return self.local_store.get_location_centroid(location_query)
+    
+    def geocode_cache_key(self, location_query: str) -> str:
+        return ' '.join(location_query.lower().split())
+    
+    def _geocode_location(self, location_query: str) -> Optional[tuple]:
+        """Geocode a location query with Nominatim, trying common suffixes (upstream errors propagate)"""
+        # geopy is imported on first geocode to keep startup fast
+        if self._geolocator is None:
+            from geopy.geocoders import Nominatim
+            self._geolocator = Nominatim(user_agent="coffee_shop_finder",
+                                         timeout=self.resilience_config['upstream_timeout_seconds'])
+        geolocator = self._geolocator
+        
+        # Try different geocoding strategies
+        location = None
+        
+        # First try as-is
+        location = geolocator.geocode(location_query)
+        
+        # If that fails and it looks like a zip code, try with USA
+        if not location and location_query.isdigit() and len(location_query) == 5:
+            location = geolocator.geocode(f"{location_query}, USA")
+        
+        # If still no result, try with common location suffixes
+        if not location:
+            for suffix in [", HI", ", Hawaii", ", USA"]:
+                location = geolocator.geocode(f"{location_query}{suffix}")
+                if location:
+                    break
+        
+        if location:
+            print(f"Geocoded '{location_query}' to: {location.latitude}, {location.longitude}")
+            return (location.latitude, location.longitude)
+        
+        print(f"Could not geocode location: {location_query}")
+        return None
     
     def _zip_to_coordinates(self, zip_code: str) -> Optional[tuple]:
         """Convert zip code to latitude/longitude coordinates (legacy method)"""
         return self._location_to_coordinates(zip_code)
     
-    def _format_yelp_results(self, businesses: List[Dict]) -> List[Dict]:
-        """Format Yelp API results to match our app's data structure"""
+    def _format_yelp_results(self, ranked_businesses: List[Tuple[float, Dict]]) -> List[Shop]:
+        """Format ranked Yelp API results to match our app's data structure"""
         formatted_shops = []
         
-        for business in businesses:
+        for score, business in ranked_businesses:
             # Get coordinates from location
             location = business.get('location', {})
             coordinates = business.get('coordinates', {})
             
-            # Generate NLP summary for the shop
-            nlp_summary = self.nlp_service.generate_shop_summary(business)
-            
-            shop = {
-                'id': business.get('id'),
-                'name': business.get('name'),
-                'address': f"{location.get('address1', '')}, {location.get('city', '')}, {location.get('state', '')} {location.get('zip_code', '')}".strip(),
-                'city': location.get('city', ''),
-                'state': location.get('state', ''),
-                'zip_code': location.get('zip_code', ''),
-                'lat': coordinates.get('latitude'),
-                'lng': coordinates.get('longitude'),
-                'rating': business.get('rating', 0.0),
-                'description': business.get('categories', [{}])[0].get('title', 'Coffee Shop'),
-                'phone': business.get('phone', ''),
-                'hours': self._format_hours(business.get('hours', [])),
-                'website': business.get('website_url', ''),  # Business's own website
-                'yelp_url': business.get('url', ''),  # Yelp page URL
-                'nlp_summary': nlp_summary,
-                'review_count': business.get('review_count', 0),
-                'price': business.get('price', ''),
-                'image_url': business.get('image_url', '')
-            }
+            # Derive facet tags once and let the summary reuse their name flags
+            tags = self.nlp_service.derive_tags(business)
+            nlp_summary = self.nlp_service.generate_shop_summary(dict(business, tags=tags))
+            
+            shop = Shop(
+                id=business.get('id'),
+                name=business.get('name'),
+                address=f"{location.get('address1', '')}, {location.get('city', '')}, {location.get('state', '')} {location.get('zip_code', '')}".strip(),
+                city=location.get('city', ''),
+                state=location.get('state', ''),
+                zip_code=location.get('zip_code', ''),
+                lat=coordinates.get('latitude'),
+                lng=coordinates.get('longitude'),
+                rating=business.get('rating', 0.0),
+                description=business.get('categories', [{}])[0].get('title', 'Coffee Shop'),
+                phone=business.get('phone', ''),
+                hours=self._format_hours(business.get('hours', []), coordinates.get('latitude'),
+                                         coordinates.get('longitude')),
+                website=business.get('website_url', ''),  # Business's own website
+                yelp_url=business.get('url', ''),  # Yelp page URL
+                nlp_summary=nlp_summary,
+                review_count=business.get('review_count', 0),
+                price=business.get('price', ''),
+                image_url=business.get('image_url', ''),
+                tags=tuple(tags),
+                score=round(score, 4)
+            )
             
             formatted_shops.append(shop)
         
         return formatted_shops
     
-    def _format_hours(self, hours_data: List[Dict]) -> str:
-        """Format business hours from Yelp data"""
-        if not hours_data:
-            return "Hours not available"
-        
-        # Get today's hours
-        import datetime
-        today = datetime.datetime.now().weekday()
-        
-        for day in hours_data:
-            if day.get('day') == today:
-                start = day.get('start', '')
-                end = day.get('end', '')
-                if start and end:
-                    return f"{start[:2]}:{start[2:]} - {end[:2]}:{end[2:]}"
-        
-        return "Hours not available"
+    def _format_hours(self, hours_data: List[Dict], lat: float = None, lng: float = None) -> str:
+        """Format today's business hours from Yelp data (today where the shop is)"""
+        today_hours = format_day(parse_yelp_hours(hours_data), local_now(lat, lng).weekday())
+        return today_hours or "Hours not available"
+    
+    def _get_local_shops(self, lat: float, lng: float, radius_miles: int = 5) -> List[Shop]:
+        """Best stored shops near coordinates, ranked like Yelp results (empty without a local store)"""
+        if self.local_store is None:
+            return self._get_fallback_data_by_coords(lat, lng)
+        return self.rank_stored_shops(self.local_store.get_shops_near_location(lat, lng, radius_miles), lat, lng)
+    
+    def rank_stored_shops(self, nearby_shops: List[Shop], lat: float, lng: float) -> List[Shop]:
+        """Apply the search's rating floor and ranking to stored shops near a point"""
+        shops = [shop for shop in nearby_shops if (shop.get('rating') or 0) >= self.filtering_config['min_rating']]
+        ranked = self.ranking_service.top_k(shops, self.filtering_config['max_results'], lat, lng)
+        return [shop.replace(score=round(score, 4)) for score, shop in ranked]
     
-    def _get_fallback_data(self, zip_code: str) -> List[Dict]:
+    def _get_fallback_data(self, zip_code: str) -> List[Shop]:
         """Fallback data when Yelp API is not available"""
         # This would be replaced with a local database or other API
         print(f"Yelp API not configured. Using fallback data for zip code: {zip_code}")
         return []
     
-    def _get_fallback_data_by_coords(self, lat: float, lng: float) -> List[Dict]:
+    def _get_fallback_data_by_coords(self, lat: float, lng: float) -> List[Shop]:
         """Fallback data when Yelp API is not available"""
         print(f"Yelp API not configured. Using fallback data for coordinates: {lat}, {lng}")
         return [] 
\ No newline at end of file
@@ -0,0 +1,104 @@
+import random
+import threading
+from typing import List, Dict, Optional, Tuple
+
+from .geo_utils import haversine_miles
+
+class StubYelpSearch:
+    def __init__(self, bbox: Tuple[float, float, float, float] = (18.9, -160.3, 22.3, -154.8),
+                 business_count: int = 2000, seed: int = 42, max_results: int = 240):
+        """Offline stand-in for the Yelp search endpoint with deterministic synthetic businesses"""
+        self.max_results = max_results  # Yelp only pages through the first 240 matches
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self.businesses = self._generate_businesses(bbox, business_count, seed)
+        self.businesses_by_id = {business['id']: business for business in self.businesses}
+
+    def _generate_businesses(self, bbox, business_count: int, seed: int) -> List[Dict]:
+        """Generate businesses clustered around a few town centers, like real coffee shops"""
+        rng = random.Random(seed)
+        south, west, north, east = bbox
+        towns = [(rng.uniform(south, north), rng.uniform(west, east)) for _ in range(max(business_count // 150, 1))]
+        names = ['Coffee', 'Cafe', 'Roasters', 'Espresso Bar', 'Brew House', 'Coffee Co']
+
+        businesses = []
+        for i in range(business_count):
+            town_lat, town_lng = towns[i % len(towns)]
+            lat = min(max(rng.gauss(town_lat, 0.03), south), north)
+            lng = min(max(rng.gauss(town_lng, 0.03), west), east)
+            businesses.append({
+                'id': f"stub-{seed}-{i}",
+                'name': f"Stub {rng.choice(names)} {i}",
+                'rating': rng.choice([3.5, 4.0, 4.5, 5.0]),
+                'review_count': rng.randint(5, 900),
+                'price': rng.choice(['$', '$$', '$$$']),
+                'phone': f"+1808555{i:04d}",
+                'url': f"https://www.yelp.com/biz/stub-{i}",
+                'image_url': '',
+                'categories': [{'alias': 'coffee', 'title': 'Coffee & Tea'}],
+                'coordinates': {'latitude': lat, 'longitude': lng},
+                'location': {'address1': f"{i} Stub St", 'city': f"Town {i % len(towns)}",
+                             'state': 'HI', 'zip_code': f"96{i % 1000:03d}"}
+            })
+        return businesses
+
+    def fetch_search_page(self, lat: float, lng: float, radius_meters: int, offset: int = 0, limit: int = 50,
+                          priority: str = 'interactive') -> Dict:
+        """Same signature and payload shape as YelpCoffeeShopService.fetch_search_page"""
+        with self._lock:
+            self.request_count += 1
+
+        radius_miles = radius_meters / 1609.0
+        matches = []
+        for business in self.businesses:
+            coordinates = business['coordinates']
+            distance = haversine_miles(lat, lng, coordinates['latitude'], coordinates['longitude'])
+            if distance <= radius_miles:
+                matches.append((business['rating'], business['review_count'], business))
+        matches.sort(key=lambda match: (match[0], match[1]), reverse=True)
+
+        visible = [match[2] for match in matches[:self.max_results]]
+        return {'total': len(matches), 'businesses': visible[offset:offset + limit]}
+
+    def fetch_business(self, business_id: str, priority: str = 'interactive') -> Optional[Dict]:
+        """Same signature as YelpCoffeeShopService.fetch_business"""
+        with self._lock:
+            self.request_count += 1
+        business = self.businesses_by_id.get(business_id)
+        if business is None:
+            return None
+        return dict(business, hours=self._business_hours(business_id))
+
+    def _business_hours(self, business_id: str) -> List[Dict]:
+        """Deterministic Yelp-shaped weekly hours; some shops close Sundays or stay open late"""
+        rng = random.Random(business_id)
+        opens, closes = rng.choice([(600, 1700), (630, 1400), (700, 1800), (800, 2300), (1800, 200)])
+        days = range(6) if rng.random() < 0.2 else range(7)
+        return [{'open': [{'day': day, 'start': f"{opens:04d}", 'end': f"{closes:04d}",
+                           'is_overnight': closes < opens} for day in days],
+                 'hours_type': 'REGULAR', 'is_open_now': False}]
+
+    def fetch_reviews(self, business_id: str, priority: str = 'interactive') -> List[Dict]:
+        """Same signature as YelpCoffeeShopService.fetch_reviews; three deterministic reviews"""
+        with self._lock:
+            self.request_count += 1
+        if business_id not in self.businesses_by_id:
+            return []
+        rng = random.Random(business_id)
+        phrases = ['Amazing latte', 'friendly baristas', 'cozy corner', 'worth the wait',
+                   'best pour-over', 'helpful staff', 'reasonable prices', 'delicious pastries']
+        return [{
+            'id': f"{business_id}-review-{i}",
+            'rating': rng.randint(3, 5),
+            'text': f"{rng.choice(phrases)}, {rng.choice(phrases)}.",
+            'time_created': f"2026-0{i + 1}-15 08:00:00",
+            'user': {'name': f"Reviewer {i}"}
+        } for i in range(3)]
+
+    def simulate_changes(self, fraction: float = 0.1, seed: int = 0) -> int:
+        """Bump the review counts of a random fraction of businesses, as if reviews arrived"""
+        rng = random.Random(seed)
+        changed = rng.sample(self.businesses, int(len(self.businesses) * fraction))
+        for business in changed:
+            business['review_count'] += rng.randint(1, 20)
+        return len(changed)
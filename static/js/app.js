@@ -1,12 +1,20 @@
 // Global variables
 let map;
-let markers = [];
+let markersById = new Map();
 let coffeeShops = [];
 let selectedShop = null;
 
+// Immutable copy of the last server response; local filters are applied to it
+let lastResult = null;
+let pendingStream = null;
+let searchDebounceTimer = null;
+const SEARCH_DEBOUNCE_MS = 500;
+const MIN_QUERY_LENGTH = 3;
+
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function() {
     initializeMap();
+    initializeSearchControls();
     loadCoffeeShops();
 });
 
@@ -30,46 +38,177 @@ function initializeMap() {
         .openPopup();
 }
 
-// Load coffee shops data
-async function loadCoffeeShops() {
-    try {
-        const zipCode = document.getElementById('zipCode').value;
-        const radius = document.getElementById('searchRadius').value;
-        console.log('Loading coffee shops for zip code:', zipCode, 'with radius:', radius, 'miles');
-        
-        let url = `/api/coffee-shops`;
-        const params = new URLSearchParams();
-        
-        if (zipCode && zipCode.trim() !== '') {
-            params.append('zip_code', zipCode);
+// Wire up debounced typing, Enter-to-search and the radius dropdown
+function initializeSearchControls() {
+    const input = document.getElementById('zipCode');
+    input.addEventListener('input', () => {
+        clearTimeout(searchDebounceTimer);
+        if (input.value.trim().length < MIN_QUERY_LENGTH) {
+            return;
         }
-        if (radius) {
-            params.append('radius', radius);
+        searchDebounceTimer = setTimeout(loadCoffeeShops, SEARCH_DEBOUNCE_MS);
+    });
+    input.addEventListener('keydown', (event) => {
+        if (event.key === 'Enter') {
+            searchCoffeeShops();
         }
+    });
+    
+    document.getElementById('searchRadius').addEventListener('change', onRadiusChange);
+}
+
+// Load coffee shops data, rendering each stage of the streamed search as it arrives
+function loadCoffeeShops() {
+    clearTimeout(searchDebounceTimer);
+    
+    // Close any in-flight search; only the latest query's events are rendered
+    if (pendingStream) {
+        pendingStream.close();
+    }
+    
+    const zipCode = document.getElementById('zipCode').value.trim();
+    const radius = parseInt(document.getElementById('searchRadius').value, 10);
+    console.log('Loading coffee shops for zip code:', zipCode, 'with radius:', radius, 'miles');
+    
+    const params = new URLSearchParams();
+    if (zipCode !== '') {
+        params.append('zip_code', zipCode);
+    }
+    if (radius) {
+        params.append('radius', radius);
+    }
+    
+    const source = new EventSource(`/api/coffee-shops/stream?${params.toString()}`);
+    pendingStream = source;
+    
+    // Built up across events; each stage publishes a new frozen snapshot as lastResult
+    const result = { query: zipCode, radius: radius, lat: null, lng: null, shops: [], topShops: [] };
+    let centered = false;
+    
+    const publish = () => {
+        lastResult = Object.freeze({
+            ...result,
+            shops: Object.freeze(result.shops.map(shop => Object.freeze(shop))),
+            topShops: Object.freeze([...result.topShops])
+        });
+        applyLocalFilters();
         
-        if (params.toString()) {
-            url += `?${params.toString()}`;
+        // Fit the map once, to the first stage that has markers
+        if (!centered && coffeeShops.length > 0) {
+            centerMapOnResults(result.lat, result.lng);
+            centered = true;
         }
-        
-        const response = await fetch(url);
-        const data = await response.json();
-        
-        console.log('API response:', data);
-        console.log('Coffee shops found:', data.coffee_shops ? data.coffee_shops.length : 0);
-        console.log('Top shops:', data.top_shops ? data.top_shops.length : 0);
-        
-        coffeeShops = data.coffee_shops || [];
-        
-        displayTopShops(data.top_shops || []);
-        displayAllShopsSection(data.all_shops_count || 0);
-        addMarkersToMap();
-        
-        // Center map on the search results using API coordinates
-        centerMapOnResults(data.lat, data.lng);
-        
-    } catch (error) {
-        console.error('Error loading coffee shops:', error);
+    };
+    const finish = () => {
+        source.close();
+        if (pendingStream === source) {
+            pendingStream = null;
+        }
+    };
+    
+    source.addEventListener('center', (event) => {
+        const data = JSON.parse(event.data);
+        result.lat = data.lat;
+        result.lng = data.lng;
+    });
+    
+    // Stored shops arrive first; the upstream results replace them
+    source.addEventListener('local', (event) => {
+        result.shops = JSON.parse(event.data).coffee_shops || [];
+        publish();
+    });
+    source.addEventListener('shops', (event) => {
+        result.shops = JSON.parse(event.data).coffee_shops || [];
+        console.log('Coffee shops found:', result.shops.length);
+        publish();
+    });
+    
+    source.addEventListener('summary', (event) => {
+        result.topShops = [...result.topShops, JSON.parse(event.data).shop];
+        publish();
+    });
+    
+    source.addEventListener('done', (event) => {
+        const data = JSON.parse(event.data);
+        console.log('Search complete:', data);
+        finish();
+        if (data.error) {
+            showError(data.error);
+        }
+        if (!centered) {
+            centerMapOnResults(result.lat, result.lng);
+        }
+    });
+    
+    // EventSource reconnects by default, which would rerun the whole search
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED || pendingStream !== source) {
+            return;
+        }
+        finish();
+        console.error('Error streaming coffee shops');
         showError('Failed to load coffee shops data');
+    };
+}
+
+// Re-derive the visible shops from the last result without a server round-trip
+function applyLocalFilters() {
+    if (!lastResult) {
+        return;
+    }
+    
+    const showOnlyRated = document.getElementById('showOnlyRated').checked;
+    const radius = parseInt(document.getElementById('searchRadius').value, 10);
+    const shrinkRadius = radius < lastResult.radius && lastResult.lat != null && lastResult.lng != null;
+    
+    const filteredShops = lastResult.shops.filter(shop => {
+        if (showOnlyRated && shop.rating < 4.5) {
+            return false;
+        }
+        if (shrinkRadius && distanceMiles(lastResult.lat, lastResult.lng, shop.lat, shop.lng) > radius) {
+            return false;
+        }
+        return true;
+    });
+    
+    coffeeShops = filteredShops;
+    
+    // The server's top shops are reused when nothing was filtered out (and once their summaries arrive)
+    const topShops = filteredShops.length === lastResult.shops.length && lastResult.topShops.length > 0
+        ? lastResult.topShops
+        : rankTopShops(filteredShops, 3);
+    
+    displayTopShops(topShops);
+    displayAllShopsSection(filteredShops.length);
+    addMarkersToMap();
+}
+
+// Pick the top shops by the server's ranking score, as the server picks its top shops
+function rankTopShops(shops, count) {
+    return [...shops]
+        .sort((a, b) => (b.score || 0) - (a.score || 0))
+        .slice(0, count);
+}
+
+// Great-circle distance in miles (matches the server-side Haversine filter)
+function distanceMiles(lat1, lng1, lat2, lng2) {
+    const toRadians = (degrees) => degrees * Math.PI / 180;
+    const dLat = toRadians(lat2 - lat1);
+    const dLng = toRadians(lng2 - lng1);
+    const a = Math.sin(dLat / 2) ** 2 +
+        Math.cos(toRadians(lat1)) * Math.cos(toRadians(lat2)) * Math.sin(dLng / 2) ** 2;
+    return 3956 * 2 * Math.asin(Math.sqrt(a));
+}
+
+// Shrinking the radius around the same query is served from the last result
+function onRadiusChange() {
+    const radius = parseInt(document.getElementById('searchRadius').value, 10);
+    const query = document.getElementById('zipCode').value.trim();
+    
+    if (lastResult && lastResult.query === query && radius <= lastResult.radius) {
+        applyLocalFilters();
+    } else {
+        loadCoffeeShops();
     }
 }
 
@@ -186,13 +325,28 @@ function toggleAllShops() {
     }
 }
 
-// Add markers to the map
+// Stored shops carry their Yelp id separately; Yelp results use it as their id
+function shopKey(shop) {
+    return shop.yelp_id || shop.id;
+}
+
+// Add markers to the map, diffing by shop so unchanged markers are kept across streamed stages
 function addMarkersToMap() {
-    // Clear existing markers
-    markers.forEach(marker => map.removeLayer(marker));
-    markers = [];
+    const visibleIds = new Set(coffeeShops.map(shopKey));
+    
+    // Remove markers for shops that are no longer visible
+    markersById.forEach((marker, id) => {
+        if (!visibleIds.has(id)) {
+            map.removeLayer(marker);
+            markersById.delete(id);
+        }
+    });
     
-    coffeeShops.forEach((shop, index) => {
+    coffeeShops.forEach(shop => {
+        if (markersById.has(shopKey(shop))) {
+            return;
+        }
+        
         const marker = L.marker([shop.lat, shop.lng])
             .addTo(map)
             .bindPopup(`
@@ -206,7 +360,7 @@ function addMarkersToMap() {
                 </div>
             `);
         
-        markers.push(marker);
+        markersById.set(shopKey(shop), marker);
     });
 }
 
@@ -224,8 +378,8 @@ function centerMapOnResults(lat, lng) {
     }
     
     // If we have results, fit the map to show all markers
-    if (markers.length > 0) {
-        const group = new L.featureGroup(markers);
+    if (markersById.size > 0) {
+        const group = new L.featureGroup(Array.from(markersById.values()));
         map.fitBounds(group.getBounds().pad(0.1)); // Add 10% padding
     } else if (coffeeShops.length === 1) {
         // If only one result, center on it with zoom
@@ -248,9 +402,9 @@ function selectShop(shop) {
     map.setView([shop.lat, shop.lng], 15);
     
     // Open popup for the corresponding marker
-    const markerIndex = coffeeShops.findIndex(s => s.id === shop.id);
-    if (markerIndex !== -1 && markers[markerIndex]) {
-        markers[markerIndex].openPopup();
+    const marker = markersById.get(shopKey(shop));
+    if (marker) {
+        marker.openPopup();
     }
     
     selectedShop = shop;
@@ -311,19 +465,9 @@ function searchCoffeeShops() {
     loadCoffeeShops();
 }
 
-// Filter shops by rating
+// Filter shops by rating (applied locally to the last result)
 function filterShops() {
-    const showOnlyRated = document.getElementById('showOnlyRated').checked;
-    
-    if (showOnlyRated) {
-        const filteredShops = coffeeShops.filter(shop => shop.rating >= 4.5);
-        const topShopsData = { top_shops: filteredShops.slice(0, 3), all_shops_count: filteredShops.length };
-        displayTopShops(topShopsData.top_shops);
-        displayAllShopsSection(topShopsData.all_shops_count);
-    } else {
-        // Reload the original data
-        loadCoffeeShops();
-    }
+    applyLocalFilters();
 }
 
 // Open shop website or Yelp page
@@ -0,0 +1,28 @@
+import os
+import threading
+from concurrent.futures import Future
+
+from services.resilience import CircuitBreaker, Hedger
+
+class CompletedExecutor:
+    """Executor whose futures are already done when submit returns (an instant upstream)"""
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+def test_hedger_call_with_already_completed_future():
+    """A future that finishes before its done-callback is added must not deadlock Hedger.call"""
+    hedger = Hedger(max_workers=1)
+    hedger._executor, hedger._executor_pid = CompletedExecutor(), os.getpid()
+    breaker = CircuitBreaker('test')
+    results = []
+
+    caller = threading.Thread(target=lambda: results.append(hedger.call(breaker, 'key', lambda: 'answer', 1.0)),
+                              daemon=True)
+    caller.start()
+    caller.join(timeout=2.0)
+
+    assert not caller.is_alive(), "Hedger.call deadlocked on an already-completed future"
+    assert results == ['answer']
+    assert hedger._in_flight == {}
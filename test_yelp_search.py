@@ -2,6 +2,7 @@ import requests
 import os
 from dotenv import load_dotenv
 from geopy.geocoders import Nominatim
+from services.quota_service import YelpQuotaManager, QuotaExceeded
 
 load_dotenv()
 
@@ -9,6 +10,8 @@ def test_yelp_search():
     """Test Yelp search to debug why Downtown Coffee isn't showing up"""
     
     api_key = os.getenv('YELP_API_KEY')
+    # Debug searches draw from the app's shared daily budget at the lowest priority
+    quota = YelpQuotaManager()
     base_url = "https://api.yelp.com/v3"
     headers = {
         'Authorization': f'Bearer {api_key}',
@@ -86,7 +89,9 @@ def test_yelp_search():
             
             try:
                 url = f"{base_url}/businesses/search"
+                quota.acquire('crawl')
                 response = requests.get(url, headers=headers, params=strategy['params'])
+                quota.observe(response.headers, response.status_code)
                 response.raise_for_status()
                 
                 data = response.json()
@@ -112,8 +117,13 @@ def test_yelp_search():
                     
                     print()
                 
+            except QuotaExceeded as e:
+                print(f"Stopping: {e}")
+                break
             except Exception as e:
                 print(f"Error with {strategy['name']}: {e}")
+        
+        print(f"Yelp quota left: {quota.snapshot()['available']}")
     
     else:
         print("Could not geocode Fort Street Mall")